@@ -0,0 +1,127 @@
+# SPDX-FileCopyrightText: 2022 boBylliB
+# SPDX-License-Identifier: MIT
+
+# Host comparison of the BMP fonts with packed proportional fonts, run against the simulator in
+# tests/simulator.py.
+#
+# Usage: python3 benchmarks/font_render.py [--heights 10,20] [--repeat 20]
+#
+# Each BMP font in bitmapfonts/ is converted into a packed font with the same glyphs, trimmed to their
+# ink plus one column of spacing (the space is half a cell), using tools/packfont.py. A set of sample
+# messages is then laid out with both fonts, reporting:
+#   w       total pixel width of the messages on one line
+#   rows    total rows when word wrapped into the 64 pixel panel
+#   ms      host time per message for displayText: BMP font, packed font with an empty glyph cache,
+#           and packed font with a warm cache
+#   bytes   size of the packed font file
+# The times are host CPU time, so compare them with each other rather than with the panel.
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS, "..", "tests"))
+sys.path.insert(0, os.path.join(BENCHMARKS, "..", "tools"))
+
+import simulator
+import packfont
+
+MESSAGES = [
+    "The quick brown fox jumps over the lazy dog",
+    "Meeting room 3B is free until 14:30",
+    "Illinois will reopen lift line 11 at 9:15",
+    "WIFI: guest / password: matrixportal",
+    "Temperature 21C, humidity 40%, wind 12 km/h",
+]
+
+def bmpFontGlyphs(device, height):
+    bitmap, palette, width = device.getFontBitmap(height)
+    columns = bitmap.width // width
+    glyphs = {}
+    for tileIdx in range(columns * (bitmap.height // height)):
+        codepoint = device.FIRST_ASCII_VALUE + tileIdx
+        if tileIdx == device.SPACE_INDEX:
+            codepoint = ord(' ')
+        left = (tileIdx % columns) * width
+        top = (tileIdx // columns) * height
+        # Index 0 is the ink in the BMP fonts
+        rows = [[1 if bitmap[left + x, top + y] == 0 else 0 for x in range(width)] for y in range(height)]
+        inkColumns = [x for x in range(width) if any(row[x] for row in rows)]
+        if codepoint == ord(' ') or len(inkColumns) == 0:
+            glyphs[codepoint] = packfont.makeGlyph(max(width // 2, 1), 0, 0, 0, 0, [])
+            continue
+        first = inkColumns[0]
+        last = inkColumns[-1]
+        rows = [row[first:last + 1] for row in rows]
+        glyphs[codepoint] = packfont.makeGlyph(last - first + 2, last - first + 1, height, 0, 0, rows)
+    return glyphs
+
+def layout(device, zone, height, wordWrap):
+    # Total line length (pixels wide, or pixels tall when wrapped) and host time per message
+    total = 0
+    startTime = time.perf_counter()
+    for message in MESSAGES:
+        device.displayText(zone, [message], height, 5, 30, wordWrap, 0xFFFFFF)
+        total += zone['item']['lineLengths'][0]
+        zone['group'].pop()
+    return total, (time.perf_counter() - startTime) * 1000 / len(MESSAGES)
+
+def runHeight(height, args):
+    with tempfile.TemporaryDirectory() as workdir:
+        sim = simulator.Simulator(workdir)
+        try:
+            device = sim.boot()
+            packed, glyphCount = packfont.packFont(bmpFontGlyphs(device, height), height, 0, None)
+            zone = device.zones[0]
+
+            bmpWidth, bmpMs = layout(device, zone, height, False)
+            bmpRows = layout(device, zone, height, True)[0] // height
+            for _ in range(args.repeat - 1):
+                bmpMs = min(bmpMs, layout(device, zone, height, False)[1])
+
+            sim.writeFile("bitmapfonts/" + str(height) + ".pft", packed)
+            device.packedFonts.clear()
+            font = device.getPackedFont(height)
+            coldMs = None
+            for _ in range(args.repeat):
+                font['cache'].clear()
+                elapsed = layout(device, zone, height, False)[1]
+                coldMs = elapsed if coldMs is None else min(coldMs, elapsed)
+            packedWidth, warmMs = layout(device, zone, height, False)
+            for _ in range(args.repeat - 1):
+                warmMs = min(warmMs, layout(device, zone, height, False)[1])
+            packedRows = layout(device, zone, height, True)[0] // height
+            font['file'].close()
+
+            result = {}
+            result["height"] = height
+            result["bmpWidth"] = bmpWidth
+            result["packedWidth"] = packedWidth
+            result["bmpRows"] = bmpRows
+            result["packedRows"] = packedRows
+            result["bmpMs"] = bmpMs
+            result["coldMs"] = coldMs
+            result["warmMs"] = warmMs
+            result["packedBytes"] = len(packed)
+            return result
+        finally:
+            sim.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare BMP fonts with packed proportional fonts on the host.")
+    parser.add_argument("--heights", default="10,20", help="comma separated BMP font heights (default: 10,20)")
+    parser.add_argument("--repeat", type=int, default=20, help="layouts per measurement, the fastest is kept (default: 20)")
+    args = parser.parse_args()
+
+    print("%6s %7s %7s %8s %8s %8s %8s %8s %7s" % ("height", "bmp w", "pft w", "bmp rows", "pft rows", "bmp ms", "cold ms", "warm ms", "bytes"))
+    for height in [int(height) for height in args.heights.split(',')]:
+        result = runHeight(height, args)
+        print("%6d %7d %7d %8d %8d %8.3f %8.3f %8.3f %7d" % (height, result["bmpWidth"], result["packedWidth"], result["bmpRows"],
+              result["packedRows"], result["bmpMs"], result["coldMs"], result["warmMs"], result["packedBytes"]))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+# SPDX-FileCopyrightText: 2022 boBylliB
+# SPDX-License-Identifier: MIT
+
+# Host measurement of how long an MQTT enqueue command takes to reach the screen, run against the
+# simulator in tests/simulator.py and its in-process broker.
+#
+# Usage: python3 benchmarks/mqtt_latency.py [--messages 50] [--refresh 0.01] [--spi-rate 60000]
+#                                           [--spi-overhead 0.0005] [--seed 0]
+#
+# For every message a fresh panel boots with an empty queue and a blank screen. The enqueue command
+# arrives at a random point in the main loop period before an MQTT poll, and the main loop runs until
+# the message is in the queue and then until it is drawn. Every display refresh costs --refresh
+# seconds, the SPI link is capped as in server_clients.py, and the MQTT poll waits out its socket
+# timeout as minimqtt does.
+# Reports p50/p95/max milliseconds of simulated time to queue and to screen, and the main loop period.
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS, "..", "tests"))
+sys.path.insert(0, os.path.join(BENCHMARKS, "..", "tools"))
+
+import simulator
+from loadtest import percentile
+
+MESSAGE = "height=10\nscrolldelay=2\nscrollspeed=30\nwordwrap=off\ncolor=0x00FF00\nHello from MQTT\n"
+MAX_STEPS = 1000
+
+def runMessage(args, rng):
+    with tempfile.TemporaryDirectory() as workdir:
+        sim = simulator.Simulator(workdir, secrets={"mqtt_broker": "broker.local", "mqtt_name": "bench"},
+                                  spiBytesPerSecond=args.spi_rate, spiTransactionTime=args.spi_overhead)
+        try:
+            device = sim.boot()
+            sim.refreshTime = args.refresh
+            zone = device.zones[0]
+            # Let the boot message run out and the broker connection come up
+            for _ in range(MAX_STEPS):
+                if zone['item']['type'] == "blank" and device.mqttState['connected']:
+                    break
+                sim.clock.advance(1)
+                sim.step()
+
+            pollTimes = []
+            updateMqtt = device.updateMqtt
+
+            def timedUpdate():
+                pollTimes.append(sim.clock.monotonic())
+                updateMqtt()
+
+            device.updateMqtt = timedUpdate
+            sim.step(2)
+            period = pollTimes[-1] - pollTimes[-2]
+            # The broker holds the message until the next poll, wherever in the period it arrived
+            sim.broker.publish("matrixportal/bench/cmd/enqueue", json.dumps({"filename": "mqtt.msg", "text": MESSAGE}))
+            publishTime = pollTimes[-1] + period - rng.random() * period
+            queuedTime = None
+            for _ in range(MAX_STEPS):
+                sim.step()
+                if queuedTime is None and "mqtt.msg" in device.filenames:
+                    queuedTime = sim.clock.monotonic()
+                if zone['item']['type'] == "text":
+                    # The text is drawn by the refresh in the step that set it up
+                    break
+            else:
+                raise RuntimeError("The message never reached the screen")
+            return (queuedTime - publishTime) * 1000, (sim.clock.monotonic() - publishTime) * 1000, period * 1000
+        finally:
+            sim.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure MQTT enqueue to screen latency on the host.")
+    parser.add_argument("--messages", type=int, default=50, help="messages to time (default: 50)")
+    parser.add_argument("--refresh", type=float, default=0.01, help="seconds per display refresh (default: 0.01)")
+    parser.add_argument("--spi-rate", type=float, default=60000, help="SPI bytes per second (default: 60000)")
+    parser.add_argument("--spi-overhead", type=float, default=0.0005, help="seconds per SPI transaction (default: 0.0005)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for the publish times (default: 0)")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    queued = []
+    shown = []
+    periods = []
+    for _ in range(args.messages):
+        queuedMs, shownMs, periodMs = runMessage(args, rng)
+        queued.append(queuedMs)
+        shown.append(shownMs)
+        periods.append(periodMs)
+
+    print("%-10s %9s %9s %9s" % ("", "p50 ms", "p95 ms", "max ms"))
+    for name, values in (("queued", queued), ("on screen", shown), ("loop", periods)):
+        print("%-10s %9.1f %9.1f %9.1f" % (name, percentile(values, 0.50), percentile(values, 0.95), max(values)))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
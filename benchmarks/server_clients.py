@@ -0,0 +1,200 @@
+# SPDX-FileCopyrightText: 2022 boBylliB
+# SPDX-License-Identifier: MIT
+
+# Host benchmark of the web server with 1, 4 and 8 concurrent clients, run against the simulator in
+# tests/simulator.py instead of a real panel.
+#
+# Usage: python3 benchmarks/server_clients.py [--clients 1,4,8] [--seconds 20] [--spi-rate 60000]
+#                                             [--spi-overhead 0.0005] [--refresh 0.01] [--host-time]
+#                                             [--mix /=2,/queueUpdate=10,...] [--output server_clients.json]
+#
+# Each client keeps one connection and starts its next route as soon as the previous one is done,
+# picking routes with the same mix and requests as tools/loadtest.py: /edit is a POST of a Move Up for
+# a file that isn't queued, and /upload is the chunked upload of a small message (POST start, PUT chunk,
+# POST finish), timed from the first request to the last answer. The panel's SPI link to the ESP32 is
+# capped at --spi-rate bytes per second plus --spi-overhead seconds per transaction, and every display
+# refresh costs --refresh seconds. Time only moves by those amounts, so results are the same on every
+# run; --host-time adds this computer's own run time on top.
+#
+# Both the library's stock WSGIServer (one request per frame, connection closed after every response,
+# text bodies sent a character at a time) and the panel's KeepAliveWSGIServer are measured, reporting
+# routes per second, p50/p99 latency per route, the frame gaps seen by the display and the peak heap.
+# The heap is the panel's gc.mem_alloc(), which on the host is tracemalloc's count of Python allocations,
+# so compare it between runs rather than with a board. Every run is also written to --output as JSON,
+# in the same layout as tools/loadtest.py, including the per-route counters the panel keeps for /stats.
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import tracemalloc
+import zlib
+from urllib.parse import urlencode
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS, "..", "tests"))
+sys.path.insert(0, os.path.join(BENCHMARKS, "..", "tools"))
+
+import simulator
+from loadtest import DEFAULT_MIX, UPLOAD_TEXT, parseMix, percentile
+
+FORM_HEADERS = {"Content-Type": "application/x-www-form-urlencoded"}
+
+def routeRequests(route, clientIdx):
+    # Yields each request of a route as (method, path, body, headers) and is sent back its reply
+    if route == "/edit":
+        yield ("POST", "/edit", urlencode({"action": "Move+Up", "filename": "loadtest-missing.msg"}), FORM_HEADERS)
+    elif route == "/upload":
+        uploadName = "loadtest" + str(clientIdx) + ".msg"
+        status, headers, body = yield ("POST", "/upload/start", urlencode({"filename": uploadName, "size": len(UPLOAD_TEXT)}), FORM_HEADERS)
+        if status != 200:
+            return
+        offset = int(body)
+        if offset < len(UPLOAD_TEXT):
+            path = "/upload/chunk?filename=" + uploadName + "&offset=" + str(offset)
+            status, headers, body = yield ("PUT", path, UPLOAD_TEXT[offset:], {"Content-Type": "application/octet-stream"})
+            if status != 200:
+                return
+        yield ("POST", "/upload/finish", urlencode({"filename": uploadName, "checksum": zlib.adler32(UPLOAD_TEXT)}), FORM_HEADERS)
+    else:
+        yield ("GET", route, b"", None)
+
+class RouteClient:
+    # A HostClient working through one route at a time
+    def __init__(self, sim, clientIdx, routes, weights):
+        self.client = simulator.HostClient(sim)
+        self.clock = sim.clock
+        self.clientIdx = clientIdx
+        self.routes = routes
+        self.weights = weights
+        self.nextRoute()
+
+    def nextRoute(self):
+        self.route = random.choices(self.routes, self.weights)[0]
+        self.requests = routeRequests(self.route, self.clientIdx)
+        self.startTime = self.clock.monotonic()
+        self.failed = False
+        self.client.send(*next(self.requests))
+
+    def poll(self):
+        # Returns (route, milliseconds, failed) once a route is done, otherwise None
+        try:
+            reply = self.client.poll()
+        except ConnectionError:
+            reply = None
+            self.failed = True
+        if reply is None and not self.failed:
+            if self.client.connection is not None:
+                return None
+        else:
+            if reply is not None and reply[0] >= 400:
+                self.failed = True
+            if not self.failed:
+                try:
+                    self.client.send(*self.requests.send(reply))
+                    return None
+                except StopIteration:
+                    pass
+        done = (self.route, (self.clock.monotonic() - self.startTime) * 1000, self.failed)
+        self.nextRoute()
+        return done
+
+def runServer(serverName, clientCount, args, routes, weights):
+    with tempfile.TemporaryDirectory() as workdir:
+        clock = simulator.Clock(manual=not args.host_time)
+        sim = simulator.Simulator(workdir, clock=clock, spiBytesPerSecond=args.spi_rate, spiTransactionTime=args.spi_overhead)
+        try:
+            device = sim.boot()
+            sim.refreshTime = args.refresh
+            if serverName == "stock":
+                device.wsgiServer = device.server.WSGIServer(80, application=device.web_app)
+                with sim.output():
+                    device.wsgiServer.start()
+            random.seed(args.seed)
+            tracemalloc.start()
+            clients = [RouteClient(sim, idx, routes, weights) for idx in range(clientCount)]
+
+            latencies = {}
+            errors = {}
+            sim.step()
+            device.resetStats()
+            startTime = clock.monotonic()
+            while clock.monotonic() - startTime < args.seconds:
+                sim.step()
+                for client in clients:
+                    done = client.poll()
+                    if done is None:
+                        continue
+                    route, latency, failed = done
+                    if failed:
+                        errors[route] = errors.get(route, 0) + 1
+                    else:
+                        latencies.setdefault(route, []).append(latency)
+            elapsed = clock.monotonic() - startTime
+            tracemalloc.stop()
+
+            result = {}
+            result["server"] = serverName
+            result["clients"] = clientCount
+            result["duration"] = elapsed
+            result["requests"] = sum(len(values) for values in latencies.values())
+            result["errors"] = sum(errors.values())
+            result["throughput"] = result["requests"] / elapsed
+            result["routes"] = {}
+            for route in routes:
+                values = latencies.get(route, [])
+                result["routes"][route] = {
+                    "count": len(values),
+                    "errors": errors.get(route, 0),
+                    "p50Ms": percentile(values, 0.50),
+                    "p99Ms": percentile(values, 0.99),
+                    "maxMs": max(values) if values else None,
+                }
+            result["spiSeconds"] = sim.network.spiTime
+            # Frame gaps, peak heap and time spent per route, as the panel reports them on /stats
+            status, headers, body = sim.request("GET", "/stats")
+            result["device"] = json.loads(body)
+            return result
+        finally:
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+            sim.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the panel's web server with several clients on the host.")
+    parser.add_argument("--clients", default="1,4,8", help="comma separated client counts (default: 1,4,8)")
+    parser.add_argument("--seconds", type=float, default=20, help="simulated seconds per run (default: 20)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="route=weight list (default: " + DEFAULT_MIX + ")")
+    parser.add_argument("--spi-rate", type=float, default=60000, help="SPI bytes per second (default: 60000)")
+    parser.add_argument("--spi-overhead", type=float, default=0.0005, help="seconds per SPI transaction (default: 0.0005)")
+    parser.add_argument("--refresh", type=float, default=0.01, help="seconds per display refresh (default: 0.01)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for the request mix (default: 0)")
+    parser.add_argument("--host-time", action="store_true", help="also count this computer's run time")
+    parser.add_argument("--output", default="server_clients.json", help="JSON file to write (default: server_clients.json)")
+    args = parser.parse_args()
+
+    routes, weights = parseMix(args.mix)
+    results = []
+    for clientCount in [int(count) for count in args.clients.split(',')]:
+        for serverName in ("stock", "keepalive"):
+            result = runServer(serverName, clientCount, args, routes, weights)
+            results.append(result)
+            print("%s server, %d client(s): %.1f routes/s, %d errors, max frame gap %d ms, peak heap %d bytes" % (
+                  serverName, clientCount, result["throughput"], result["errors"], result["device"]["maxFrameGap"], result["device"]["peakHeap"]))
+            for route, routeResult in result["routes"].items():
+                if routeResult["count"] > 0:
+                    print("  %-20s p50 %7.1f ms  p99 %7.1f ms  (%d)" % (route, routeResult["p50Ms"], routeResult["p99Ms"], routeResult["count"]))
+
+    report = {}
+    report["settings"] = vars(args)
+    report["mix"] = dict(zip(routes, weights))
+    report["runs"] = results
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print("Wrote", args.output)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+# SPDX-FileCopyrightText: 2022 boBylliB
+# SPDX-License-Identifier: MIT
+
+# Host throughput report for the chunked upload protocol, run against the simulator in tests/simulator.py.
+#
+# Usage: python3 benchmarks/upload_throughput.py [--sizes 4096,32768,131072] [--loss 0,0.05,0.2]
+#                                                [--spi-rate 60000] [--spi-overhead 0.0005] [--refresh 0.01]
+#
+# Each file is sent the way web/scripts/main.js sends it (4 KB chunks, restarting from /upload/start
+# after any failed request) while the main loop keeps running, over an SPI link capped at --spi-rate
+# bytes per second plus --spi-overhead seconds per transaction. With --loss, that fraction of requests
+# never reach the panel and the same fraction of replies are lost on the way back.
+# Reports the effective upload rate in simulated time, the requests it took and the longest frame gap.
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS, "..", "tests"))
+
+import simulator
+
+def runUpload(size, lossRate, args):
+    with tempfile.TemporaryDirectory() as workdir:
+        sim = simulator.Simulator(workdir, spiBytesPerSecond=args.spi_rate, spiTransactionTime=args.spi_overhead)
+        try:
+            device = sim.boot()
+            sim.refreshTime = args.refresh
+            sim.fullLoop = True
+            rng = random.Random(args.seed)
+            data = bytes(rng.randrange(256) for _ in range(size))
+            requests = []
+            request = sim.request
+
+            def countedRequest(*requestArgs, **kwargs):
+                requests.append(requestArgs[1])
+                return request(*requestArgs, **kwargs)
+
+            sim.request = countedRequest
+            sim.step()
+            device.resetStats()
+            startTime = sim.clock.monotonic()
+            success = simulator.uploadFile(sim, "upload.bmp", data, rng=rng, lossRate=lossRate, maxRetries=100)
+            elapsed = sim.clock.monotonic() - startTime
+            if success and sim.readFile("uploads/upload.bmp") != data:
+                success = False
+
+            result = {}
+            result["size"] = size
+            result["loss"] = lossRate
+            result["success"] = success
+            result["seconds"] = elapsed
+            result["rate"] = size / elapsed
+            result["requests"] = len(requests)
+            result["maxFrameGap"] = device.stats['maxFrameGap']
+            return result
+        finally:
+            sim.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Report chunked upload throughput on the host.")
+    parser.add_argument("--sizes", default="4096,32768,131072", help="comma separated file sizes in bytes (default: 4096,32768,131072)")
+    parser.add_argument("--loss", default="0,0.05,0.2", help="comma separated loss rates (default: 0,0.05,0.2)")
+    parser.add_argument("--spi-rate", type=float, default=60000, help="SPI bytes per second (default: 60000)")
+    parser.add_argument("--spi-overhead", type=float, default=0.0005, help="seconds per SPI transaction (default: 0.0005)")
+    parser.add_argument("--refresh", type=float, default=0.01, help="seconds per display refresh (default: 0.01)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for the data and losses (default: 0)")
+    args = parser.parse_args()
+
+    print("%9s %6s %9s %9s %9s %9s %8s" % ("bytes", "loss", "seconds", "KB/s", "requests", "max gap", "result"))
+    for size in [int(size) for size in args.sizes.split(',')]:
+        for lossRate in [float(loss) for loss in args.loss.split(',')]:
+            result = runUpload(size, lossRate, args)
+            print("%9d %6.2f %9.2f %9.1f %9d %9d %8s" % (size, lossRate, result["seconds"], result["rate"] / 1024,
+                  result["requests"], result["maxFrameGap"], "ok" if result["success"] else "FAILED"))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
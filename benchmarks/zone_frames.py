@@ -0,0 +1,93 @@
+# SPDX-FileCopyrightText: 2022 boBylliB
+# SPDX-License-Identifier: MIT
+
+# Host benchmark of the main loop's per-frame cost against the number of zones, run against the
+# simulator in tests/simulator.py.
+#
+# Usage: python3 benchmarks/zone_frames.py [--zones 1,2,4,6] [--frames 600] [--effect none]
+#
+# The panel is split into equal horizontal strips, each with its own playlist of one scrolling .msg
+# (font height 5, optionally with a text --effect). Every main loop step advances the simulated clock
+# by one 60 Hz refresh. The time this computer spends in the whole step (which includes a fixed
+# gc.collect) and in the zone updates alone is measured. The numbers are host CPU time, far below the
+# board's own, so compare them across zone counts rather than with the panel.
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS, "..", "tests"))
+sys.path.insert(0, os.path.join(BENCHMARKS, "..", "tools"))
+
+import simulator
+from loadtest import percentile
+
+MESSAGE = "The quick brown fox jumps over the lazy dog"
+
+def runZones(zoneCount, args):
+    with tempfile.TemporaryDirectory() as workdir:
+        sim = simulator.Simulator(workdir)
+        try:
+            height = 32 // zoneCount
+            layout = ""
+            for idx in range(zoneCount):
+                playlist = "zones/zone" + str(idx) + ".txt"
+                sim.writeFile("zones/zone" + str(idx) + ".msg", "height=5\nscrolldelay=0\nscrollspeed=30\nwordwrap=off\n"
+                              "color=0xFFFFFF\neffect=" + args.effect + "\n" + MESSAGE + "\n")
+                sim.writeFile(playlist, "zones/zone" + str(idx) + ".msg\n")
+                layout += "name=zone" + str(idx) + ",x=0,y=" + str(idx * height) + ",width=64,height=" + str(height) + ",playlist=" + playlist + "\n"
+            # The website queue gets a zone of its own below the strips, left empty
+            layout += "name=main,x=0,y=32,width=64,height=1\n"
+            sim.writeFile("layout.txt", layout)
+            device = sim.boot()
+            sim.refreshTime = 1 / 60
+            sim.step(10)
+            if any(zone['item']['type'] != "text" for zone in device.zones[:zoneCount]):
+                raise RuntimeError("Not every zone is showing its message")
+
+            zoneTime = [0]
+            updateDisplayItem = device.updateDisplayItem
+
+            def timedUpdate(zone):
+                startTime = time.perf_counter()
+                updateDisplayItem(zone)
+                zoneTime[0] += time.perf_counter() - startTime
+
+            device.updateDisplayItem = timedUpdate
+            stepTimes = []
+            zoneTimes = []
+            for _ in range(args.frames):
+                zoneTime[0] = 0
+                startTime = time.perf_counter()
+                sim.step()
+                stepTimes.append((time.perf_counter() - startTime) * 1000)
+                zoneTimes.append(zoneTime[0] * 1000)
+
+            result = {}
+            result["zones"] = zoneCount
+            result["stepMs"] = sum(stepTimes) / len(stepTimes)
+            result["zoneMs"] = sum(zoneTimes) / len(zoneTimes)
+            result["zoneP95Ms"] = percentile(zoneTimes, 0.95)
+            return result
+        finally:
+            sim.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the main loop's per-frame cost against the number of zones.")
+    parser.add_argument("--zones", default="1,2,4,6", help="comma separated zone counts (default: 1,2,4,6)")
+    parser.add_argument("--frames", type=int, default=600, help="main loop steps per run (default: 600)")
+    parser.add_argument("--effect", default="none", help="text effect in every zone (default: none)")
+    args = parser.parse_args()
+
+    print("%6s %9s %9s %9s %12s" % ("zones", "step ms", "zones ms", "zones p95", "ms per zone"))
+    for zoneCount in [int(count) for count in args.zones.split(',')]:
+        result = runZones(zoneCount, args)
+        print("%6d %9.3f %9.3f %9.3f %12.3f" % (result["zones"], result["stepMs"], result["zoneMs"], result["zoneP95Ms"],
+              result["zoneMs"] / result["zones"]))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
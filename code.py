@@ -10,8 +10,11 @@ import board
 import gc
 import math
 import time
+import supervisor
 import busio
 import os
+import struct
+import json
 import displayio
 import framebufferio
 import rgbmatrix
@@ -19,10 +22,12 @@ import adafruit_display_text.label as label
 from adafruit_bitmap_font import bitmap_font
 import adafruit_imageload
 from digitalio import DigitalInOut
+from collections import OrderedDict
 from io import StringIO
 import adafruit_requests as requests
 import adafruit_esp32spi.adafruit_esp32spi_socket as socket
 import adafruit_esp32spi.adafruit_esp32spi_wsgiserver as server
+import adafruit_minimqtt.adafruit_minimqtt as MQTT
 from adafruit_esp32spi import adafruit_esp32spi
 from adafruit_wsgi.wsgi_app import WSGIApp
 
@@ -40,13 +45,61 @@ TEXT_URL = "http://wifitest.adafruit.com/testwifi/index.html"
 HOST_HTML = "web/index.html"
 HOST_JS = "web/scripts/main.js"
 FILENAMES = "filenames.txt"
+LAYOUT_FILE = "layout.txt"
+FEED_CACHE = "feeds/"
 
 MAXSIZE = 4096
 
+FEED_MAXSIZE = 4096
+FEED_CHUNK_SIZE = 256
+FEED_TIMEOUT = 2
+FEED_RETRY = 60
+FEED_MAX_RETRY = 900
+FEED_PLACEHOLDER = "..."
+
+FRAME_GAP_BUCKETS = [10, 20, 50, 100, 200, 500, 1000]
+
+DEFAULT_BIT_DEPTH = 4
+MIN_BIT_DEPTH = 1
+MAX_BIT_DEPTH = 6
+BIT_DEPTH_TOLERANCE = 3
+BIT_DEPTH_DWELL = 30
+
+MQTT_SOCKET_TIMEOUT = 0.05
+MQTT_POLL_INTERVAL = 0.25
+MQTT_PING_INTERVAL = 15
+MQTT_RETRY = 30
+MQTT_MAX_RETRY = 600
+MQTT_CLIENT_ID_MAX = 23
+MQTT_METRICS_INTERVAL = 60
+PARTIAL_SUFFIX = ".part"
+UPLOAD_EXTENSIONS = ["txt", "msg", "feed", "bmp"]
+UPLOAD_TIMEOUT = 600
+UPLOAD_CLEANUP_INTERVAL = 60
+ADLER_MOD = 65521
+ADLER_NMAX = 5552
+
+MAX_CLIENTS = 4
+KEEPALIVE_TIMEOUT = 5
+POLL_BUDGET = 0.05
+NO_SOCKET_AVAIL = 255
+
 BITMAP_FONTS = "bitmapfonts/"
 FIRST_ASCII_VALUE = ord('!')
 SPACE_INDEX = 32 * 3 - 1
 
+PACKED_FONT_EXTENSION = ".pft"
+PACKED_FONT_MAGIC = b"MPF1"
+PACKED_HEADER = "<4sBBHH"
+PACKED_HEADER_SIZE = 10
+PACKED_GLYPH = "<HBxI"
+PACKED_GLYPH_SIZE = 8
+GLYPH_CACHE_SIZE = 64
+
+EFFECT_SETTINGS = ["effect", "effectspeed", "effectcolor"]
+EFFECT_STEPS = 64
+TICKS_MASK = (1 << 29) - 1
+
 VERSION_FILE = "version.txt"
 VERSION_PREFIX = "<a class=\"Link--primary\" href=\"/boBylliB/MatrixPortalWIFIUpload/releases"
 GITHUB_URL = "https://api.github.com/repos/boBylliB/MatrixPortalWIFIUpload/releases"
@@ -111,27 +164,31 @@ def getTime():
     return time.monotonic_ns() / 1000000000
 
 # Initializing display
+def createMatrix(bitDepth):
+    return rgbmatrix.RGBMatrix(
+        width=64, bit_depth=bitDepth,
+        rgb_pins=[
+            board.MTX_R1,
+            board.MTX_G1,
+            board.MTX_B1,
+            board.MTX_R2,
+            board.MTX_G2,
+            board.MTX_B2
+        ],
+        addr_pins=[
+            board.MTX_ADDRA,
+            board.MTX_ADDRB,
+            board.MTX_ADDRC,
+            board.MTX_ADDRD
+        ],
+        clock_pin=board.MTX_CLK,
+        latch_pin=board.MTX_LAT,
+        output_enable_pin=board.MTX_OE
+    )
+
 displayio.release_displays()
-matrix = rgbmatrix.RGBMatrix(
-    width=64, bit_depth=4,
-    rgb_pins=[
-        board.MTX_R1,
-        board.MTX_G1,
-        board.MTX_B1,
-        board.MTX_R2,
-        board.MTX_G2,
-        board.MTX_B2
-    ],
-    addr_pins=[
-        board.MTX_ADDRA,
-        board.MTX_ADDRB,
-        board.MTX_ADDRC,
-        board.MTX_ADDRD
-    ],
-    clock_pin=board.MTX_CLK,
-    latch_pin=board.MTX_LAT,
-    output_enable_pin=board.MTX_OE
-)
+currentBitDepth = DEFAULT_BIT_DEPTH
+matrix = createMatrix(currentBitDepth)
 display = framebufferio.FramebufferDisplay(matrix, auto_refresh=False)
 
 # Relevant datastructures
@@ -142,13 +199,177 @@ editQueue = []
 editQueueChanged = False
 uploadQueue = []
 uploadQueueChanged = False
+activeUploads = {}
+orphanedPartials = {}
+nextPartialCleanup = 0
+fileChecksums = {}
+completedUploads = []
+completedUploadsChanged = False
 
 displayGroup = displayio.Group()
 display.show(displayGroup)
 
-currentDisplayItem = {}
-currentDisplayItem['type'] = "blank"
-currentDisplayItem['prevTime'] = getTime()
+zones = []
+packedFonts = {}
+feeds = {}
+mqttClient = None
+mqttState = {}
+profileState = {'lowerSince': None, 'nextSwitch': 0}
+stats = {}
+
+# Helper functions for layout
+# Every zone has its own Group inside displayGroup, its own playlist and its own display item state,
+# and all of them are advanced from the same main loop tick before the single display.refresh.
+
+def createZone(name, x, y, width, height, playlist, prefix):
+    zone = {}
+    zone['name'] = name
+    zone['width'] = width
+    zone['height'] = height
+    zone['playlist'] = playlist
+    zone['prefix'] = prefix
+    zone['group'] = displayio.Group(x=x, y=y)
+    zone['item'] = {}
+    zone['item']['type'] = "blank"
+    zone['item']['prevTime'] = getTime()
+    displayGroup.append(zone['group'])
+    zones.append(zone)
+    return zone
+
+def loadPlaylist(filename):
+    # Playlists are written by hand, so entries that don't exist or can't be shown are left out
+    playlist = []
+    try:
+        with open(filename, 'r') as file:
+            for line in file:
+                entry = line.strip()
+                if len(entry) < 1:
+                    continue
+                if entry.split('.')[-1] not in UPLOAD_EXTENSIONS:
+                    print("Skipping", entry, "in playlist", filename, "because it is not a text, feed or image file")
+                    continue
+                try:
+                    os.stat(entry)
+                except OSError:
+                    print("Skipping", entry, "in playlist", filename, "because it doesn't exist")
+                    continue
+                playlist.append(entry)
+    except OSError as e:
+        print("Failure loading playlist", filename, "due to: ", e)
+    return playlist
+
+def loadLayout():
+    # Each line of the layout file describes one zone, e.g.
+    # name=ticker,x=0,y=0,width=64,height=10,playlist=zones/ticker.txt
+    # A zone without a playlist shows the queue managed from the website
+    mainZone = None
+    try:
+        with open(LAYOUT_FILE, 'r') as file:
+            layout = file.readlines()
+    except OSError:
+        layout = []
+
+    for line in layout:
+        if len(line.strip()) < 1:
+            continue
+        settings = {}
+        try:
+            for setting in line.strip().split(','):
+                name, value = setting.split('=')
+                settings[name.strip()] = value.strip()
+            x = int(settings.get('x', 0))
+            y = int(settings.get('y', 0))
+            width = int(settings.get('width', 64))
+            height = int(settings.get('height', 32))
+            if width < 1 or height < 1:
+                raise ValueError("width and height must be at least 1")
+        except ValueError as e:
+            print("Skipping zone", settings.get('name', ""), "due to: ", e)
+            continue
+        if 'playlist' in settings:
+            createZone(settings.get('name', ""), x, y, width, height, loadPlaylist(settings['playlist']), "")
+        elif mainZone is None:
+            mainZone = createZone(settings.get('name', "main"), x, y, width, height, filenames, "uploads/")
+        else:
+            print("Skipping zone", settings.get('name', ""), "because it has no playlist and zone", mainZone['name'], "already shows the queue")
+
+    if mainZone is None:
+        mainZone = createZone("main", 0, 0, 64, 32, filenames, "uploads/")
+    return mainZone
+
+# Helper functions for display profiles
+# Every displayed item records the lowest bit depth that shows all of its colors to within
+# BIT_DEPTH_TOLERANCE per channel (plain white or red text needs only 1 bit, photos need more).
+# The framebuffer is RGB565 and the matrix shows the top N bits of each channel, so red and blue never
+# need more than 5 bits; with the tolerance of 3, only green levels can need all of MAX_BIT_DEPTH.
+# The matrix is rebuilt as soon as the deepest item on screen needs more bits, but only drops to fewer
+# bits once that has held for BIT_DEPTH_DWELL seconds, so alternating items don't rebuild it every time.
+
+def channelLevel(level, channelBits, bitDepth):
+    # A channel shown with N bits can only take the brightness levels 0 to 2^N - 1, spread over 0-255
+    shownBits = min(bitDepth, channelBits)
+    return ((level >> (channelBits - shownBits)) * 255) // ((1 << shownBits) - 1)
+
+def colorBitDepth(color):
+    bitDepth = MIN_BIT_DEPTH
+    for shift, channelBits in ((16, 5), (8, 6), (0, 5)):
+        level = ((color >> shift) & 0xFF) >> (8 - channelBits)
+        full = channelLevel(level, channelBits, channelBits)
+        while bitDepth < min(MAX_BIT_DEPTH, channelBits) and abs(full - channelLevel(level, channelBits, bitDepth)) > BIT_DEPTH_TOLERANCE:
+            bitDepth += 1
+    return bitDepth
+
+def paletteBitDepth(colors):
+    bitDepth = MIN_BIT_DEPTH
+    for color in colors:
+        bitDepth = max(bitDepth, colorBitDepth(color))
+        if bitDepth == MAX_BIT_DEPTH:
+            break
+    return bitDepth
+
+def textBitDepth(currentDisplayItem, color):
+    if currentDisplayItem['effectTable'] is not None:
+        return paletteBitDepth(currentDisplayItem['effectTable'])
+    if currentDisplayItem['gradientColors'] is not None:
+        startColor, endColor = currentDisplayItem['gradientColors']
+        return paletteBitDepth([blendColor(startColor, endColor, step, EFFECT_STEPS) for step in range(EFFECT_STEPS + 1)])
+    return colorBitDepth(color)
+
+def setBitDepth(bitDepth):
+    global matrix
+    global display
+    global currentBitDepth
+
+    print("Switching display to a bit depth of", bitDepth)
+    profileState['lowerSince'] = None
+    displayio.release_displays()
+    try:
+        matrix = createMatrix(bitDepth)
+        recordProfile(bitDepth)
+        currentBitDepth = bitDepth
+    except MemoryError as e:
+        # The old framebuffer was freed with the display, so there is room to bring it back
+        print("Not enough memory for a bit depth of", bitDepth, "keeping", currentBitDepth, ":", e)
+        profileState['nextSwitch'] = getTime() + BIT_DEPTH_DWELL
+        gc.collect()
+        matrix = createMatrix(currentBitDepth)
+    display = framebufferio.FramebufferDisplay(matrix, auto_refresh=False)
+    display.show(displayGroup)
+
+def updateDisplayProfile():
+    bitDepth = 0
+    for zone in zones:
+        if not zone['item']['type'] == "blank":
+            bitDepth = max(bitDepth, zone['item'].get('bitDepth', DEFAULT_BIT_DEPTH))
+    if bitDepth == 0 or bitDepth >= currentBitDepth:
+        profileState['lowerSince'] = None
+    elif profileState['lowerSince'] is None:
+        profileState['lowerSince'] = getTime()
+    if bitDepth == 0 or bitDepth == currentBitDepth or getTime() < profileState['nextSwitch']:
+        return
+    if bitDepth < currentBitDepth and getTime() - profileState['lowerSince'] < BIT_DEPTH_DWELL:
+        return
+    setBitDepth(bitDepth)
 
 # Helper functions for display
 
@@ -174,16 +395,371 @@ def getFontBitmap(height):
 
     return [bitmap, palette, width]
 
-def displayText(messages, height, scrollDelay, scrollSpeed, wordWrap, color):
-    global currentDisplayItem
-    global displayGroup
+# Packed fonts (see tools/packfont.py) are proportional and cover more than printable ASCII.
+# Only the header and glyph table stay in memory; glyph rows are read from flash on demand
+# and the most recently used glyphs are kept in a small LRU cache. Each line of text is copied
+# into one bitmap when it is first shown (Bitmap.blit, as bitmaptools.blit needs CircuitPython 9),
+# so the cache only speeds up that layout; scrolling only moves the finished line through its viewport.
+
+def getPackedFont(height):
+    if height in packedFonts:
+        return packedFonts[height]
+
+    filename = BITMAP_FONTS + str(height) + PACKED_FONT_EXTENSION
+    try:
+        file = open(filename, 'rb')
+    except OSError:
+        packedFonts[height] = None
+        return None
+
+    magic, fontHeight, ascent, defaultIndex, glyphCount = struct.unpack(PACKED_HEADER, file.read(PACKED_HEADER_SIZE))
+    if magic != PACKED_FONT_MAGIC:
+        file.close()
+        raise ValueError(filename + " is not a packed font!")
+
+    font = {}
+    font['file'] = file
+    font['height'] = fontHeight
+    font['glyphCount'] = glyphCount
+    font['defaultIndex'] = defaultIndex
+    font['table'] = file.read(glyphCount * PACKED_GLYPH_SIZE)
+    font['dataStart'] = PACKED_HEADER_SIZE + glyphCount * PACKED_GLYPH_SIZE
+    font['cache'] = OrderedDict()
+    packedFonts[height] = font
+    return font
+
+def findGlyphIndex(font, codepoint):
+    table = font['table']
+    low = 0
+    high = font['glyphCount'] - 1
+    while low <= high:
+        mid = (low + high) // 2
+        midCodepoint = struct.unpack_from("<H", table, mid * PACKED_GLYPH_SIZE)[0]
+        if midCodepoint == codepoint:
+            return mid
+        elif midCodepoint < codepoint:
+            low = mid + 1
+        else:
+            high = mid - 1
+    return font['defaultIndex']
+
+def getGlyph(font, char):
+    glyphIdx = findGlyphIndex(font, ord(char))
+    cache = font['cache']
+    if glyphIdx in cache:
+        glyph = cache.pop(glyphIdx)
+        cache[glyphIdx] = glyph
+        return glyph
+
+    codepoint, width, offset = struct.unpack_from(PACKED_GLYPH, font['table'], glyphIdx * PACKED_GLYPH_SIZE)
+    height = font['height']
+    rowBytes = (width + 7) // 8
+    font['file'].seek(font['dataStart'] + offset)
+    data = font['file'].read(rowBytes * height)
+
+    # Index 0 is the text color, matching the BMP fonts, so effects work the same way
+    bitmap = displayio.Bitmap(max(width, 1), height, 2)
+    bitmap.fill(1)
+    for y in range(height):
+        for x in range(width):
+            if data[y * rowBytes + x // 8] & (0x80 >> (x % 8)):
+                bitmap[x, y] = 0
+
+    if len(cache) >= GLYPH_CACHE_SIZE:
+        cache.pop(next(iter(cache)))
+    glyph = (bitmap, width)
+    cache[glyphIdx] = glyph
+    return glyph
+
+def measurePackedText(font, text):
+    width = 0
+    for char in text:
+        width += getGlyph(font, char)[1]
+    return width
+
+def renderPackedRows(font, rows, rowWidth):
+    # The extra row at the bottom stays blank for the viewport
+    height = font['height']
+    bitmap = displayio.Bitmap(max(rowWidth, 1), len(rows) * height + 1, 2)
+    bitmap.fill(1)
+    for rowIdx in range(len(rows)):
+        posX = 0
+        for char in rows[rowIdx]:
+            glyph, width = getGlyph(font, char)
+            if width > 0 and posX + width <= rowWidth:
+                bitmap.blit(posX, rowIdx * height, glyph)
+            posX += width
+    return bitmap
+
+def wrapPackedText(font, message, maxWidth):
+    rows = []
+    row = ""
+    rowWidth = 0
+    spaceWidth = getGlyph(font, ' ')[1]
+    for paragraph in message.split('\n'):
+        for word in paragraph.split(' '):
+            wordWidth = measurePackedText(font, word)
+            if len(row) > 0 and rowWidth + spaceWidth + wordWidth > maxWidth:
+                rows.append(row)
+                row = ""
+                rowWidth = 0
+            elif len(row) > 0:
+                row += ' '
+                rowWidth += spaceWidth
+            for char in word:
+                charWidth = getGlyph(font, char)[1]
+                if len(row) > 0 and rowWidth + charWidth > maxWidth:
+                    rows.append(row)
+                    row = ""
+                    rowWidth = 0
+                row += char
+                rowWidth += charWidth
+        if len(row) > 0:
+            rows.append(row)
+        row = ""
+        rowWidth = 0
+    return rows
+
+def displayPackedText(zone, font, messages, scrollDelay, scrollSpeed, wordWrap, color, effect, effectSpeed, effectColor):
+    currentDisplayItem = zone['item']
+    displayGroup = zone['group']
+    zoneWidth = zone['width']
+    zoneHeight = zone['height']
+    height = font['height']
+
+    palette = displayio.Palette(2)
+    palette[0] = color
+    palette[1] = 0x000000
+    lines = [None for _ in range(len(messages))]
+    lineLengths = [0 for _ in range(len(lines))]
+    rowPalettes = [None for _ in range(len(lines))]
+    palettes = setupEffect(currentDisplayItem, effect, effectSpeed, color, effectColor, palette, len(lines))
+
+    currentDisplayItem['type'] = "text"
+    currentDisplayItem['bitDepth'] = textBitDepth(currentDisplayItem, color)
+    currentDisplayItem['scrollSpeed'] = scrollSpeed
+    currentDisplayItem['scrollDelay'] = scrollDelay
+    currentDisplayItem['isVertical'] = wordWrap
+    willScroll = False
+    for idx in range(len(lines)):
+        message = messages[idx]
+        if wordWrap:
+            rows = wrapPackedText(font, message, zoneWidth)
+            bitmap = renderPackedRows(font, rows, zoneWidth)
+            if currentDisplayItem['gradientColors'] is not None:
+                startColor, endColor = currentDisplayItem['gradientColors']
+                rowPalettes[idx] = gradientPalettes(palette, startColor, endColor, len(rows))
+            lineLengths[idx] = len(rows) * height
+            if lineLengths[idx] > zoneHeight:
+                willScroll = True
+            lines[idx] = createTextViewport(zone, bitmap, palettes[idx], True, rowPalettes[idx])
+        else:
+            # A newline leaves a screen-wide gap, the same as the BMP fonts
+            rowWidth = 0
+            for char in message:
+                if char == '\n':
+                    rowWidth += zoneWidth
+                else:
+                    rowWidth += getGlyph(font, char)[1]
+            top, firstRow, rowHeight = clipTextRow(zoneHeight, height)
+            bitmap = displayio.Bitmap(rowWidth + 1, rowHeight, 2)
+            bitmap.fill(1)
+            posX = 0
+            for char in message:
+                if char == '\n':
+                    posX += zoneWidth
+                else:
+                    glyph, width = getGlyph(font, char)
+                    if width > 0:
+                        bitmap.blit(posX, 0, glyph, x1=0, y1=firstRow, x2=width, y2=firstRow + rowHeight)
+                    posX += width
+            lineLengths[idx] = rowWidth
+            if rowWidth > zoneWidth:
+                willScroll = True
+            lines[idx] = createTextViewport(zone, bitmap, palettes[idx], False, None)
+            lines[idx].y = top
+
+    startTextLines(zone, lines, lineLengths, rowPalettes, height, scrollDelay, willScroll)
+
+# Helper functions for text viewports
+# displayio Groups don't clip, so text is never moved past its zone's edge. Each line is rendered once
+# into a bitmap with one blank column after the text (or one blank row, when word wrapped) and shown
+# through a zone-sized TileGrid of 1 pixel wide columns (or 1 pixel high rows). Scrolling only rewrites
+# which column or row of the bitmap each tile shows, so a zone never draws over its neighbours.
+
+def clipTextRow(zoneHeight, height):
+    # A single row of text is centered in its zone, keeping only the glyph rows that fit
+    top = math.floor((zoneHeight / 2) - (height / 2))
+    if top >= 0:
+        return top, 0, height
+    return 0, -top, min(height, zoneHeight)
+
+def createTextViewport(zone, bitmap, palette, isVertical, rowPalettes):
+    line = displayio.Group()
+    if not isVertical:
+        line.append(displayio.TileGrid(bitmap, pixel_shader=palette, width=zone['width'], height=1, tile_width=1, tile_height=bitmap.height, default_tile=bitmap.width - 1))
+    elif rowPalettes is None:
+        line.append(displayio.TileGrid(bitmap, pixel_shader=palette, width=1, height=zone['height'], tile_width=bitmap.width, tile_height=1, default_tile=bitmap.height - 1))
+    else:
+        # One TileGrid per pixel row, so each can take the palette of the text row it shows
+        for row in range(zone['height']):
+            line.append(displayio.TileGrid(bitmap, pixel_shader=rowPalettes[0], width=1, height=1, tile_width=bitmap.width, tile_height=1, default_tile=bitmap.height - 1, y=row))
+    return line
+
+def placeTextLine(currentDisplayItem, idx):
+    line = currentDisplayItem['lines'][idx]
+    position = currentDisplayItem['positions'][idx]
+    length = currentDisplayItem['lineLengths'][idx]
+    if not currentDisplayItem['isVertical']:
+        tilegrid = line[0]
+        for col in range(tilegrid.width):
+            source = col - position
+            if source < 0 or source >= length:
+                source = length
+            tilegrid[col] = source
+    elif currentDisplayItem['rowPalettes'][idx] is None:
+        tilegrid = line[0]
+        for row in range(tilegrid.height):
+            source = row - position
+            if source < 0 or source >= length:
+                source = length
+            tilegrid[0, row] = source
+    else:
+        rowPalettes = currentDisplayItem['rowPalettes'][idx]
+        for row in range(len(line)):
+            source = row - position
+            if source < 0 or source >= length:
+                source = length
+            else:
+                line[row].pixel_shader = rowPalettes[source // currentDisplayItem['rowHeight']]
+            line[row][0] = source
+
+def scrollTextLine(currentDisplayItem, distance):
+    currentLine = currentDisplayItem['currentLine']
+    currentDisplayItem['positions'][currentLine] -= distance
+    placeTextLine(currentDisplayItem, currentLine)
+
+def startTextLines(zone, lines, lineLengths, rowPalettes, rowHeight, scrollDelay, willScroll):
+    currentDisplayItem = zone['item']
+    if currentDisplayItem['isVertical']:
+        startPosition = zone['height']
+    else:
+        startPosition = zone['width']
+    if scrollDelay > 0:
+        startPosition = 0
+    currentDisplayItem['lines'] = lines
+    currentDisplayItem['lineLengths'] = lineLengths
+    currentDisplayItem['rowPalettes'] = rowPalettes
+    currentDisplayItem['rowHeight'] = rowHeight
+    currentDisplayItem['positions'] = [startPosition for _ in range(len(lines))]
+    for idx in range(len(lines)):
+        placeTextLine(currentDisplayItem, idx)
+    zone['group'].append(lines[0])
+    currentDisplayItem['currentLine'] = 0
+    currentDisplayItem['scrolling'] = False
+    currentDisplayItem['willScroll'] = willScroll
+    currentDisplayItem['prevTime'] = getTime()
+
+# Text effects only ever rewrite palette[0] of the font palette(s), so the TileGrids are built once.
+# The color tables are built up front and the tick only does small-int math, so nothing is allocated per frame.
+# gradient is static: every rendered row gets its own copy of the font palette with a fixed shade.
+
+def blendColor(startColor, endColor, step, steps):
+    blended = 0
+    for shift in (16, 8, 0):
+        start = (startColor >> shift) & 0xFF
+        end = (endColor >> shift) & 0xFF
+        blended |= (start + ((end - start) * step) // steps) << shift
+    return blended
+
+def hueColor(step, steps):
+    sector = (step * 6) // steps
+    rise = (((step * 6) % steps) * 0xFF) // steps
+    fall = 0xFF - rise
+    if sector == 0:
+        return (0xFF << 16) | (rise << 8)
+    elif sector == 1:
+        return (fall << 16) | (0xFF << 8)
+    elif sector == 2:
+        return (0xFF << 8) | rise
+    elif sector == 3:
+        return (fall << 8) | 0xFF
+    elif sector == 4:
+        return (rise << 16) | 0xFF
+    return (0xFF << 16) | fall
+
+def buildEffectTable(effect, color, effectColor):
+    half = EFFECT_STEPS // 2
+    if effect == "rainbow":
+        return [hueColor(step, EFFECT_STEPS) for step in range(EFFECT_STEPS)]
+    elif effect == "blink":
+        return [color if step < half else effectColor for step in range(EFFECT_STEPS)]
+    elif effect == "pulse":
+        return [blendColor(color, effectColor, half - abs(half - step), half) for step in range(EFFECT_STEPS)]
+    return None
+
+def gradientPalettes(palette, startColor, endColor, numRows):
+    palettes = []
+    for rowIdx in range(numRows):
+        rowPalette = displayio.Palette(len(palette))
+        for colorIdx in range(len(palette)):
+            rowPalette[colorIdx] = palette[colorIdx]
+        rowPalette[0] = blendColor(startColor, endColor, rowIdx, max(numRows - 1, 1))
+        palettes.append(rowPalette)
+    return palettes
+
+def setupEffect(currentDisplayItem, effect, effectSpeed, color, effectColor, palette, numLines):
+    palettes = [palette for _ in range(numLines)]
+    currentDisplayItem['effectTable'] = None
+    currentDisplayItem['gradientColors'] = None
+    if effect == "gradient":
+        # Without word wrap every line is a single row, so the lines are shaded from first to last instead
+        currentDisplayItem['gradientColors'] = (color, effectColor)
+        return gradientPalettes(palette, color, effectColor, numLines)
+
+    currentDisplayItem['effectTable'] = buildEffectTable(effect, color, effectColor)
+    if currentDisplayItem['effectTable'] is None:
+        if not effect == "none":
+            print("Unknown text effect", effect, ", showing plain text")
+        return palettes
+
+    currentDisplayItem['palettes'] = palettes
+    currentDisplayItem['effectPeriod'] = max(1, effectSpeed) * 1000
+    currentDisplayItem['effectStart'] = supervisor.ticks_ms()
+    currentDisplayItem['effectStep'] = -1
+    return palettes
+
+def updateEffect(currentDisplayItem):
+    table = currentDisplayItem['effectTable']
+    elapsed = ((supervisor.ticks_ms() - currentDisplayItem['effectStart']) & TICKS_MASK) % currentDisplayItem['effectPeriod']
+    step = (elapsed * EFFECT_STEPS) // currentDisplayItem['effectPeriod']
+    if step == currentDisplayItem['effectStep']:
+        return
+    currentDisplayItem['effectStep'] = step
+    palettes = currentDisplayItem['palettes']
+    for idx in range(len(palettes)):
+        palettes[idx][0] = table[step]
+
+def displayText(zone, messages, height, scrollDelay, scrollSpeed, wordWrap, color, effect="none", effectSpeed=2, effectColor=0x000000):
+    font = getPackedFont(height)
+    if font is not None:
+        displayPackedText(zone, font, messages, scrollDelay, scrollSpeed, wordWrap, color, effect, effectSpeed, effectColor)
+        return
+
+    currentDisplayItem = zone['item']
+    displayGroup = zone['group']
+    zoneWidth = zone['width']
+    zoneHeight = zone['height']
 
     bitmap, palette, width = getFontBitmap(height)
     palette[0] = color
-    lines = [displayio.Group() for _ in range(len(messages))]
+    lines = [None for _ in range(len(messages))]
     lineLengths = [0 for _ in range(len(lines))]
+    rowPalettes = [None for _ in range(len(lines))]
+    palettes = setupEffect(currentDisplayItem, effect, effectSpeed, color, effectColor, palette, len(lines))
     
     currentDisplayItem['type'] = "text"
+    currentDisplayItem['bitDepth'] = textBitDepth(currentDisplayItem, color)
     currentDisplayItem['scrollSpeed'] = scrollSpeed
     currentDisplayItem['scrollDelay'] = scrollDelay
 
@@ -210,7 +786,9 @@ def displayText(messages, height, scrollDelay, scrollSpeed, wordWrap, color):
                     word += char
             if not word == "":
                 words.append(word)
-            maxWidth = math.floor(64 / width) - 1
+            maxWidth = math.floor(zoneWidth / width) - 1
+            if maxWidth < 0:
+                raise ValueError("Zone " + zone['name'] + " is narrower than one character of the height " + str(height) + " font")
             tilegridLine = [SPACE_INDEX for _ in range(maxWidth + 1)]
             tilegridMatrix = []
             posX = 0
@@ -258,35 +836,24 @@ def displayText(messages, height, scrollDelay, scrollSpeed, wordWrap, color):
 
             numSubLines = len(tilegridMatrix)
 
-            tilegrid = displayio.TileGrid(bitmap=bitmap, pixel_shader=palette, width=(maxWidth + 1), height=numSubLines, tile_width=width, tile_height=height, default_tile=SPACE_INDEX)
+            # The extra row at the bottom stays blank for the viewport
+            lineBitmap = displayio.Bitmap((maxWidth + 1) * width, numSubLines * height + 1, len(palette))
+            lineBitmap.fill(fontBackground(bitmap, width, height))
             for yIdx in range(numSubLines):
                 for xIdx in range(maxWidth + 1):
-                    tilegrid[xIdx, yIdx] = tilegridMatrix[yIdx][xIdx]
-
-            lines[idx].append(tilegrid)
+                    blitFontTile(lineBitmap, bitmap, width, height, tilegridMatrix[yIdx][xIdx], xIdx * width, yIdx * height, 0, height)
+            if currentDisplayItem['gradientColors'] is not None:
+                startColor, endColor = currentDisplayItem['gradientColors']
+                rowPalettes[idx] = gradientPalettes(palette, startColor, endColor, numSubLines)
             lineLengths[idx] = numSubLines * height
-            if numSubLines * height > 32:
+            if numSubLines * height > zoneHeight:
                 willScroll = True
-
-            lines[idx].x = 0
-            if scrollDelay > 0:
-                lines[idx].y = 0
-            else:
-                lines[idx].y = 32
-
-        displayGroup.append(lines[0])
-        currentDisplayItem['currentLine'] = 0
-        currentDisplayItem['scrolling'] = False
-        currentDisplayItem['willScroll'] = willScroll
+            lines[idx] = createTextViewport(zone, lineBitmap, palettes[idx], True, rowPalettes[idx])
     else:
         currentDisplayItem['isVertical'] = False
         willScroll = False
+        top, firstRow, rowHeight = clipTextRow(zoneHeight, height)
         for idx in range(len(lines)):
-            lines[idx].y = math.floor((32 / 2) - (height / 2))
-            if scrollDelay > 0:
-                lines[idx].x = 0
-            else:
-                lines[idx].x = 64
             message = messages[idx]
             tilegridList = []
             for char in message:
@@ -295,49 +862,75 @@ def displayText(messages, height, scrollDelay, scrollSpeed, wordWrap, color):
                     sourceIdx = SPACE_INDEX
 
                 if char == '\n':
-                    for _ in range(math.floor(64 / width)):
+                    for _ in range(math.floor(zoneWidth / width)):
                         tilegridList.append(SPACE_INDEX)
                 else:
                     tilegridList.append(sourceIdx)
-            tilegrid = displayio.TileGrid(bitmap=bitmap, pixel_shader=palette, width=len(tilegridList), height=1, tile_width=width, tile_height=height, default_tile=SPACE_INDEX)
+            # The extra column on the right stays blank for the viewport
+            lineBitmap = displayio.Bitmap(len(tilegridList) * width + 1, rowHeight, len(palette))
+            lineBitmap.fill(fontBackground(bitmap, width, height))
             for tileIdx in range(len(tilegridList)):
-                tilegrid[tileIdx] = tilegridList[tileIdx]
-            lines[idx].append(tilegrid)
+                blitFontTile(lineBitmap, bitmap, width, height, tilegridList[tileIdx], tileIdx * width, 0, firstRow, rowHeight)
             lineLengths[idx] = len(tilegridList) * width
-            if len(tilegridList) * width > 64:
+            if len(tilegridList) * width > zoneWidth:
                 willScroll = True
-            
-        displayGroup.append(lines[0])
-        currentDisplayItem['currentLine'] = 0
-        currentDisplayItem['scrolling'] = False
-        currentDisplayItem['willScroll'] = willScroll
+            lines[idx] = createTextViewport(zone, lineBitmap, palettes[idx], False, None)
+            lines[idx].y = top
 
-    currentDisplayItem['lines'] = lines
-    currentDisplayItem['lineLengths'] = lineLengths
-    currentDisplayItem['prevTime'] = getTime()
+    startTextLines(zone, lines, lineLengths, rowPalettes, height, scrollDelay, willScroll)
+
+def fontBackground(fontBitmap, width, height):
+    columns = fontBitmap.width // width
+    return fontBitmap[(SPACE_INDEX % columns) * width, (SPACE_INDEX // columns) * height]
+
+def blitFontTile(target, fontBitmap, width, height, tileIdx, x, y, firstRow, rowHeight):
+    # Copies rowHeight pixel rows of one BMP font tile, starting at firstRow
+    if tileIdx == SPACE_INDEX:
+        return
+    columns = fontBitmap.width // width
+    left = (tileIdx % columns) * width
+    top = (tileIdx // columns) * height + firstRow
+    target.blit(x, y, fontBitmap, x1=left, y1=top, x2=left + width, y2=top + rowHeight)
 
-def displayTextfile(filename):
+def displayTextfile(zone, filename):
     extension = filename.split('.')[1]
     if extension == "msg":
         with open(filename, 'r') as file:
             height = int(file.readline().split('=')[1])
             scrollDelay = int(file.readline().split('=')[1])
             scrollSpeed = int(file.readline().split('=')[1])
-            wordWrapChoice = file.readline().split('=')[1]
+            wordWrapChoice = file.readline().split('=')[1].strip()
             if wordWrapChoice == "on":
                 wordWrap = True
             else:
                 wordWrap = False
-            colorChoice = str(file.readline().split('=')[1])
-            color = int('0x' + colorChoice)
+            colorChoice = file.readline().split('=')[1].strip()
+            color = int(colorChoice, 16)
 
             messages = file.readlines()
+
+        # Effect settings are optional and sit between the color line and the message
+        effect = "none"
+        effectSpeed = 2
+        effectColor = 0x000000
+        while len(messages) > 0 and messages[0].split('=')[0] in EFFECT_SETTINGS:
+            name, value = messages.pop(0).split('=', 1)
+            value = value.strip()
+            if name == "effect":
+                effect = value
+            elif name == "effectspeed":
+                effectSpeed = int(value)
+            elif name == "effectcolor":
+                effectColor = int(value, 16)
     else:
         height = 30
         scrollDelay = 0
         scrollSpeed = 30
         wordWrap = False
         color = 0xFFFFFF
+        effect = "none"
+        effectSpeed = 2
+        effectColor = 0x000000
 
         with open(filename, 'r') as file:
             messages = file.readlines()
@@ -346,24 +939,42 @@ def displayTextfile(filename):
     if len(lastMessage) < 2:
         messages = messages[:-1]
 
-    displayText(messages, height, scrollDelay, scrollSpeed, wordWrap, color)
+    displayText(zone, messages, height, scrollDelay, scrollSpeed, wordWrap, color, effect, effectSpeed, effectColor)
 
-def displayAnimation(bitmap, palette, framesPerSecond):
-    global currentDisplayItem
-    global displayGroup
+def displayAnimation(zone, bitmap, palette, framesPerSecond):
+    currentDisplayItem = zone['item']
+    displayGroup = zone['group']
     currentDisplayItem['type'] = "animation"
+    currentDisplayItem['bitDepth'] = paletteBitDepth([palette[idx] for idx in range(len(palette))])
     currentDisplayItem['frameDelay'] = 1 / framesPerSecond
-    numFrames = bitmap.height / 32
-    tilegrid = displayio.TileGrid(bitmap, pixel_shader=palette, height=numFrames, tile_width=64, tile_height=32)
-    for tileIdx in range(numFrames):
-        tilegrid[tileIdx] = tileIdx
+    # Frames are stacked top to bottom, each as tall as the zone, and shown one at a time as tiles
+    frameHeight = zone['height']
+    if bitmap.height % frameHeight != 0:
+        print("Animation height", bitmap.height, "is not a multiple of the zone height", frameHeight, ", showing it as one frame")
+        frameHeight = bitmap.height
+    numFrames = bitmap.height // frameHeight
+    bitmap = clipBitmap(zone, bitmap, palette, frameHeight)
+    tilegrid = displayio.TileGrid(bitmap, pixel_shader=palette, tile_width=bitmap.width, tile_height=bitmap.height // numFrames)
+    tilegrid[0] = 0
     displayGroup.append(tilegrid)
     currentDisplayItem['tilegrid'] = tilegrid
     currentDisplayItem['currentFrame'] = 0
     currentDisplayItem['numFrames'] = numFrames
     currentDisplayItem['prevTime'] = getTime()
 
-def displayImagefile(filename):
+def clipBitmap(zone, bitmap, palette, frameHeight):
+    # Keeps the top left corner of every frame that fits the zone, as nothing clips a TileGrid
+    width = min(bitmap.width, zone['width'])
+    height = min(frameHeight, zone['height'])
+    if width == bitmap.width and height == frameHeight:
+        return bitmap
+    numFrames = bitmap.height // frameHeight
+    clipped = displayio.Bitmap(width, height * numFrames, len(palette))
+    for frame in range(numFrames):
+        clipped.blit(0, frame * height, bitmap, x1=0, y1=frame * frameHeight, x2=width, y2=frame * frameHeight + height)
+    return clipped
+
+def displayImagefile(zone, filename):
     extension = filename.split('.')[1]
     if extension == "bmp":
         bitmap, palette = adafruit_imageload.load(filename, bitmap=displayio.Bitmap, palette=displayio.Palette)
@@ -374,10 +985,10 @@ def displayImagefile(filename):
                 framesPerSecond = int(framerate)
             else:
                 framesPerSecond = 20
-            displayAnimation(bitmap, palette, framesPerSecond)
+            displayAnimation(zone, bitmap, palette, framesPerSecond)
         else:
             try:
-                metafilename = filename.split('.')[0].split('/')[1] + '.txt'
+                metafilename = filename.split('/')[-1].split('.')[0] + '.txt'
                 with open('metadata/' + metafilename, 'r') as file:
                     settings = file.readlines()
 
@@ -389,35 +1000,40 @@ def displayImagefile(filename):
             except (OSError, ValueError) as e:
                 print("Unable to open the metadata file for", filename, "due to", e)
                 displayTime = 5
-            displayImage(bitmap, palette, displayTime)
+            displayImage(zone, bitmap, palette, displayTime)
 
-def displayImage(bitmap, palette, displayTime):
-    global currentDisplayItem
-    global displayGroup
+def displayImage(zone, bitmap, palette, displayTime):
+    currentDisplayItem = zone['item']
+    displayGroup = zone['group']
     currentDisplayItem['type'] = "image"
+    currentDisplayItem['bitDepth'] = paletteBitDepth([palette[idx] for idx in range(len(palette))])
     currentDisplayItem['displayTime'] = displayTime
-    tilegrid = displayio.TileGrid(bitmap, pixel_shader=palette)
-    if bitmap.width < 64:
-        tilegrid.x = math.floor((64 - bitmap.width) / 2)
-    if bitmap.height < 32:
-        tilegrid.y = math.floor((32 - bitmap.width) / 2)
+    tilegrid = displayio.TileGrid(clipBitmap(zone, bitmap, palette, bitmap.height), pixel_shader=palette)
+    if bitmap.width < zone['width']:
+        tilegrid.x = math.floor((zone['width'] - bitmap.width) / 2)
+    if bitmap.height < zone['height']:
+        tilegrid.y = math.floor((zone['height'] - bitmap.height) / 2)
     displayGroup.append(tilegrid)
     currentDisplayItem['prevTime'] = getTime()
 
-def displayFile(filename):
+def displayFile(zone, filename):
     extension = filename.split('.')[1]
     if extension == "txt" or extension == "msg":
-        displayTextfile(filename)
+        displayTextfile(zone, filename)
+    elif extension == "feed":
+        displayFeedfile(zone, filename)
     elif extension == "bmp":
-        displayImagefile(filename)
+        displayImagefile(zone, filename)
     else:
         print("File", filename, "has an unrecognized filetype of", extension)
 
-def updateDisplayItem():
-    global currentDisplayItem
-    global displayGroup
+def updateDisplayItem(zone):
+    currentDisplayItem = zone['item']
+    displayGroup = zone['group']
     currentTime = getTime()
     if currentDisplayItem['type'] == "text":
+        if currentDisplayItem['effectTable'] is not None:
+            updateEffect(currentDisplayItem)
         if not currentDisplayItem['scrolling']:
             if currentTime - currentDisplayItem['prevTime'] < currentDisplayItem['scrollDelay']:
                 return
@@ -435,7 +1051,7 @@ def updateDisplayItem():
                     currentDisplayItem['prevTime'] = getTime()
         else:
             if currentDisplayItem['isVertical']:
-                if currentDisplayItem['lines'][currentDisplayItem['currentLine']].y < -currentDisplayItem['lineLengths'][currentDisplayItem['currentLine']]:
+                if currentDisplayItem['positions'][currentDisplayItem['currentLine']] < -currentDisplayItem['lineLengths'][currentDisplayItem['currentLine']]:
                     currentDisplayItem['scrolling'] = False
                     displayGroup.pop()
                     currentDisplayItem['prevTime'] = getTime()
@@ -449,10 +1065,10 @@ def updateDisplayItem():
                     elapsedTime = currentTime - currentDisplayItem['prevTime']
                     scrollDistance = math.floor(currentDisplayItem['scrollSpeed'] * elapsedTime)
                     if scrollDistance > 0:
-                        currentDisplayItem['lines'][currentDisplayItem['currentLine']].y -= scrollDistance
+                        scrollTextLine(currentDisplayItem, scrollDistance)
                         currentDisplayItem['prevTime'] = getTime()
             else:
-                if -currentDisplayItem['lines'][currentDisplayItem['currentLine']].x > currentDisplayItem['lineLengths'][currentDisplayItem['currentLine']]:
+                if -currentDisplayItem['positions'][currentDisplayItem['currentLine']] > currentDisplayItem['lineLengths'][currentDisplayItem['currentLine']]:
                     currentDisplayItem['scrolling'] = False
                     displayGroup.pop()
                     currentDisplayItem['prevTime'] = getTime()
@@ -466,7 +1082,7 @@ def updateDisplayItem():
                     elapsedTime = currentTime - currentDisplayItem['prevTime']
                     scrollDistance = math.floor(currentDisplayItem['scrollSpeed'] * elapsedTime)
                     if scrollDistance > 0:
-                        currentDisplayItem['lines'][currentDisplayItem['currentLine']].x -= scrollDistance
+                        scrollTextLine(currentDisplayItem, scrollDistance)
                         currentDisplayItem['prevTime'] = getTime()
     elif currentDisplayItem['type'] == "image":
         elapsedTime = currentTime - currentDisplayItem['prevTime']
@@ -479,21 +1095,431 @@ def updateDisplayItem():
         if elapsedTime > currentDisplayItem['frameDelay']:
             if currentDisplayItem['currentFrame'] < (currentDisplayItem['numFrames'] - 1):
                 currentDisplayItem['currentFrame'] += 1
-                currentDisplayItem['tilegrid'].y = currentDisplayItem['currentFrame'] * 32
+                currentDisplayItem['tilegrid'][0] = currentDisplayItem['currentFrame']
             else:
                 displayGroup.pop()
-                currentDisplayItem['type'] == "blank"
+                currentDisplayItem['type'] = "blank"
             currentDisplayItem['prevTime'] = getTime()
     else:
-        if len(filenames) > 0:
-            displayFile('uploads/' + filenames[0])
-            rotateFilenames()
+        playlist = zone['playlist']
+        if len(playlist) > 0:
+            filename = playlist[0]
+            rotatePlaylist(playlist)
+            try:
+                displayFile(zone, zone['prefix'] + filename)
+            except (OSError, ValueError, IndexError, MemoryError) as e:
+                # Leave the zone blank, so the next tick moves on to the next file
+                print("Skipping", filename, "in zone", zone['name'], "due to: ", e)
+                while len(displayGroup) > 0:
+                    displayGroup.pop()
+                currentDisplayItem['type'] = "blank"
+
+# Helper functions for feeds
+# A .feed file holds name=value lines: url, refresh (seconds), extract, and optionally the same
+# height/scrolldelay/scrollspeed/wordwrap/color settings as a .msg file.
+# extract is "text" (the whole body), "json:<key>.<key>.<index>" or "between:<start>|<end>".
+# Displaying a feed only ever reads the last good text cached on flash. The fetch itself runs as a
+# small state machine that updateFeeds() advances by at most one FEED_CHUNK_SIZE read per main loop tick.
+# The ESP32 connects and reads the headers in one blocking requests.get, so that step is capped by
+# FEED_TIMEOUT, and a server that keeps failing is retried less and less often, up to FEED_MAX_RETRY.
+# requests shares one session, so anything else using it must call cancelFeedFetches() first.
+
+def readFeedSettings(filename):
+    settings = {}
+    with open(filename, 'r') as file:
+        for line in file:
+            if '=' in line:
+                name, value = line.split('=', 1)
+                settings[name.strip()] = value.strip()
+    return settings
+
+def feedCacheFilename(filename):
+    return FEED_CACHE + filename.split('/')[-1].split('.')[0] + '.cache'
+
+def registerFeed(filename):
+    if filename in feeds:
+        return feeds[filename]
+    feed = {}
+    feed['filename'] = filename
+    feed['state'] = "idle"
+    feed['nextFetch'] = getTime()
+    feed['response'] = None
+    feed['chunks'] = None
+    feed['body'] = None
+    feed['received'] = 0
+    feed['expected'] = -1
+    feed['failures'] = 0
+    feed['etag'] = ""
+    feed['lastModified'] = ""
+    feed['newEtag'] = ""
+    feed['newLastModified'] = ""
+    try:
+        with open(feedCacheFilename(filename), 'r') as file:
+            feed['etag'] = file.readline().split('=', 1)[1].strip()
+            feed['lastModified'] = file.readline().split('=', 1)[1].strip()
+    except (OSError, IndexError):
+        pass
+    feeds[filename] = feed
+    return feed
+
+def registerPlaylistFeeds():
+    for zone in zones:
+        for name in zone['playlist']:
+            if name.endswith(".feed"):
+                registerFeed(zone['prefix'] + name)
+
+def extractFeedText(rule, body):
+    if rule.startswith("json:"):
+        value = json.loads(body)
+        for key in rule[5:].split('.'):
+            if len(key) < 1:
+                continue
+            if isinstance(value, list):
+                value = value[int(key)]
+            else:
+                value = value[key]
+        return str(value)
+    elif rule.startswith("between:"):
+        start, end = rule[8:].split('|', 1)
+        startIdx = body.find(start)
+        if startIdx < 0:
+            raise ValueError("Start marker " + start + " not found")
+        startIdx += len(start)
+        endIdx = body.find(end, startIdx)
+        if endIdx < 0:
+            raise ValueError("End marker " + end + " not found")
+        return body[startIdx:endIdx].strip()
+    return body.strip()
+
+def feedBodyComplete(feed):
+    # Keeps the buffered body under FEED_MAXSIZE, returning True once there is no point reading further
+    rule = feed['extract']
+    body = feed['body']
+    if rule.startswith("between:"):
+        start, end = rule[8:].split('|', 1)
+        start = start.encode("utf-8")
+        startIdx = body.find(start)
+        if startIdx < 0:
+            if len(body) > len(start):
+                feed['body'] = body[utf8Start(body, len(body) - len(start), 1):]
+            return False
+        if body.find(end.encode("utf-8"), startIdx + len(start)) > -1:
+            return True
+    if len(body) > FEED_MAXSIZE:
+        if rule.startswith("json:"):
+            raise ValueError("Feed response is larger than " + str(FEED_MAXSIZE) + " bytes")
+        feed['body'] = body[:utf8Start(body, FEED_MAXSIZE, -1)]
+        return True
+    return False
+
+def utf8Start(data, idx, step):
+    # Moves idx by step until it is on the first byte of a UTF-8 character, so a trimmed body still decodes
+    while 0 < idx < len(data) and (data[idx] & 0xC0) == 0x80:
+        idx += step
+    return idx
+
+def finishFeedFetch(feed, text):
+    if feed['response'] is not None:
+        feed['response'].close()
+    feed['response'] = None
+    feed['chunks'] = None
+    feed['body'] = None
+    feed['state'] = "idle"
+    feed['failures'] = 0
+    feed['nextFetch'] = getTime() + feed['refresh']
+    if text is None:
+        return
+    feed['etag'] = feed['newEtag']
+    feed['lastModified'] = feed['newLastModified']
+    try:
+        os.mkdir(FEED_CACHE[:-1])
+    except OSError:
+        pass
+    with open(feedCacheFilename(feed['filename']), 'w') as file:
+        file.write("etag=" + feed['etag'] + '\n')
+        file.write("modified=" + feed['lastModified'] + '\n')
+        file.write(text + '\n')
+
+def stopFeedFetch(feed, retryDelay):
+    try:
+        if feed['response'] is not None:
+            feed['response'].close()
+    except (OSError, RuntimeError) as e:
+        print("Failed to close feed response: ", e)
+    feed['response'] = None
+    feed['chunks'] = None
+    feed['body'] = None
+    feed['state'] = "idle"
+    feed['nextFetch'] = getTime() + retryDelay
+
+def failFeedFetch(feed, error):
+    print("Failed to fetch feed", feed['filename'], "due to: ", error)
+    retryDelay = min(min(feed.get('refresh', FEED_RETRY), FEED_RETRY) * (2 ** feed['failures']), FEED_MAX_RETRY)
+    feed['failures'] = min(feed['failures'] + 1, 16)
+    stopFeedFetch(feed, retryDelay)
+
+def cancelFeedFetches():
+    # A new request on the shared session closes the feed's response, so stop reading it
+    # and start over on the next tick rather than caching the part read so far
+    for feed in feeds.values():
+        if feed['state'] == "reading":
+            print("Cancelling the fetch of feed", feed['filename'])
+            stopFeedFetch(feed, 0)
+
+def startFeedFetch(feed):
+    try:
+        settings = readFeedSettings(feed['filename'])
+    except OSError:
+        print("Feed", feed['filename'], "was removed, forgetting it")
+        feeds.pop(feed['filename'])
+        try:
+            os.remove(feedCacheFilename(feed['filename']))
+        except OSError:
+            pass
+        return
+
+    feed['url'] = settings.get('url', "")
+    feed['refresh'] = int(settings.get('refresh', FEED_RETRY))
+    feed['extract'] = settings.get('extract', "text")
+    headers = {}
+    if len(feed['etag']) > 0:
+        headers["If-None-Match"] = feed['etag']
+    if len(feed['lastModified']) > 0:
+        headers["If-Modified-Since"] = feed['lastModified']
+
+    print("Fetching feed", feed['filename'], "from", feed['url'])
+    feed['response'] = requests.get(feed['url'], headers=headers, stream=True, timeout=FEED_TIMEOUT)
+    if feed['response'].status_code == 304:
+        print("Feed", feed['filename'], "not modified")
+        finishFeedFetch(feed, None)
+        return
+    if feed['response'].status_code != 200:
+        raise ValueError("Feed server returned " + str(feed['response'].status_code))
+    # Only kept once the body has been read and cached, or a failed read would turn into a 304 next time
+    feed['newEtag'] = feed['response'].headers.get("etag", "")
+    feed['newLastModified'] = feed['response'].headers.get("last-modified", "")
+    feed['expected'] = int(feed['response'].headers.get("content-length", -1))
+    feed['received'] = 0
+    feed['chunks'] = feed['response'].iter_content(chunk_size=FEED_CHUNK_SIZE)
+    feed['body'] = b""
+    feed['state'] = "reading"
+
+def readFeedChunk(feed):
+    try:
+        chunk = next(feed['chunks'])
+    except StopIteration:
+        chunk = None
+    if chunk:
+        feed['received'] += len(chunk)
+        feed['body'] += chunk
+        if not feedBodyComplete(feed):
+            return
+    elif feed['received'] < feed['expected']:
+        raise ValueError("Feed response ended after " + str(feed['received']) + " of " + str(feed['expected']) + " bytes")
+    text = extractFeedText(feed['extract'], str(feed['body'], "utf-8"))
+    finishFeedFetch(feed, text)
+
+def updateFeeds():
+    # Only one feed talks to the network at a time, and each call does at most one step of it
+    currentTime = getTime()
+    for feed in list(feeds.values()):
+        if feed['state'] == "reading":
+            try:
+                readFeedChunk(feed)
+            except (OSError, RuntimeError, ValueError, KeyError, IndexError) as e:
+                failFeedFetch(feed, e)
+            return
+
+    for feed in list(feeds.values()):
+        if currentTime >= feed['nextFetch']:
+            try:
+                startFeedFetch(feed)
+            except (OSError, RuntimeError, ValueError) as e:
+                failFeedFetch(feed, e)
+            return
+
+def displayFeedfile(zone, filename):
+    registerFeed(filename)
+    settings = readFeedSettings(filename)
+    height = int(settings.get('height', 30))
+    scrollDelay = int(settings.get('scrolldelay', 0))
+    scrollSpeed = int(settings.get('scrollspeed', 30))
+    wordWrap = settings.get('wordwrap', "off") == "on"
+    color = int(settings.get('color', "0xFFFFFF"), 16)
+
+    try:
+        with open(feedCacheFilename(filename), 'r') as file:
+            file.readline()
+            file.readline()
+            messages = [line for line in file.readlines() if len(line.strip()) > 0]
+    except OSError:
+        messages = []
+    if len(messages) < 1:
+        messages = [FEED_PLACEHOLDER]
+
+    displayText(zone, messages, height, scrollDelay, scrollSpeed, wordWrap, color)
+
+# Helper functions for MQTT
+# Optional, enabled by adding "mqtt_broker" (and optionally "mqtt_port", "mqtt_username", "mqtt_password",
+# "mqtt_prefix" and "mqtt_name") to secrets.py. Commands are JSON messages on
+#   <prefix>/<name>/cmd/<command> for this panel, or <prefix>/all/cmd/<command> for every panel,
+# where <command> is enqueue ({"filename", "text"}), reorder ({"order": [filenames]}),
+# delete ({"filename"}) or clear. The queue is published (retained) to <prefix>/<name>/state/queue
+# whenever it changes, and metrics to <prefix>/<name>/state/metrics every MQTT_METRICS_INTERVAL seconds.
+# Connecting blocks the main loop until the broker answers or the connect times out, so there is a
+# single attempt per MQTT_RETRY, backing off up to MQTT_MAX_RETRY while the broker stays down.
+
+def mqttClientId(name):
+    # MQTT 3.1 brokers only have to accept client ids of up to 23 bytes, and minimqtt refuses longer ones
+    if len(name.encode("utf-8")) <= MQTT_CLIENT_ID_MAX:
+        return name
+    macHex = "".join("%02x" % byte for byte in esp.MAC_address)
+    prefix = name
+    while len((prefix + "-" + macHex).encode("utf-8")) > MQTT_CLIENT_ID_MAX:
+        prefix = prefix[:-1]
+    return prefix + "-" + macHex
+
+def setupMqtt():
+    if "mqtt_broker" not in secrets:
+        return None
+
+    prefix = secrets.get("mqtt_prefix", "matrixportal")
+    name = secrets.get("mqtt_name", "".join("%02x" % byte for byte in esp.MAC_address))
+    mqttState['base'] = prefix + "/" + name
+    mqttState['topics'] = [mqttState['base'] + "/cmd/#", prefix + "/all/cmd/#"]
+    mqttState['queueChanged'] = True
+    mqttState['nextConnect'] = getTime()
+    mqttState['nextMetrics'] = getTime()
+    mqttState['lastPoll'] = getTime()
+    mqttState['startTime'] = getTime()
+    mqttState['commands'] = 0
+    mqttState['connected'] = False
+    mqttState['failures'] = 0
+
+    clientId = mqttClientId(name)
+    if clientId != name:
+        print("MQTT name", name, "is too long for a client id, connecting as", clientId)
+    MQTT.set_socket(socket, esp)
+    client = MQTT.MQTT(
+        broker=secrets["mqtt_broker"],
+        port=int(secrets.get("mqtt_port", 1883)),
+        username=secrets.get("mqtt_username"),
+        password=secrets.get("mqtt_password"),
+        client_id=clientId,
+        socket_timeout=MQTT_SOCKET_TIMEOUT,
+        connect_retries=1
+    )
+    client.on_message = mqttMessage
+    return client
+
+def mqttMessage(client, topic, message):
+    command = topic.split('/')[-1]
+    print("MQTT command received: ", command)
+    mqttState['commands'] += 1
+    try:
+        if len(message.strip()) > 0:
+            payload = json.loads(message)
+        else:
+            payload = {}
+        handleMqttCommand(command, payload)
+    except (ValueError, KeyError, TypeError, OSError) as e:
+        print("Failed to handle MQTT command", command, "due to: ", e)
+
+def handleMqttCommand(command, payload):
+    global completedUploadsChanged
+
+    if command == "enqueue":
+        filename = payload["filename"]
+        if not validUploadName(filename):
+            raise ValueError("Invalid filename " + filename)
+        with open('uploads/' + filename, 'w') as file:
+            file.write(payload["text"])
+        # Goes through the same duplicate/metadata handling as a finished upload
+        completedUploads.append(filename)
+        completedUploadsChanged = True
+        return
+    elif command == "reorder":
+        reorderFilenames(payload["order"])
+    elif command == "delete":
+        if payload["filename"] in filenames:
+            removeFilename(filenames.index(payload["filename"]))
+    elif command == "clear":
+        while len(filenames) > 0:
+            removeFilename(0)
+    else:
+        print("Unknown MQTT command", command)
+        return
+
+    saveFilenames()
+    updateHTML()
+    updateQueueData()
+
+def publishMqttState():
+    if mqttState['queueChanged']:
+        mqttClient.publish(mqttState['base'] + "/state/queue", json.dumps(filenames), retain=True)
+        mqttState['queueChanged'] = False
+
+    if getTime() >= mqttState['nextMetrics']:
+        metrics = {}
+        metrics["uptime"] = int(getTime() - mqttState['startTime'])
+        metrics["free"] = gc.mem_free()
+        metrics["queue"] = len(filenames)
+        metrics["commands"] = mqttState['commands']
+        metrics["rssi"] = esp.rssi
+        mqttClient.publish(mqttState['base'] + "/state/metrics", json.dumps(metrics))
+        mqttState['nextMetrics'] = getTime() + MQTT_METRICS_INTERVAL
+
+def mqttDataWaiting():
+    # minimqtt keeps its socket private; with the ESP32SPI socket, asking for the bytes waiting on it is
+    # one short SPI transaction. Returns None for other socket types, which can't be asked.
+    sock = getattr(mqttClient, "_sock", None)
+    if sock is None or not hasattr(sock, "available"):
+        return None
+    return sock.available() > 0
+
+def updateMqtt():
+    if mqttClient is None:
+        return
+
+    try:
+        if not mqttState['connected']:
+            if getTime() < mqttState['nextConnect']:
+                return
+            print("Connecting to MQTT broker", secrets["mqtt_broker"])
+            mqttClient.connect()
+            for topic in mqttState['topics']:
+                mqttClient.subscribe(topic)
+            mqttState['connected'] = True
+            mqttState['failures'] = 0
+            mqttState['queueChanged'] = True
+
+        # loop() waits out MQTT_SOCKET_TIMEOUT even when nothing has arrived, so it only runs when the ESP32
+        # has data for the MQTT socket, and every MQTT_PING_INTERVAL so keepalive pings still go out.
+        # If the socket can't be asked, it runs every MQTT_POLL_INTERVAL instead.
+        waiting = mqttDataWaiting()
+        if waiting is None:
+            interval = MQTT_POLL_INTERVAL
+        else:
+            interval = MQTT_PING_INTERVAL
+        if waiting or getTime() - mqttState['lastPoll'] >= interval:
+            mqttState['lastPoll'] = getTime()
+            mqttClient.loop(timeout=MQTT_SOCKET_TIMEOUT)
+        publishMqttState()
+    except (OSError, RuntimeError, MQTT.MMQTTException) as e:
+        print("MQTT update failed: ", e)
+        mqttState['connected'] = False
+        try:
+            mqttClient.disconnect()
+        except (OSError, RuntimeError, MQTT.MMQTTException):
+            pass
+        mqttState['nextConnect'] = getTime() + min(MQTT_RETRY * (2 ** mqttState['failures']), MQTT_MAX_RETRY)
+        mqttState['failures'] = min(mqttState['failures'] + 1, 16)
 
 # Helper functions for webserver
 
-def rotateFilenames():
-    filenames.append(filenames[0])
-    filenames.pop(0)
+def rotatePlaylist(playlist):
+    playlist.append(playlist[0])
+    playlist.pop(0)
 
 def validIdx(idx, array):
     return (idx >= 0 and idx < len(array))
@@ -501,6 +1527,7 @@ def validIdx(idx, array):
 def removeFilename(targetIdx):
     if validIdx(targetIdx, filenames):
         os.remove("uploads/" + filenames[targetIdx])
+        fileChecksums.pop("uploads/" + filenames[targetIdx], None)
         try:
             metafilename = filenames[targetIdx].strip('.')[0] + '.txt'
             os.remove("metadata/" + metafilename)
@@ -527,6 +1554,12 @@ def shiftFilename(target, shift):
 
     swapFilenames(target, target + shift)
 
+def reorderFilenames(order):
+    # Files named in order move to the front in that order, the rest keep their relative order behind them
+    order = [name for name in order if name in filenames]
+    rest = [name for name in filenames if name not in order]
+    filenames[:] = order + rest
+
 def loadFilenames():
     try:
         with open(FILENAMES, 'r') as file:
@@ -566,6 +1599,7 @@ def updateHTML():
 def updateQueueData():
     global queueData
 
+    mqttState['queueChanged'] = True
     count = 0
     queueData = ""
     for name in filenames:
@@ -578,26 +1612,26 @@ def updateQueueData():
         queueData += name + "</label><br>\n"
         count += 1
 
-def singleDownload(upload.body, filename, filesize, boundary, isMetadata):
+def singleDownload(body, filename, filesize, boundary, isMetadata, hasMetadata, metafile):
     print('Small file detected, downloading directly')
     if isMetadata:
         try:
             with open('metadata/' + filename, 'w') as file:
-                file.write(upload.body.read(filesize))
+                file.write(body.read(filesize))
         except UnicodeDecodeError as e:
             print("UnicodeDecodeError: ", e)
             print("Attempting to write to file in binary...")
             with open('metadata/' + filename, 'wb') as file:
-                file.write(bytes(upload.body.read(filesize)))
+                file.write(bytes(body.read(filesize)))
     else:
         try:
             with open('uploads/' + filename, 'w') as file:
-                file.write(upload.body.read(filesize))
+                file.write(body.read(filesize))
         except UnicodeDecodeError as e:
             print("UnicodeDecodeError: ", e)
             print("Attempting to write to file in binary...")
             with open('uploads/' + filename, 'wb') as file:
-                file.write(bytes(upload.body.read(filesize)))
+                file.write(bytes(body.read(filesize)))
         filenames.append(filename)
 
     if hasMetadata:
@@ -614,13 +1648,13 @@ def singleDownload(upload.body, filename, filesize, boundary, isMetadata):
             with open('metadata/' + metafile, 'wb') as newFile:
                 newFile.write(filedata)
 
-def streamDownload(upload.body, filename, filesize, boundary, isMetadata):
+def streamDownload(body, filename, filesize, boundary, isMetadata, hasMetadata, metafile):
     print('Large file detected, streaming')
     bytesRead = 0
     while bytesRead < filesize:
         print("Bytes read so far:", bytesRead)
         if filesize - bytesRead > MAXSIZE:
-            chunk = upload.body.read(chunk)
+            chunk = MAXSIZE
         else:
             chunk = filesize - bytesRead
         print("Chunk size:", chunk)
@@ -628,17 +1662,17 @@ def streamDownload(upload.body, filename, filesize, boundary, isMetadata):
         if bytesRead == 0:
             if isMetadata:
                 with open('metadata/' + filename, 'wb') as file:
-                    file.write(bytes(upload.body.read(chunk)))
+                    file.write(bytes(body.read(chunk)))
             else:
                 with open('uploads/' + filename, 'wb') as file:
-                    file.write(bytes(upload.body.read(chunk)))
+                    file.write(bytes(body.read(chunk)))
         else:
             if isMetadata:
                 with open('metadata/' + filename, 'ab') as file:
-                    file.write(bytes(upload.body.read(chunk)))
+                    file.write(bytes(body.read(chunk)))
             else:
                 with open('uploads/' + filename, 'ab') as file:
-                    file.write(bytes(upload.body.read(chunk)))
+                    file.write(bytes(body.read(chunk)))
 
         bytesRead += chunk
 
@@ -651,8 +1685,8 @@ def getUpload():
     if len(uploadQueue) < 1:
         return
 
-    for idx in range(len(uploadQueue)):
-        upload = uploadQueue[idx]
+    while len(uploadQueue) > 0:
+        upload = uploadQueue.pop(0)
 
         print(upload.body.read())
         upload.body.seek(0)
@@ -660,6 +1694,9 @@ def getUpload():
         boundary = upload.body.readline().strip()
         filename = upload.body.readline().split('filename=')[1].split('"')[1]
         print("Filename: ", filename)
+        if not validUploadName(filename):
+            print("Ignoring upload with an invalid filename:", filename)
+            continue
         upload.body.readline()
         upload.body.readline()
 
@@ -675,7 +1712,7 @@ def getUpload():
         isMetadata = False
         hasMetadata = False
         metafile = ""
-        for jdx in range(len(filenames)):
+        for jdx in range(len(filenames) - 1, -1, -1):
             if filenames[jdx] == filename:
                 print("Duplicate found, removing from list.")
                 filenames.pop(jdx)
@@ -690,45 +1727,238 @@ def getUpload():
                     metafile = filenames[jdx]
 
         if filesize < MAXSIZE:
-            singleDownload(upload.body, filename, filesize, boundary, isMetadata, hasMetadata)
+            singleDownload(upload.body, filename, filesize, boundary, isMetadata, hasMetadata, metafile)
         else:
-            streamDownload(upload.body, filename, filesize, boundary, isMetadata, hasMetadata)
+            streamDownload(upload.body, filename, filesize, boundary, isMetadata, hasMetadata, metafile)
 
         if hasMetadata:
             os.rename(('uploads/' + filename), ('metadata/' + filename))
 
-        uploadQueue.pop(idx)
+        fileChecksums.pop('uploads/' + filename, None)
+        fileChecksums.pop('metadata/' + filename, None)
 
     saveFilenames()
     updateHTML()
     updateQueueData()
     uploadQueueChanged = False
 
+# Helper functions for chunked uploads
+# Protocol: POST /upload/start (filename, size) returns the offset to resume from,
+# PUT /upload/chunk?filename=&offset= appends one chunk straight to uploads/<filename>.part
+# and returns the new offset, POST /upload/finish (filename, checksum) checks the adler-32
+# of the whole file and hands it to the main loop to be added to the queue.
+
+def adler32(data, checksum=1):
+    a = checksum & 0xFFFF
+    b = (checksum >> 16) & 0xFFFF
+    for start in range(0, len(data), ADLER_NMAX):
+        for byte in data[start:(start + ADLER_NMAX)]:
+            a += byte
+            b += a
+        a %= ADLER_MOD
+        b %= ADLER_MOD
+    return (b << 16) | a
+
+def urlDecode(text):
+    text = text.replace('+', ' ')
+    parts = text.split('%')
+    decoded = bytearray(parts[0].encode("utf-8"))
+    for part in parts[1:]:
+        try:
+            decoded.append(int(part[:2], 16))
+            decoded.extend(part[2:].encode("utf-8"))
+        except ValueError:
+            decoded.extend(('%' + part).encode("utf-8"))
+    return str(decoded, "utf-8")
+
+def parseFormData(formdata):
+    fields = {}
+    for option in formdata.split("&"):
+        parameters = option.split("=", 1)
+        if len(parameters) == 2:
+            fields[parameters[0]] = urlDecode(parameters[1])
+    return fields
+
+def validUploadName(filename):
+    # The queue code reads the part after the first '.' as the extension, so there must be exactly one
+    parts = filename.split('.')
+    return len(parts) == 2 and len(parts[0]) > 0 and '/' not in filename and parts[1] in UPLOAD_EXTENSIONS
+
+def partialFilename(filename):
+    return 'uploads/' + filename + PARTIAL_SUFFIX
+
+def startChunkedUpload(filename, filesize):
+    partial = partialFilename(filename)
+    try:
+        offset = os.stat(partial)[6]
+    except OSError:
+        offset = 0
+        with open(partial, 'wb') as file:
+            pass
+
+    if offset > filesize:
+        print("Partial upload of", filename, "is larger than expected, restarting")
+        with open(partial, 'wb') as file:
+            pass
+        offset = 0
+
+    upload = activeUploads.get(filename)
+    if upload is None or upload['offset'] != offset:
+        # Lost track of this upload (e.g. after a reset), so rebuild the checksum from flash
+        checksum = 1
+        with open(partial, 'rb') as file:
+            while True:
+                data = file.read(MAXSIZE)
+                if not data:
+                    break
+                checksum = adler32(data, checksum)
+        upload = {}
+        upload['offset'] = offset
+        upload['checksum'] = checksum
+    upload['size'] = filesize
+    upload['lastWrite'] = getTime()
+    activeUploads[filename] = upload
+    orphanedPartials.pop(filename, None)
+    return offset
+
+def writeChunk(filename, offset, data):
+    upload = activeUploads[filename]
+    if offset != upload['offset']:
+        return False
+    if upload['offset'] + len(data) > upload['size']:
+        raise ValueError("Chunk would write past the end of " + filename)
+    with open(partialFilename(filename), 'ab') as file:
+        file.write(data)
+    upload['offset'] += len(data)
+    upload['checksum'] = adler32(data, upload['checksum'])
+    upload['lastWrite'] = getTime()
+    return True
+
+def cleanPartialUploads():
+    # A partial file that hasn't been written for UPLOAD_TIMEOUT is abandoned. Partials left from before a
+    # reset have no upload in activeUploads, so they get UPLOAD_TIMEOUT from when they were first seen to resume.
+    global nextPartialCleanup
+
+    nextPartialCleanup = getTime() + UPLOAD_CLEANUP_INTERVAL
+    try:
+        names = os.listdir('uploads')
+    except OSError:
+        return
+    for name in names:
+        if not name.endswith(PARTIAL_SUFFIX):
+            continue
+        filename = name[:-len(PARTIAL_SUFFIX)]
+        if filename in activeUploads:
+            lastWrite = activeUploads[filename]['lastWrite']
+        else:
+            lastWrite = orphanedPartials.setdefault(filename, getTime())
+        if getTime() - lastWrite < UPLOAD_TIMEOUT:
+            continue
+        print("Removing abandoned upload", name)
+        try:
+            os.remove('uploads/' + name)
+        except OSError as e:
+            print("Unable to remove", name, "due to", e)
+        activeUploads.pop(filename, None)
+        orphanedPartials.pop(filename, None)
+
+def getFileChecksum(path):
+    if path not in fileChecksums:
+        checksum = 1
+        with open(path, 'rb') as file:
+            while True:
+                data = file.read(MAXSIZE)
+                if not data:
+                    break
+                checksum = adler32(data, checksum)
+        fileChecksums[path] = checksum
+    return fileChecksums[path]
+
+def listFiles(directory, queued):
+    listing = []
+    try:
+        names = os.listdir(directory[:-1])
+    except OSError:
+        return listing
+    for name in names:
+        if name.endswith(PARTIAL_SUFFIX) or (queued and name not in filenames):
+            continue
+        entry = {}
+        entry["name"] = name
+        entry["size"] = os.stat(directory + name)[6]
+        entry["checksum"] = getFileChecksum(directory + name)
+        entry["queued"] = queued
+        listing.append(entry)
+    return listing
+
+def registerUpload(filename):
+    fileChecksums.pop('uploads/' + filename, None)
+    fileChecksums.pop('metadata/' + filename, None)
+    isMetadata = False
+    for jdx in range(len(filenames) - 1, -1, -1):
+        if filenames[jdx] == filename:
+            print("Duplicate found, removing from list.")
+            filenames.pop(jdx)
+        elif filenames[jdx].split('.')[0] == filename.split('.')[0]:
+            print("Newly uploaded file has duplicate name but different extension.")
+            if filename.split('.')[1] == 'txt':
+                print("Treating newly uploaded file as metadata.")
+                isMetadata = True
+            elif filenames[jdx].split('.')[1] == 'txt':
+                print("Treating previous file as metadata.")
+                os.rename(('uploads/' + filenames[jdx]), ('metadata/' + filenames[jdx]))
+                fileChecksums.pop('uploads/' + filenames[jdx], None)
+                fileChecksums.pop('metadata/' + filenames[jdx], None)
+                filenames.pop(jdx)
+
+    if isMetadata:
+        try:
+            os.remove('metadata/' + filename)
+        except OSError:
+            pass
+        os.rename(('uploads/' + filename), ('metadata/' + filename))
+    else:
+        filenames.append(filename)
+
+def handleCompletedUploads():
+    global completedUploadsChanged
+
+    while len(completedUploads) > 0:
+        registerUpload(completedUploads.pop(0))
+
+    saveFilenames()
+    updateHTML()
+    updateQueueData()
+    completedUploadsChanged = False
+
 def handleEdit():
     global editQueueChanged
 
     if len(editQueue) < 1:
         return
 
-    for idx in range(len(editQueue)):
-        options = editQueue[idx]
+    while len(editQueue) > 0:
+        options = editQueue.pop(0)
 
         filename = ""
         action = ""
+        order = ""
 
         for option in options:
             parameters = option.split("=")
             if parameters[0] == "filename":
-                filename = parameters[1]
+                filename = urlDecode(parameters[1])
             elif parameters[0] == "action":
                 action = parameters[1]
+            elif parameters[0] == "order":
+                order = parameters[1]
 
         targetIdx = -1
         for jdx in range(len(filenames)):
             if filenames[jdx] == filename:
                 targetIdx = jdx
 
-        if targetIdx == -1 and not action == "Clear+Queue":
+        if targetIdx == -1 and not action == "Clear+Queue" and not action == "Reorder":
             print("Filename", filename, "not found in handleEdit()!")
             continue
 
@@ -745,8 +1975,10 @@ def handleEdit():
             print("Clearing the Queue")
             while len(filenames) > 0:
                 removeFilename(0)
-
-        editQueue.pop(idx)
+            cleanPartialUploads()
+        elif action == "Reorder":
+            print("Reordering the Queue")
+            reorderFilenames([urlDecode(name) for name in order.split("%2C")])
 
     saveFilenames()
     updateHTML()
@@ -756,7 +1988,18 @@ def handleEdit():
 # Here we create our application, registering the
 # following functions to be called on specific HTTP GET requests routes
 
-web_app = WSGIApp()
+class RecordingWSGIApp(WSGIApp):
+    # Remembers which paths have routes, so /stats only keeps counters for those
+    def __init__(self):
+        super().__init__()
+        self.paths = []
+
+    def route(self, rule, methods=None):
+        if rule not in self.paths:
+            self.paths.append(rule)
+        return super().route(rule, methods)
+
+web_app = RecordingWSGIApp()
 
 @web_app.route("/edit","POST")
 def edit(request):
@@ -770,14 +2013,14 @@ def edit(request):
     for option in options:
         parameters = option.split("=")
         if parameters[0] == "filename":
-            filename = parameters[1]
+            filename = urlDecode(parameters[1])
         elif parameters[0] == "action":
             action = parameters[1]
     targetIdx = -1
     for idx in range(len(filenames)):
         if filenames[idx] == filename:
             targetIdx = idx
-    if targetIdx == -1 and not action == "Clear+Queue":
+    if targetIdx == -1 and not action == "Clear+Queue" and not action == "Reorder":
         print("Filename", filename, "not found!")
     else:
         editQueue.append(options)
@@ -793,9 +2036,64 @@ def upload(request):
     uploadQueueChanged = True
     return ("303 See Other", [], "<meta http-equiv=\"Refresh\" content=\"0; url=/\" />")
 
+@web_app.route("/upload/start","POST")
+def uploadStart(request):
+    fields = parseFormData(request.body.read())
+    filename = fields.get("filename", "")
+    print("Chunked upload start received for: ", filename)
+    if not validUploadName(filename) or not fields.get("size", "").isdigit():
+        return ("400 Bad Request", [("Content-Type","text/plain")], "Invalid filename or size")
+    offset = startChunkedUpload(filename, int(fields["size"]))
+    return ("200 OK", [("Content-Type","text/plain")], str(offset))
+
+@web_app.route("/upload/chunk","PUT")
+def uploadChunk(request):
+    filename = urlDecode(request.query_params.get("filename", ""))
+    offset = request.query_params.get("offset", "")
+    if filename not in activeUploads or not offset.isdigit():
+        return ("404 Not Found", [("Content-Type","text/plain")], "No upload in progress for " + filename)
+    data = request.body.read()
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    try:
+        written = writeChunk(filename, int(offset), data)
+    except ValueError as e:
+        return ("400 Bad Request", [("Content-Type","text/plain")], str(e))
+    if not written:
+        print("Chunk for", filename, "at", offset, "does not match offset", activeUploads[filename]['offset'])
+        return ("409 Conflict", [("Content-Type","text/plain")], str(activeUploads[filename]['offset']))
+    return ("200 OK", [("Content-Type","text/plain")], str(activeUploads[filename]['offset']))
+
+@web_app.route("/upload/finish","POST")
+def uploadFinish(request):
+    global completedUploadsChanged
+    fields = parseFormData(request.body.read())
+    filename = fields.get("filename", "")
+    print("Chunked upload finish received for: ", filename)
+    if filename not in activeUploads:
+        return ("404 Not Found", [("Content-Type","text/plain")], "No upload in progress for " + filename)
+    upload = activeUploads[filename]
+    if upload['offset'] != upload['size']:
+        return ("409 Conflict", [("Content-Type","text/plain")], str(upload['offset']))
+    if fields.get("checksum", "") != str(upload['checksum']):
+        print("Checksum mismatch for", filename, ", discarding upload")
+        os.remove(partialFilename(filename))
+        activeUploads.pop(filename)
+        return ("422 Unprocessable Entity", [("Content-Type","text/plain")], "Checksum mismatch")
+    try:
+        os.remove('uploads/' + filename)
+    except OSError:
+        pass
+    os.rename(partialFilename(filename), 'uploads/' + filename)
+    activeUploads.pop(filename)
+    completedUploads.append(filename)
+    completedUploadsChanged = True
+    return ("200 OK", [("Content-Type","text/plain")], str(upload['offset']))
+
 @web_app.route("/softwareUpdate")
 def checkForSoftwareUpdate(request):
     print("Software update request received of type: ", request.method)
+    cancelFeedFetches()
     websiteData = requests.get(GITHUB_URL).json()[0]['name']
     print("Github returned: ", websiteData)
     currentVersion = ""
@@ -811,6 +2109,40 @@ def checkForSoftwareUpdate(request):
     data +="</p>"
     return ("200 OK", [("Content-Type","text/plain")], data)
 
+@web_app.route("/files")
+def fileListing(request):
+    print("File listing request received of type: ", request.method)
+    listing = {}
+    listing["queue"] = filenames
+    listing["files"] = listFiles('uploads/', True) + listFiles('metadata/', False)
+    return ("200 OK", [("Content-Type","application/json")], json.dumps(listing))
+
+@web_app.route("/stats")
+def statistics(request):
+    print("Statistics request received of type: ", request.method)
+    report = {}
+    report["uptime"] = getTime() - stats['startTime']
+    report["frames"] = stats['frames']
+    report["maxFrameGap"] = stats['maxFrameGap']
+    report["frameGapBuckets"] = FRAME_GAP_BUCKETS
+    report["frameGaps"] = stats['frameGaps']
+    report["peakHeap"] = stats['peakHeap']
+    report["freeHeap"] = gc.mem_free()
+    report["routes"] = {}
+    for path in stats['routes']:
+        count, total, longest = stats['routes'][path]
+        report["routes"][path] = {"count": count, "totalMs": total, "maxMs": longest}
+    report["bitDepth"] = currentBitDepth
+    report["profiles"] = {}
+    for bitDepth in stats['profiles']:
+        frames, seconds = stats['profiles'][bitDepth]
+        if bitDepth == currentBitDepth:
+            seconds += getTime() - stats['profileStart']
+        report["profiles"][str(bitDepth)] = {"frames": frames, "seconds": seconds, "framesPerSecond": frames / seconds if seconds > 0 else 0}
+    if request.query_params.get("reset", "") == "1":
+        resetStats()
+    return ("200 OK", [("Content-Type","application/json")], json.dumps(report))
+
 @web_app.route("/queueUpdate")
 def updateQueue(request):
     global queueData
@@ -833,42 +2165,212 @@ def main_page(request):
         data = file.read()
     return ("200 OK", [("Content-Type","text/html; charset=utf-8")], data)
 
+# Statistics for tools/loadtest.py, read from /stats: time between display refreshes,
+# peak heap use and how long each route takes to service on the board.
+
+def resetStats():
+    stats['startTime'] = getTime()
+    stats['lastFrame'] = getTime()
+    stats['frames'] = 0
+    stats['maxFrameGap'] = 0
+    stats['frameGaps'] = [0 for _ in range(len(FRAME_GAP_BUCKETS) + 1)]
+    stats['peakHeap'] = gc.mem_alloc()
+    stats['routes'] = {}
+    stats['profiles'] = {}
+    stats['profileStart'] = getTime()
+
+def recordProfile(newBitDepth):
+    # Closes out the time spent at the current bit depth before the matrix switches
+    profile = stats['profiles'].setdefault(currentBitDepth, [0, 0])
+    profile[1] += getTime() - stats['profileStart']
+    stats['profileStart'] = getTime()
+    stats['profiles'].setdefault(newBitDepth, [0, 0])
+
+def recordHeap():
+    heap = gc.mem_alloc()
+    if heap > stats['peakHeap']:
+        stats['peakHeap'] = heap
+
+def recordFrame():
+    currentTime = getTime()
+    gap = int((currentTime - stats['lastFrame']) * 1000)
+    stats['lastFrame'] = currentTime
+    stats['frames'] += 1
+    if gap > stats['maxFrameGap']:
+        stats['maxFrameGap'] = gap
+    bucket = 0
+    while bucket < len(FRAME_GAP_BUCKETS) and gap > FRAME_GAP_BUCKETS[bucket]:
+        bucket += 1
+    stats['frameGaps'][bucket] += 1
+    stats['profiles'].setdefault(currentBitDepth, [0, 0])[0] += 1
+
+def recordRoute(path, duration):
+    # Anything else is a 404, and counting every path a client makes up would grow without bound
+    if path not in web_app.paths:
+        return
+    if path not in stats['routes']:
+        stats['routes'][path] = [0, 0, 0]
+    route = stats['routes'][path]
+    duration = int(duration * 1000)
+    route[0] += 1
+    route[1] += duration
+    if duration > route[2]:
+        route[2] = duration
+
+# The stock WSGIServer only looks at one client per update_poll() and closes it after
+# every response, so a single page load is spread over several display frames.
+# This keeps up to MAX_CLIENTS sockets open with HTTP/1.1 keep-alive and keeps servicing
+# whichever socket the ESP32 reports has data until none do or POLL_BUDGET seconds are spent.
+# The firmware reports the first socket with data whether or not we are already tracking it,
+# so requests on kept-alive sockets and new connections both come through socket_available().
+# Once MAX_CLIENTS are kept alive, further connections are answered once and closed.
+
+class KeepAliveWSGIServer(server.WSGIServer):
+    def __init__(self, port, application):
+        super().__init__(port, application=application)
+        self._clients = []
+
+    def update_poll(self):
+        startTime = getTime()
+        while getTime() - startTime < POLL_BUDGET:
+            socknum = esp.socket_available(self._server_sock.socknum)
+            if socknum == NO_SOCKET_AVAIL:
+                break
+            client = self.findClient(socknum)
+            try:
+                if not self.serviceClient(client):
+                    self.closeClient(client)
+            except (OSError, RuntimeError, ValueError) as e:
+                print("Dropping client", socknum, "due to:", e)
+                self.closeClient(client)
+
+        currentTime = getTime()
+        for client in list(self._clients):
+            if currentTime - client['lastActivity'] > KEEPALIVE_TIMEOUT or not client['sock'].connected():
+                self.closeClient(client)
+
+    def findClient(self, socknum):
+        for client in self._clients:
+            if client['sock'].socknum == socknum:
+                return client
+
+        client = {}
+        client['sock'] = socket.socket(socknum=socknum)
+        client['lastActivity'] = getTime()
+        client['keepAlive'] = len(self._clients) < MAX_CLIENTS
+        if client['keepAlive']:
+            self._clients.append(client)
+        return client
+
+    def serviceClient(self, client):
+        sock = client['sock']
+        startTime = getTime()
+        environ = self._get_environ(sock)
+        keepAlive = client['keepAlive'] and environ.get("SERVER_PROTOCOL", "HTTP/1.0") == "HTTP/1.1"
+        if environ.get("HTTP_CONNECTION", "").strip().lower() == "close":
+            keepAlive = False
+
+        result = self.application(environ, self._start_response)
+        if isinstance(result, (str, bytes)):
+            # Iterating a str would send the body one character (and one SPI transaction) at a time
+            result = [result]
+        body = []
+        length = 0
+        for data in result:
+            if not isinstance(data, bytes):
+                data = data.encode("utf-8")
+            body.append(data)
+            length += len(data)
+
+        response = "HTTP/1.1 {0}\r\n".format(self._response_status or "500 ISE")
+        for header in self._response_headers:
+            response += "{0}: {1}\r\n".format(*header)
+        response += "Content-Length: {0}\r\n".format(length)
+        if keepAlive:
+            response += "Connection: keep-alive\r\n"
+            response += "Keep-Alive: timeout={0}\r\n".format(KEEPALIVE_TIMEOUT)
+        else:
+            response += "Connection: close\r\n"
+        response += "\r\n"
+        sock.send(response.encode("utf-8"))
+        for data in body:
+            sock.send(data)
+        client['lastActivity'] = getTime()
+        recordHeap()
+        recordRoute(environ.get("PATH_INFO", ""), client['lastActivity'] - startTime)
+        return keepAlive
+
+    def closeClient(self, client):
+        try:
+            client['sock'].close()
+        except (OSError, RuntimeError) as e:
+            print("Failed to close client socket:", e)
+        if client in self._clients:
+            self._clients.remove(client)
+
 # Here we setup our server, passing in our web_app as the application
 server.set_interface(esp)
-wsgiServer = server.WSGIServer(80, application=web_app)
+wsgiServer = KeepAliveWSGIServer(80, application=web_app)
 
+mainZone = loadLayout()
 ipmessage = ["Website hosted at: " + esp.pretty_ip(esp.ip_address)]
-displayText(ipmessage, 5, 20, 5, True, 0xffffff)
+displayText(mainZone, ipmessage, 5, 20, 5, True, 0xffffff)
 
 print("Starting Webserver!")
+resetStats()
 pinSet = False
 wsgiServer.start()
+try:
+    mqttClient = setupMqtt()
+except (ValueError, MQTT.MMQTTException) as e:
+    print("MQTT control disabled due to: ", e)
+    mqttClient = None
 loadFilenames()
+cleanPartialUploads()
+registerPlaylistFeeds()
 updateHTML()
 updateQueueData()
+
+def mainLoopStep():
+    global pinSet
+
+    recordHeap()
+    gc.collect()
+    for zone in zones:
+        updateDisplayItem(zone)
+    updateDisplayProfile()
+    display.refresh(minimum_frames_per_second=0)
+    recordFrame()
+
+    if uploadQueueChanged:
+        print("Getting upload...")
+        getUpload()
+    updateFeeds()
+
+    if completedUploadsChanged:
+        print("Adding completed uploads...")
+        handleCompletedUploads()
+    if getTime() >= nextPartialCleanup:
+        cleanPartialUploads()
+    if editQueueChanged:
+        print("Editing queue...")
+        handleEdit()
+
+    if not pinSet and dev_pin.value:
+        print("Dev pin disconnected!")
+        pinSet = True
+    elif not dev_pin.value and pinSet:
+        print("Dev pin connected!")
+        pinSet = False
+
+    wsgiServer.update_poll()
+    updateMqtt()
+
 while True:
     # main loop, where the server polls for requests
     try:
-        gc.collect()
-        updateDisplayItem()
-        display.refresh(minimum_frames_per_second=0)
-
-        if uploadQueueChanged:
-            print("Getting upload...")
-            getUpload()
-        if editQueueChanged:
-            print("Editing queue...")
-            handleEdit()
-
-        if not pinSet and dev_pin.value:
-            print("Dev pin disconnected!")
-            pinSet = True
-        elif not dev_pin.value and pinSet:
-            print("Dev pin connected!")
-            pinSet = False
-        
-        wsgiServer.update_poll()
+        mainLoopStep()
     except (ValueError, RuntimeError, ConnectionError) as e:
         print("Failed to update server: ", e)
         traceback.print_exception(e,e,e.__traceback__)
-        continue
\ No newline at end of file
+        continue
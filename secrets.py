@@ -1,4 +1,11 @@
 secrets = {
 	'ssid' : 'PUT SSID HERE',
 	'password' : 'PUT PASSWORD HERE',
+	# Uncomment to control this panel over MQTT
+	# 'mqtt_broker' : 'PUT BROKER ADDRESS HERE',
+	# 'mqtt_port' : 1883,
+	# 'mqtt_username' : 'PUT MQTT USERNAME HERE',
+	# 'mqtt_password' : 'PUT MQTT PASSWORD HERE',
+	# 'mqtt_prefix' : 'matrixportal',
+	# 'mqtt_name' : 'PUT PANEL NAME HERE',
 }
\ No newline at end of file
@@ -0,0 +1,32 @@
+# SPDX-FileCopyrightText: 2022 boBylliB
+# SPDX-License-Identifier: MIT
+
+import os
+import sys
+
+import pytest
+
+TESTS = os.path.dirname(os.path.abspath(__file__))
+REPO = os.path.dirname(TESTS)
+
+# The firmware's code.py shadows the standard library's code module (which pdb imports) when the
+# tests are run from the repository root, so load the real one first
+searchPath = sys.path[:]
+sys.path[:] = [entry for entry in sys.path if os.path.abspath(entry or ".") != REPO]
+import code
+sys.path[:] = searchPath
+
+sys.path.insert(0, TESTS)
+sys.path.insert(0, os.path.join(REPO, "tools"))
+
+import simulator
+
+@pytest.fixture
+def sim(tmp_path):
+    simulation = simulator.Simulator(tmp_path / "panel")
+    yield simulation
+    simulation.close()
+
+@pytest.fixture
+def device(sim):
+    return sim.boot()
@@ -0,0 +1,1338 @@
+# SPDX-FileCopyrightText: 2022 boBylliB
+# SPDX-License-Identifier: MIT
+
+# Host-side stand-ins for the CircuitPython hardware and libraries code.py uses, so the panel firmware
+# can be loaded on a computer and driven by the tests and benchmarks.
+#
+# Simulator(workdir).boot() copies the web page, fonts and version file into workdir, installs the fake
+# modules and runs code.py up to its main loop. The returned Device exposes code.py's globals, so tests
+# call its functions directly and step the main loop with device.mainLoopStep().
+#
+# The fakes follow the CircuitPython 7/8 APIs the panel runs on (Bitmap.blit, display.show, the legacy
+# adafruit_requests.set_socket session, NINA's socket_available) rather than their CPython equivalents.
+#
+# Time comes from a Clock shared by time.monotonic_ns() and supervisor.ticks_ms(). A manual clock only
+# moves when advanced, so tests are repeatable. A real clock follows the host's own elapsed time plus
+# every simulated delay (SPI transfers, blocking connects) without actually sleeping.
+
+import contextlib
+import gc
+import http.client
+import io
+import os
+import re
+import shutil
+import struct
+import sys
+import threading
+import time
+import tracemalloc
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, urlencode, urlsplit
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CODE_FILE = os.path.join(REPO, "code.py")
+MAIN_LOOP = "\nwhile True:\n    # main loop"
+
+TEXT_URL = "http://wifitest.adafruit.com/testwifi/index.html"
+GITHUB_URL = "https://api.github.com/repos/boBylliB/MatrixPortalWIFIUpload/releases"
+
+NO_SOCKET_AVAIL = 255
+MAX_SOCKETS = 10
+MAX_PACKET = 4000
+SOCKET_CLOSED = 0
+SOCKET_ESTABLISHED = 4
+SOCKET_CLOSE_WAIT = 7
+WL_IDLE_STATUS = 0
+WL_CONNECTED = 3
+DEVICE_HEAP = 192 * 1024
+MQTT_CLIENT_ID_MAX = 23
+TICKS_MASK = (1 << 29) - 1
+
+# The simulator currently booted; the fake modules look their state up here
+active = None
+
+class Clock:
+    def __init__(self, manual=True, start=1.0):
+        self.manual = manual
+        self.offset = int(start * 1000000000)
+        self.origin = time.perf_counter_ns()
+
+    def monotonic_ns(self):
+        if self.manual:
+            return self.offset
+        return time.perf_counter_ns() - self.origin + self.offset
+
+    def monotonic(self):
+        return self.monotonic_ns() / 1000000000
+
+    def sleep(self, seconds):
+        self.offset += int(seconds * 1000000000)
+
+    advance = sleep
+
+    def ticks_ms(self):
+        return (self.monotonic_ns() // 1000000) & TICKS_MASK
+
+    @contextlib.contextmanager
+    def blocking(self):
+        # Host calls that block the device (real sockets) count against a manual clock as well
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self.manual:
+                self.sleep(time.perf_counter() - start)
+
+def makeModule(name, **attributes):
+    module = types.ModuleType(name)
+    for key, value in attributes.items():
+        setattr(module, key, value)
+    return module
+
+# displayio, framebufferio and rgbmatrix
+
+class Bitmap:
+    def __init__(self, width, height, value_count):
+        if not isinstance(width, int) or not isinstance(height, int):
+            raise TypeError("Bitmap width and height must be ints")
+        self.width = width
+        self.height = height
+        self.value_count = value_count
+        self.data = bytearray(width * height)
+
+    def _index(self, index):
+        if isinstance(index, tuple):
+            x, y = index
+            if x < 0 or x >= self.width or y < 0 or y >= self.height:
+                raise IndexError("pixel coordinates out of bounds")
+            return y * self.width + x
+        return index
+
+    def __getitem__(self, index):
+        return self.data[self._index(index)]
+
+    def __setitem__(self, index, value):
+        self.data[self._index(index)] = value
+
+    def fill(self, value):
+        self.data[:] = bytes([value]) * len(self.data)
+
+    def blit(self, x, y, source_bitmap, *, x1=0, y1=0, x2=None, y2=None, skip_index=None):
+        # CircuitPython 7/8 clip the destination but reject areas outside the source
+        if x2 is None:
+            x2 = source_bitmap.width
+        if y2 is None:
+            y2 = source_bitmap.height
+        if x1 < 0 or y1 < 0 or x2 > source_bitmap.width or y2 > source_bitmap.height:
+            raise ValueError("out of range of source")
+        for row in range(y1, y2):
+            destY = y + row - y1
+            if destY < 0 or destY >= self.height:
+                continue
+            for col in range(x1, x2):
+                destX = x + col - x1
+                if destX < 0 or destX >= self.width:
+                    continue
+                value = source_bitmap.data[row * source_bitmap.width + col]
+                if skip_index is None or value != skip_index:
+                    self.data[destY * self.width + destX] = value
+
+class Palette:
+    def __init__(self, color_count):
+        self._colors = [0] * color_count
+
+    def __len__(self):
+        return len(self._colors)
+
+    def __getitem__(self, index):
+        return self._colors[index]
+
+    def __setitem__(self, index, value):
+        self._colors[index] = value
+
+    def make_transparent(self, index):
+        pass
+
+class Group:
+    def __init__(self, *, scale=1, x=0, y=0):
+        self.scale = scale
+        self.x = x
+        self.y = y
+        self._layers = []
+
+    def append(self, layer):
+        self._layers.append(layer)
+
+    def insert(self, index, layer):
+        self._layers.insert(index, layer)
+
+    def pop(self, index=-1):
+        return self._layers.pop(index)
+
+    def remove(self, layer):
+        self._layers.remove(layer)
+
+    def index(self, layer):
+        return self._layers.index(layer)
+
+    def __len__(self):
+        return len(self._layers)
+
+    def __getitem__(self, index):
+        return self._layers[index]
+
+    def __iter__(self):
+        return iter(self._layers)
+
+class TileGrid:
+    def __init__(self, bitmap, *, pixel_shader, width=1, height=1, tile_width=None, tile_height=None, default_tile=0, x=0, y=0):
+        if not isinstance(width, int) or not isinstance(height, int):
+            raise TypeError("TileGrid width and height must be ints")
+        if tile_width is None:
+            tile_width = bitmap.width
+        if tile_height is None:
+            tile_height = bitmap.height
+        if tile_width < 1 or bitmap.width % tile_width != 0:
+            raise ValueError("Tile width must exactly divide bitmap width")
+        if tile_height < 1 or bitmap.height % tile_height != 0:
+            raise ValueError("Tile height must exactly divide bitmap height")
+        self.bitmap = bitmap
+        self.pixel_shader = pixel_shader
+        self.width = width
+        self.height = height
+        self.tile_width = tile_width
+        self.tile_height = tile_height
+        self.x = x
+        self.y = y
+        self._tiles = [default_tile] * (width * height)
+
+    def _index(self, index):
+        if isinstance(index, tuple):
+            return index[1] * self.width + index[0]
+        return index
+
+    def __getitem__(self, index):
+        return self._tiles[self._index(index)]
+
+    def __setitem__(self, index, value):
+        tileCount = (self.bitmap.width // self.tile_width) * (self.bitmap.height // self.tile_height)
+        if value < 0 or value >= tileCount:
+            raise ValueError("Tile index out of bounds")
+        self._tiles[self._index(index)] = value
+
+def drawLayer(frame, layer, x, y):
+    if isinstance(layer, Group):
+        for child in layer:
+            drawLayer(frame, child, x + layer.x, y + layer.y)
+        return
+    bitmap = layer.bitmap
+    tilesPerRow = bitmap.width // layer.tile_width
+    originX = x + layer.x
+    originY = y + layer.y
+    for tileIdx in range(len(layer._tiles)):
+        tile = layer._tiles[tileIdx]
+        sourceX = (tile % tilesPerRow) * layer.tile_width
+        sourceY = (tile // tilesPerRow) * layer.tile_height
+        cellX = originX + (tileIdx % layer.width) * layer.tile_width
+        cellY = originY + (tileIdx // layer.width) * layer.tile_height
+        for row in range(layer.tile_height):
+            frameY = cellY + row
+            if frameY < 0 or frameY >= len(frame):
+                continue
+            for col in range(layer.tile_width):
+                frameX = cellX + col
+                if frameX < 0 or frameX >= len(frame[frameY]):
+                    continue
+                value = bitmap.data[(sourceY + row) * bitmap.width + sourceX + col]
+                frame[frameY][frameX] = layer.pixel_shader[value]
+
+class RGBMatrix:
+    def __init__(self, *, width, bit_depth, rgb_pins, addr_pins, clock_pin, latch_pin, output_enable_pin, height=0, tile=1, serpentine=True, doublebuffer=True):
+        if active.matrixFailures > 0:
+            active.matrixFailures -= 1
+            raise MemoryError("memory allocation failed, allocating framebuffer")
+        self.width = width
+        self.height = height or (2 << len(addr_pins))
+        self.bit_depth = bit_depth
+        active.matrices.append(self)
+
+class FramebufferDisplay:
+    def __init__(self, framebuffer, *, rotation=0, auto_refresh=True):
+        self.framebuffer = framebuffer
+        self.width = framebuffer.width
+        self.height = framebuffer.height
+        self.auto_refresh = auto_refresh
+        self.root_group = None
+        self.refreshes = 0
+        active.displays.append(self)
+
+    def show(self, group):
+        self.root_group = group
+
+    def refresh(self, *, target_frames_per_second=None, minimum_frames_per_second=0):
+        self.refreshes += 1
+        if active.refreshTime > 0:
+            active.clock.sleep(active.refreshTime)
+        return True
+
+    def pixels(self):
+        # The colors currently shown, as rows of 0xRRGGBB
+        frame = [[0] * self.width for _ in range(self.height)]
+        if self.root_group is not None:
+            drawLayer(frame, self.root_group, 0, 0)
+        return frame
+
+def releaseDisplays():
+    active.displays.clear()
+
+# adafruit_imageload, for the indexed BMPs the fonts and uploads use
+
+def loadImage(filename, *, bitmap=None, palette=None):
+    with open(filename, 'rb') as file:
+        data = file.read()
+    if data[:2] != b"BM":
+        raise NotImplementedError("Unsupported image format")
+    pixelStart = struct.unpack_from("<I", data, 10)[0]
+    headerSize, width, height, planes, bitsPerPixel, compression = struct.unpack_from("<IiiHHI", data, 14)
+    if compression != 0 or bitsPerPixel > 8:
+        raise NotImplementedError("Only uncompressed indexed BMPs are simulated")
+    colors = struct.unpack_from("<I", data, 46)[0] or (1 << bitsPerPixel)
+    imagePalette = palette(colors)
+    for idx in range(colors):
+        blue, green, red = data[(14 + headerSize + idx * 4):(14 + headerSize + idx * 4 + 3)]
+        imagePalette[idx] = (red << 16) | (green << 8) | blue
+    rowBytes = ((width * bitsPerPixel + 31) // 32) * 4
+    mask = (1 << bitsPerPixel) - 1
+    image = bitmap(width, abs(height), colors)
+    for y in range(abs(height)):
+        sourceRow = y if height < 0 else abs(height) - 1 - y
+        row = data[(pixelStart + sourceRow * rowBytes):(pixelStart + (sourceRow + 1) * rowBytes)]
+        for x in range(width):
+            bit = x * bitsPerPixel
+            image.data[y * width + x] = (row[bit // 8] >> (8 - bitsPerPixel - bit % 8)) & mask
+    return image, imagePalette
+
+def makeImage(rows, colors):
+    # An 8 bit indexed BMP from rows of palette indices and a list of 0xRRGGBB colors
+    width = len(rows[0])
+    rowBytes = ((width + 3) // 4) * 4
+    pixelStart = 14 + 40 + len(colors) * 4
+    data = bytearray(b"BM")
+    data += struct.pack("<IHHI", pixelStart + rowBytes * len(rows), 0, 0, pixelStart)
+    data += struct.pack("<IiiHHIIiiII", 40, width, len(rows), 1, 8, 0, rowBytes * len(rows), 2835, 2835, len(colors), 0)
+    for color in colors:
+        data += bytes(((color & 0xFF), (color >> 8) & 0xFF, (color >> 16) & 0xFF, 0))
+    for row in reversed(rows):
+        data += bytes(row) + bytes(rowBytes - width)
+    return bytes(data)
+
+# ESP32 co-processor and its sockets. Every SPI transaction costs spiTransactionTime plus the bytes
+# moved at spiBytesPerSecond, charged to the clock, which is the simulated SPI cap.
+
+class Connection:
+    def __init__(self, socknum):
+        self.socknum = socknum
+        self.toDevice = bytearray()
+        self.toClient = bytearray()
+        self.deviceOpen = True
+        self.clientOpen = True
+        self.lastWrite = None
+
+class Network:
+    def __init__(self, clock, spiBytesPerSecond=None, spiTransactionTime=0):
+        self.clock = clock
+        self.spiBytesPerSecond = spiBytesPerSecond
+        self.spiTransactionTime = spiTransactionTime
+        self.spiTime = 0
+        self.sockets = {}
+        self.servers = set()
+
+    def transfer(self, size):
+        cost = self.spiTransactionTime
+        if self.spiBytesPerSecond:
+            cost += size / self.spiBytesPerSecond
+        if cost > 0:
+            self.spiTime += cost
+            self.clock.sleep(cost)
+
+    def allocate(self):
+        for socknum in range(MAX_SOCKETS):
+            if socknum not in self.sockets:
+                self.sockets[socknum] = None
+                return socknum
+        raise RuntimeError("No sockets available")
+
+    def connect(self):
+        # A browser or tool on the LAN opens a connection to the panel
+        socknum = self.allocate()
+        connection = Connection(socknum)
+        self.sockets[socknum] = connection
+        return connection
+
+    def connection(self, socknum):
+        connection = self.sockets.get(socknum)
+        if isinstance(connection, Connection):
+            return connection
+        return None
+
+    def available(self, socknum):
+        if socknum in self.servers:
+            # NINA reports the first socket with data, tracked by the caller or not
+            for clientSocknum in sorted(self.sockets):
+                connection = self.connection(clientSocknum)
+                if connection is not None and connection.deviceOpen and len(connection.toDevice) > 0:
+                    return clientSocknum
+            return NO_SOCKET_AVAIL
+        connection = self.connection(socknum)
+        if connection is None or not connection.deviceOpen:
+            return 0
+        return len(connection.toDevice)
+
+    def close(self, socknum):
+        connection = self.connection(socknum)
+        if connection is not None:
+            connection.deviceOpen = False
+        self.servers.discard(socknum)
+        self.sockets.pop(socknum, None)
+
+class ESP_SPIcontrol:
+    def __init__(self, spi, cs_dio, ready_dio, reset_dio, gpio0_dio=None, *, debug=False):
+        self.network = active.network
+        self.status = WL_IDLE_STATUS
+        self.firmware_version = bytearray(b"1.7.4\x00")
+        self.MAC_address = bytearray(b"\xbc\x9a\x78\x56\x34\x12")
+        self.is_connected = False
+        self.ssid = b"simulated"
+        self.rssi = -40
+        self.ip_address = bytes([192, 168, 1, 50])
+        self._debug = debug
+
+    def scan_networks(self):
+        return [{"ssid": self.ssid, "rssi": self.rssi, "encryption": 3}]
+
+    def connect_AP(self, ssid, password, timeout_s=10):
+        self.is_connected = True
+        self.status = WL_CONNECTED
+        return WL_CONNECTED
+
+    def pretty_ip(self, ip):
+        return "%d.%d.%d.%d" % tuple(ip)
+
+    def ping(self, dest, ttl=250):
+        return 1
+
+    def get_socket(self):
+        self.network.transfer(0)
+        return self.network.allocate()
+
+    def start_server(self, port, socket_num, conn_mode=0):
+        self.network.transfer(0)
+        self.network.servers.add(socket_num)
+
+    def socket_available(self, socket_num):
+        self.network.transfer(0)
+        return self.network.available(socket_num)
+
+    def socket_read(self, socket_num, size):
+        connection = self.network.connection(socket_num)
+        data = bytes(connection.toDevice[:size])
+        del connection.toDevice[:size]
+        self.network.transfer(len(data))
+        return data
+
+    def socket_write(self, socket_num, buffer, conn_mode=0):
+        connection = self.network.connection(socket_num)
+        for start in range(0, max(len(buffer), 1), MAX_PACKET):
+            self.network.transfer(len(buffer[start:(start + MAX_PACKET)]))
+        if connection is None or not connection.clientOpen:
+            raise ConnectionError("Failed to send {0} bytes (sent 0)".format(len(buffer)))
+        connection.toClient += buffer
+        connection.lastWrite = active.clock.monotonic()
+
+    def socket_status(self, socket_num):
+        self.network.transfer(0)
+        connection = self.network.connection(socket_num)
+        if connection is None:
+            return SOCKET_CLOSED
+        if connection.clientOpen:
+            return SOCKET_ESTABLISHED
+        return SOCKET_CLOSE_WAIT
+
+    def socket_close(self, socket_num):
+        self.network.transfer(0)
+        self.network.close(socket_num)
+
+class DeviceSocket:
+    def __init__(self, family=2, type=1, proto=0, fileno=None, socknum=None):
+        if socknum is None:
+            socknum = active.esp.get_socket()
+        self._socknum = socknum
+        self._buffer = b""
+        self._timeout = 0
+
+    @property
+    def socknum(self):
+        return self._socknum
+
+    def settimeout(self, value):
+        self._timeout = value
+
+    def send(self, data):
+        active.esp.socket_write(self._socknum, data)
+
+    write = send
+
+    def available(self):
+        if self._socknum != NO_SOCKET_AVAIL:
+            return min(active.esp.socket_available(self._socknum), MAX_PACKET)
+        return 0
+
+    def readline(self, eol=b"\r\n"):
+        while eol not in self._buffer:
+            avail = self.available()
+            if avail:
+                self._buffer += active.esp.socket_read(self._socknum, avail)
+            else:
+                # The real socket spins here until the timeout, nothing more is coming
+                self.close()
+                raise RuntimeError("Didn't receive full response, failing out")
+        line, self._buffer = self._buffer.split(eol, 1)
+        return line
+
+    def recv(self, bufsize=0):
+        if bufsize == 0:
+            avail = self.available()
+            while avail:
+                self._buffer += active.esp.socket_read(self._socknum, avail)
+                avail = self.available()
+            data = self._buffer
+            self._buffer = b""
+            return data
+        while len(self._buffer) < bufsize:
+            avail = self.available()
+            if not avail:
+                break
+            self._buffer += active.esp.socket_read(self._socknum, min(bufsize - len(self._buffer), avail))
+        data = self._buffer[:bufsize]
+        self._buffer = self._buffer[bufsize:]
+        return data
+
+    def connected(self):
+        if self._socknum == NO_SOCKET_AVAIL:
+            return False
+        if self.available():
+            return True
+        result = active.esp.socket_status(self._socknum) == SOCKET_ESTABLISHED
+        if not result:
+            self.close()
+            self._socknum = NO_SOCKET_AVAIL
+        return result
+
+    def close(self):
+        if self._socknum != NO_SOCKET_AVAIL:
+            active.esp.socket_close(self._socknum)
+
+def setInterface(iface):
+    active.esp = iface
+
+# adafruit_esp32spi_wsgiserver. On the board wsgi.input is io.StringIO(bytes): reads give back a str
+# that is the received bytes unchanged, so encode() returns them exactly.
+
+class DeviceStr(str):
+    def __new__(cls, raw):
+        text = super().__new__(cls, bytes(raw).decode("utf-8", "surrogateescape"))
+        text.raw = bytes(raw)
+        return text
+
+    def encode(self, encoding="utf-8", errors="strict"):
+        return self.raw
+
+    def __bytes__(self):
+        return self.raw
+
+class DeviceStringIO:
+    def __init__(self, raw=b""):
+        self._raw = bytes(raw)
+        self._pos = 0
+
+    def read(self, size=-1):
+        end = len(self._raw) if size is None or size < 0 else min(self._pos + size, len(self._raw))
+        data = self._raw[self._pos:end]
+        self._pos = end
+        return DeviceStr(data)
+
+    def readline(self):
+        end = self._raw.find(b"\n", self._pos)
+        end = len(self._raw) if end < 0 else end + 1
+        data = self._raw[self._pos:end]
+        self._pos = end
+        return DeviceStr(data)
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self._pos
+        elif whence == 2:
+            offset += len(self._raw)
+        self._pos = max(0, min(offset, len(self._raw)))
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+class WSGIServer:
+    def __init__(self, port=80, debug=False, application=None):
+        self.application = application
+        self.port = port
+        self._server_sock = DeviceSocket(socknum=NO_SOCKET_AVAIL)
+        self._client_sock = DeviceSocket(socknum=NO_SOCKET_AVAIL)
+        self._debug = debug
+        self._response_status = None
+        self._response_headers = []
+
+    def start(self):
+        self._server_sock = DeviceSocket()
+        active.esp.start_server(self.port, self._server_sock.socknum)
+
+    # The library's own one-request-per-poll loop, kept as the baseline for the benchmarks
+
+    def update_poll(self):
+        client = self.client_available()
+        if client.socknum != NO_SOCKET_AVAIL and client.available():
+            environ = self._get_environ(client)
+            result = self.application(environ, self._start_response)
+            self.finish_response(result)
+
+    def finish_response(self, result):
+        try:
+            response = "HTTP/1.1 {0}\r\n".format(self._response_status or "500 ISE")
+            for header in self._response_headers:
+                response += "{0}: {1}\r\n".format(*header)
+            response += "\r\n"
+            self._client_sock.send(response.encode("utf-8"))
+            for data in result:
+                if isinstance(data, bytes):
+                    self._client_sock.send(data)
+                else:
+                    self._client_sock.send(data.encode("utf-8"))
+        finally:
+            self._client_sock.close()
+            self._client_sock = DeviceSocket(socknum=NO_SOCKET_AVAIL)
+
+    def client_available(self):
+        if self._server_sock.socknum == NO_SOCKET_AVAIL:
+            raise ValueError("Server has not been started, cannot check for clients!")
+        if self._client_sock.socknum != NO_SOCKET_AVAIL and self._client_sock.connected():
+            return self._client_sock
+        socknum = active.esp.socket_available(self._server_sock.socknum)
+        if socknum != NO_SOCKET_AVAIL:
+            self._client_sock = DeviceSocket(socknum=socknum)
+        return self._client_sock
+
+    def _start_response(self, status, response_headers):
+        self._response_status = status
+        self._response_headers = [("Server", "esp32WSGIServer")] + response_headers
+
+    def _get_environ(self, client):
+        env = {}
+        line = str(client.readline(), "utf-8")
+        method, path, ver = line.rstrip("\r\n").split(None, 2)
+        env["wsgi.version"] = (1, 0)
+        env["wsgi.url_scheme"] = "http"
+        env["wsgi.multithread"] = False
+        env["wsgi.multiprocess"] = False
+        env["wsgi.run_once"] = False
+        env["REQUEST_METHOD"] = method
+        env["SCRIPT_NAME"] = ""
+        env["SERVER_NAME"] = str(active.esp.pretty_ip(active.esp.ip_address))
+        env["SERVER_PROTOCOL"] = ver
+        env["SERVER_PORT"] = self.port
+        if path.find("?") >= 0:
+            env["PATH_INFO"] = path.split("?")[0]
+            env["QUERY_STRING"] = path.split("?")[1]
+        else:
+            env["PATH_INFO"] = path
+        headers = {}
+        while True:
+            header = str(client.readline(), "utf-8")
+            if header == "":
+                break
+            title, content = header.split(": ", 1)
+            headers[title.lower()] = content
+        if "content-type" in headers:
+            env["CONTENT_TYPE"] = headers.get("content-type")
+        if "content-length" in headers:
+            env["CONTENT_LENGTH"] = headers.get("content-length")
+            body = client.recv(int(env["CONTENT_LENGTH"]))
+        else:
+            body = client.recv()
+        env["wsgi.input"] = DeviceStringIO(body)
+        for name, value in headers.items():
+            key = "HTTP_" + name.replace("-", "_").upper()
+            if key in env:
+                value = "{0},{1}".format(env[key], value)
+            env[key] = value
+        return env
+
+# adafruit_wsgi
+
+class Request:
+    def __init__(self, environ):
+        self._method = environ["REQUEST_METHOD"]
+        self._path = environ["PATH_INFO"]
+        self._query_params = {}
+        for param in environ.get("QUERY_STRING", "").split("&"):
+            if "=" in param:
+                key, value = param.split("=", 1)
+                self._query_params[key] = value
+            elif len(param) > 0:
+                self._query_params[param] = ""
+        self._headers = {}
+        for key, value in environ.items():
+            match = re.match("HTTP_(.+)", key)
+            if match:
+                self._headers[match.group(1).lower().replace("_", "-")] = value
+        self._body = environ["wsgi.input"]
+        self._wsgi_environ = environ
+
+    method = property(lambda self: self._method)
+    path = property(lambda self: self._path)
+    query_params = property(lambda self: self._query_params)
+    headers = property(lambda self: self._headers)
+    body = property(lambda self: self._body)
+    wsgi_environ = property(lambda self: self._wsgi_environ)
+
+class WSGIApp:
+    def __init__(self):
+        self._routes = []
+        self._variable_re = re.compile("^<([a-zA-Z]+)>$")
+
+    def __call__(self, environ, start_response):
+        request = Request(environ)
+        status = "404 Not Found"
+        headers = []
+        resp_data = []
+        match = self._match_route(request.path, request.method.upper())
+        if match:
+            args, route = match
+            status, headers, resp_data = route["func"](request, *args)
+        start_response(status, headers)
+        return resp_data
+
+    def on_request(self, methods, rule, request_handler):
+        self.add_route(rule, methods, request_handler)
+
+    def route(self, rule, methods=None):
+        if not methods:
+            methods = ["GET"]
+
+        def route_decorator(func):
+            self.add_route(rule, methods, func)
+            return func
+
+        return route_decorator
+
+    def add_route(self, rule, methods, func):
+        regex = "^"
+        for part in rule.split("/"):
+            if self._variable_re.match(part):
+                regex += r"([a-zA-Z0-9\._-]+)\/"
+            else:
+                regex += part + r"\/"
+        regex += "?$"
+        self._routes.append((re.compile(regex), {"methods": methods, "func": func}))
+
+    def _match_route(self, path, method):
+        for matcher, route in self._routes:
+            match = matcher.match(path)
+            if match and method in route["methods"]:
+                return (match.groups(), route)
+        return None
+
+# adafruit_requests, legacy module-level session. URLs in Simulator.canned get a fixed reply, and
+# everything else goes over real sockets, which is how tests reach a local HTTP stub server.
+# Like the real session, a new request closes the previous response.
+
+class FakeResponse:
+    def __init__(self, status_code, headers, body=b"", connection=None, response=None):
+        self.status_code = status_code
+        self.reason = b""
+        self.headers = headers
+        self._body = body
+        self._connection = connection
+        self._response = response
+        self._closed = False
+
+    def _read(self, size):
+        if self._closed:
+            raise RuntimeError("Newer Response closed this one. Use Responses immediately.")
+        if self._response is None:
+            data = self._body[:size]
+            self._body = self._body[size:]
+            return data
+        with active.clock.blocking():
+            try:
+                return self._response.read(size)
+            except http.client.IncompleteRead as e:
+                # The server hung up early; the real library just runs out of bytes
+                return e.partial
+
+    def iter_content(self, chunk_size=1, decode_unicode=False):
+        while True:
+            chunk = self._read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    @property
+    def content(self):
+        data = b""
+        for chunk in self.iter_content(4096):
+            data += chunk
+        return data
+
+    @property
+    def text(self):
+        return str(self.content, "utf-8")
+
+    def json(self):
+        import json
+        return json.loads(self.content)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self._connection is not None:
+            self._connection.close()
+
+def requestsGet(url, headers=None, stream=False, timeout=None, **kwargs):
+    return requestsRequest("GET", url, headers=headers, stream=stream, timeout=timeout, **kwargs)
+
+def requestsRequest(method, url, data=None, json=None, headers=None, stream=False, timeout=60, **kwargs):
+    if active.lastResponse is not None:
+        active.lastResponse.close()
+        active.lastResponse = None
+    active.requestLog.append((method, url, dict(headers or {})))
+    if url in active.canned:
+        status, responseHeaders, body = active.canned[url]
+        response = FakeResponse(status, dict(responseHeaders), body)
+    else:
+        parts = urlsplit(url)
+        if parts.hostname not in ("127.0.0.1", "localhost"):
+            raise OSError("Simulated network has no route to " + str(parts.hostname))
+        with active.clock.blocking():
+            connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=timeout)
+            try:
+                path = parts.path or "/"
+                if parts.query:
+                    path += "?" + parts.query
+                connection.request(method, path, body=data, headers=headers or {})
+                reply = connection.getresponse()
+            except (OSError, http.client.HTTPException) as e:
+                connection.close()
+                raise OSError(str(e)) from e
+        responseHeaders = {}
+        for name, value in reply.getheaders():
+            responseHeaders[name.lower()] = value
+        response = FakeResponse(reply.status, responseHeaders, connection=connection, response=reply)
+    active.lastResponse = response
+    return response
+
+def requestsSetSocket(sock, iface=None):
+    if iface is not None:
+        setInterface(iface)
+
+# adafruit_minimqtt against an in-process Broker
+
+class MMQTTException(Exception):
+    pass
+
+def topicMatches(pattern, topic):
+    patternParts = pattern.split('/')
+    topicParts = topic.split('/')
+    for idx in range(len(patternParts)):
+        if patternParts[idx] == "#":
+            return True
+        if idx >= len(topicParts) or (patternParts[idx] != "+" and patternParts[idx] != topicParts[idx]):
+            return False
+    return len(patternParts) == len(topicParts)
+
+class Broker:
+    def __init__(self, clock):
+        self.clock = clock
+        self.up = True
+        self.connectTime = 3.0
+        self.connects = 0
+        self.clients = []
+        self.retained = {}
+        self.published = []
+
+    def publish(self, topic, message, retain=False):
+        self.published.append((topic, message, retain))
+        if retain:
+            self.retained[topic] = message
+        for client in self.clients:
+            if client._connected and any(topicMatches(pattern, topic) for pattern in client._subscriptions):
+                client._pending.append((topic, message))
+
+class MQTT:
+    def __init__(self, *, broker, port=None, username=None, password=None, client_id=None, is_ssl=None, keep_alive=60, recv_timeout=10, socket_pool=None, ssl_context=None, use_binary_mode=False, socket_timeout=1, connect_retries=5, user_data=None):
+        if recv_timeout <= socket_timeout:
+            raise MMQTTException("recv_timeout must be strictly greater than socket_timeout")
+        if client_id is not None and not 0 < len(client_id.encode("utf-8")) <= MQTT_CLIENT_ID_MAX:
+            raise MMQTTException("MQTT Client ID must be between 1 and 23 bytes")
+        self.broker = broker
+        self.port = port
+        self.client_id = client_id
+        self._socket_timeout = socket_timeout
+        self._connect_retries = connect_retries
+        self._broker = active.broker
+        self._connected = False
+        self._subscriptions = []
+        self._pending = []
+        self._sock = None
+        self.on_message = None
+
+    def connect(self, clean_session=True, host=None, port=None, keep_alive=None):
+        for attempt in range(self._connect_retries):
+            self._broker.connects += 1
+            if self._broker.up:
+                self._connected = True
+                self._subscriptions = []
+                self._sock = MQTTSocket(self)
+                if self not in self._broker.clients:
+                    self._broker.clients.append(self)
+                return 0
+            # The TCP connect blocks until it times out, then the library backs off before retrying
+            self._broker.clock.sleep(self._broker.connectTime)
+            if attempt < self._connect_retries - 1:
+                self._broker.clock.sleep(2 ** attempt)
+        raise MMQTTException("Repeated connect failures")
+
+    def is_connected(self):
+        return self._connected and self._broker.up
+
+    def _checkConnected(self):
+        if not self.is_connected():
+            self._connected = False
+            raise MMQTTException("MiniMQTT is not connected")
+
+    def subscribe(self, topic, qos=0):
+        self._checkConnected()
+        self._subscriptions.append(topic)
+        for retainedTopic, message in self._broker.retained.items():
+            if topicMatches(topic, retainedTopic):
+                self._pending.append((retainedTopic, message))
+
+    def publish(self, topic, msg, retain=False, qos=0):
+        self._checkConnected()
+        self._broker.publish(topic, msg, retain)
+
+    def loop(self, timeout=0):
+        if timeout < self._socket_timeout:
+            raise MMQTTException("loop timeout must be bigger than socket timeout")
+        self._checkConnected()
+        delivered = []
+        while len(self._pending) > 0:
+            topic, message = self._pending.pop(0)
+            delivered.append(topic)
+            if self.on_message is not None:
+                self.on_message(self, topic, message)
+        # With nothing left to read, the socket read waits out the timeout
+        self._broker.clock.sleep(timeout)
+        return delivered or None
+
+    def disconnect(self):
+        self._connected = False
+        self._sock = None
+
+class MQTTSocket:
+    # The legacy ESP32SPI socket minimqtt keeps as _sock; available() asks the ESP32 over SPI
+    def __init__(self, client):
+        self.client = client
+
+    def available(self):
+        active.network.transfer(0)
+        return sum(len(topic) + len(message) + 4 for topic, message in self.client._pending)
+
+def mqttSetSocket(sock, iface=None):
+    if iface is not None:
+        setInterface(iface)
+
+# gc.mem_alloc()/mem_free() are MicroPython only; on the host they report tracemalloc's count
+
+def memAlloc():
+    if tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[0]
+    return 0
+
+def memFree():
+    return DEVICE_HEAP - memAlloc()
+
+class DigitalInOut:
+    def __init__(self, pin):
+        self.pin = pin
+        self.value = False
+        self.direction = None
+        self.pull = None
+
+    def deinit(self):
+        pass
+
+class Device:
+    # code.py's globals, as attributes
+    def __init__(self, namespace):
+        object.__setattr__(self, "namespace", namespace)
+
+    def __getattr__(self, name):
+        try:
+            return self.namespace[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __setattr__(self, name, value):
+        self.namespace[name] = value
+
+class HostClient:
+    # A browser or tool on the LAN, talking to the panel through the simulated ESP32 sockets
+    def __init__(self, sim):
+        self.sim = sim
+        self.connection = None
+        self.sentAt = None
+        self.latency = None
+
+    def send(self, method, path, body=b"", headers=None, keepAlive=True):
+        if self.connection is None or not self.connection.deviceOpen:
+            self.close()
+            self.connection = self.sim.network.connect()
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        lines = [method + " " + path + " HTTP/1.1", "Host: 192.168.1.50"]
+        for name, value in (headers or {}).items():
+            lines.append(name + ": " + str(value))
+        if len(body) > 0 or method in ("POST", "PUT"):
+            lines.append("Content-Length: " + str(len(body)))
+        if not keepAlive:
+            lines.append("Connection: close")
+        self.connection.toDevice += ("\r\n".join(lines) + "\r\n\r\n").encode("utf-8") + body
+        self.sentAt = self.sim.clock.monotonic()
+
+    def poll(self):
+        # The whole response once it has arrived, otherwise None
+        connection = self.connection
+        if connection is None:
+            raise ConnectionError("Not connected")
+        data = connection.toClient
+        headerEnd = data.find(b"\r\n\r\n")
+        if headerEnd < 0:
+            if not connection.deviceOpen:
+                self.close()
+                raise ConnectionError("Panel closed the connection without replying")
+            return None
+        lines = bytes(data[:headerEnd]).decode("utf-8").split("\r\n")
+        status = int(lines[0].split(" ")[1])
+        headers = {}
+        for line in lines[1:]:
+            name, value = line.split(": ", 1)
+            headers[name.lower()] = value
+        if "content-length" in headers:
+            end = headerEnd + 4 + int(headers["content-length"])
+        elif connection.deviceOpen:
+            # Without a length the body runs until the panel closes the connection
+            return None
+        else:
+            end = len(data)
+        if len(data) < end:
+            if not connection.deviceOpen:
+                self.close()
+                raise ConnectionError("Panel closed the connection mid-response")
+            return None
+        body = bytes(data[(headerEnd + 4):end])
+        del data[:end]
+        self.latency = connection.lastWrite - self.sentAt
+        if headers.get("connection", "") == "close" or not connection.deviceOpen:
+            self.close()
+        return status, headers, body
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.clientOpen = False
+        self.connection = None
+
+class Simulator:
+    def __init__(self, workdir, clock=None, secrets=None, spiBytesPerSecond=None, spiTransactionTime=0, quiet=True):
+        self.workdir = str(workdir)
+        self.clock = clock or Clock()
+        self.secrets = {"ssid": "simulated", "password": "simulated"}
+        self.secrets.update(secrets or {})
+        self.network = Network(self.clock, spiBytesPerSecond, spiTransactionTime)
+        self.broker = Broker(self.clock)
+        self.esp = None
+        self.quiet = quiet
+        self.refreshTime = 0
+        # When set, requests are answered by whole main loop steps rather than just the server poll
+        self.fullLoop = False
+        self.matrixFailures = 0
+        self.matrices = []
+        self.displays = []
+        self.lastResponse = None
+        self.requestLog = []
+        self.canned = {}
+        self.canned[TEXT_URL] = (200, {"content-type": "text/html"}, b"This is a test of Adafruit WiFi!")
+        self.canned[GITHUB_URL] = (200, {"content-type": "application/json"}, b'[{"name": "0.0.0: simulated"}]')
+        self.device = None
+        self.client = HostClient(self)
+        self._savedModules = {}
+        self._savedCwd = None
+        self._installed = False
+        for name in ("web", "bitmapfonts"):
+            shutil.copytree(os.path.join(REPO, name), os.path.join(self.workdir, name), dirs_exist_ok=True)
+        shutil.copy(os.path.join(REPO, "version.txt"), self.workdir)
+        for name in ("uploads", "metadata"):
+            os.makedirs(os.path.join(self.workdir, name), exist_ok=True)
+
+    def path(self, name):
+        return os.path.join(self.workdir, name)
+
+    def writeFile(self, name, data):
+        os.makedirs(os.path.dirname(self.path(name)) or self.workdir, exist_ok=True)
+        with open(self.path(name), 'wb' if isinstance(data, bytes) else 'w') as file:
+            file.write(data)
+
+    def readFile(self, name):
+        with open(self.path(name), 'rb') as file:
+            return file.read()
+
+    def modules(self):
+        modules = {}
+        modules["board"] = makeModule("board", __getattr__=lambda name: "board." + name)
+        modules["digitalio"] = makeModule("digitalio", DigitalInOut=DigitalInOut,
+                                          Direction=types.SimpleNamespace(INPUT=0, OUTPUT=1),
+                                          Pull=types.SimpleNamespace(UP=1, DOWN=2))
+        modules["busio"] = makeModule("busio", SPI=lambda clock, MOSI=None, MISO=None: ("SPI", clock, MOSI, MISO))
+        modules["supervisor"] = makeModule("supervisor", ticks_ms=self.clock.ticks_ms)
+        modules["time"] = makeModule("time", monotonic_ns=self.clock.monotonic_ns, monotonic=self.clock.monotonic,
+                                     sleep=self.clock.sleep, time=time.time, localtime=time.localtime)
+        modules["displayio"] = makeModule("displayio", Bitmap=Bitmap, Palette=Palette, Group=Group, TileGrid=TileGrid,
+                                          release_displays=releaseDisplays)
+        modules["framebufferio"] = makeModule("framebufferio", FramebufferDisplay=FramebufferDisplay)
+        modules["rgbmatrix"] = makeModule("rgbmatrix", RGBMatrix=RGBMatrix)
+        modules["adafruit_display_text.label"] = makeModule("adafruit_display_text.label", Label=object)
+        modules["adafruit_display_text"] = makeModule("adafruit_display_text", label=modules["adafruit_display_text.label"])
+        modules["adafruit_bitmap_font.bitmap_font"] = makeModule("adafruit_bitmap_font.bitmap_font", load_font=None)
+        modules["adafruit_bitmap_font"] = makeModule("adafruit_bitmap_font", bitmap_font=modules["adafruit_bitmap_font.bitmap_font"])
+        modules["adafruit_imageload"] = makeModule("adafruit_imageload", load=loadImage)
+        modules["adafruit_requests"] = makeModule("adafruit_requests", get=requestsGet, request=requestsRequest, set_socket=requestsSetSocket)
+
+        socketModule = makeModule("adafruit_esp32spi.adafruit_esp32spi_socket", socket=DeviceSocket, set_interface=setInterface,
+                                  AF_INET=2, SOCK_STREAM=1, NO_SOCKET_AVAIL=NO_SOCKET_AVAIL, MAX_PACKET=MAX_PACKET)
+        wsgiModule = makeModule("adafruit_esp32spi.adafruit_esp32spi_wsgiserver", WSGIServer=WSGIServer, set_interface=setInterface,
+                                socket=socketModule, NO_SOCK_AVAIL=NO_SOCKET_AVAIL)
+        espModule = makeModule("adafruit_esp32spi.adafruit_esp32spi", ESP_SPIcontrol=ESP_SPIcontrol, WL_IDLE_STATUS=WL_IDLE_STATUS,
+                               WL_CONNECTED=WL_CONNECTED)
+        modules["adafruit_esp32spi.adafruit_esp32spi_socket"] = socketModule
+        modules["adafruit_esp32spi.adafruit_esp32spi_wsgiserver"] = wsgiModule
+        modules["adafruit_esp32spi.adafruit_esp32spi"] = espModule
+        modules["adafruit_esp32spi"] = makeModule("adafruit_esp32spi", __path__=[], adafruit_esp32spi=espModule,
+                                                  adafruit_esp32spi_socket=socketModule, adafruit_esp32spi_wsgiserver=wsgiModule)
+
+        mqttModule = makeModule("adafruit_minimqtt.adafruit_minimqtt", MQTT=MQTT, MMQTTException=MMQTTException, set_socket=mqttSetSocket)
+        modules["adafruit_minimqtt.adafruit_minimqtt"] = mqttModule
+        modules["adafruit_minimqtt"] = makeModule("adafruit_minimqtt", __path__=[], adafruit_minimqtt=mqttModule)
+        wsgiAppModule = makeModule("adafruit_wsgi.wsgi_app", WSGIApp=WSGIApp, Request=Request)
+        modules["adafruit_wsgi.wsgi_app"] = wsgiAppModule
+        modules["adafruit_wsgi"] = makeModule("adafruit_wsgi", __path__=[], wsgi_app=wsgiAppModule)
+        modules["secrets"] = makeModule("secrets", secrets=self.secrets)
+        return modules
+
+    def install(self):
+        global active
+        active = self
+        for name, module in self.modules().items():
+            self._savedModules[name] = sys.modules.get(name)
+            sys.modules[name] = module
+        self._savedGc = {name: getattr(gc, name, None) for name in ("mem_alloc", "mem_free")}
+        gc.mem_alloc = memAlloc
+        gc.mem_free = memFree
+        self._savedCwd = os.getcwd()
+        os.chdir(self.workdir)
+        self._installed = True
+
+    def activate(self):
+        # Makes this simulator the one the fakes use again, for tests that boot several panels
+        global active
+        active = self
+        os.chdir(self.workdir)
+
+    def boot(self):
+        if not self._installed:
+            self.install()
+        with open(CODE_FILE, 'r') as file:
+            source = file.read()
+        setup = source[:source.rindex(MAIN_LOOP)]
+        namespace = {"__name__": "code", "__file__": CODE_FILE}
+        try:
+            with self.output():
+                exec(compile(setup, CODE_FILE, "exec"), namespace)
+        finally:
+            # Only code.py keeps the simulated clock as its time module
+            self._restoreModule("time")
+        self.device = Device(namespace)
+        return self.device
+
+    @contextlib.contextmanager
+    def output(self):
+        if self.quiet:
+            with contextlib.redirect_stdout(io.StringIO()):
+                yield
+        else:
+            yield
+
+    def step(self, count=1):
+        # Runs the main loop body the way the board's while True loop does, errors included
+        with self.output():
+            for _ in range(count):
+                try:
+                    self.device.mainLoopStep()
+                except (ValueError, RuntimeError, ConnectionError) as e:
+                    print("Failed to update server: ", e)
+
+    def request(self, method, path, body=b"", headers=None, client=None, maxPolls=100):
+        client = client or self.client
+        client.send(method, path, body, headers)
+        for _ in range(maxPolls):
+            if self.fullLoop:
+                self.step()
+            else:
+                with self.output():
+                    self.device.wsgiServer.update_poll()
+            response = client.poll()
+            if response is not None:
+                return response
+        raise TimeoutError("No response to " + method + " " + path)
+
+    def post(self, path, fields, client=None):
+        headers = {"Content-Type": "application/x-www-form-urlencoded"}
+        return self.request("POST", path, urlencode(fields), headers, client)
+
+    def _restoreModule(self, name):
+        if name not in self._savedModules:
+            return
+        saved = self._savedModules.pop(name)
+        if saved is None:
+            sys.modules.pop(name, None)
+        else:
+            sys.modules[name] = saved
+
+    def close(self):
+        global active
+        if not self._installed:
+            return
+        if self.lastResponse is not None:
+            self.lastResponse.close()
+        for name in list(self._savedModules):
+            self._restoreModule(name)
+        for name, value in self._savedGc.items():
+            if value is None:
+                delattr(gc, name)
+            else:
+                setattr(gc, name, value)
+        os.chdir(self._savedCwd)
+        self._installed = False
+        if active is self:
+            active = None
+
+# The browser side of the chunked upload protocol, following web/scripts/main.js: ask the panel where
+# to resume, send CHUNK_SIZE pieces, restart from /upload/start after any error. With lossRate > 0 that
+# fraction of requests never reaches the panel and the same fraction of replies never comes back.
+
+UPLOAD_CHUNK_SIZE = 4096
+UPLOAD_MAX_RETRIES = 10
+
+def lossyRequest(sim, rng, lossRate, method, path, body=b"", headers=None):
+    if rng is not None and rng.random() < lossRate:
+        return None
+    try:
+        reply = sim.request(method, path, body, headers)
+    except (TimeoutError, ConnectionError):
+        return None
+    if rng is not None and rng.random() < lossRate:
+        # The reply was lost, the browser only sees a failed request
+        sim.client.close()
+        return None
+    return reply
+
+def uploadFile(sim, name, data, rng=None, lossRate=0, chunkSize=UPLOAD_CHUNK_SIZE, maxRetries=UPLOAD_MAX_RETRIES):
+    import zlib
+    checksum = zlib.adler32(data)
+    formHeaders = {"Content-Type": "application/x-www-form-urlencoded"}
+    retries = 0
+    while retries <= maxRetries:
+        reply = lossyRequest(sim, rng, lossRate, "POST", "/upload/start", urlencode({"filename": name, "size": len(data)}), formHeaders)
+        if reply is None or reply[0] != 200:
+            retries += 1
+            continue
+        offset = int(reply[2])
+        while offset < len(data):
+            path = "/upload/chunk?filename=" + quote(name) + "&offset=" + str(offset)
+            reply = lossyRequest(sim, rng, lossRate, "PUT", path, data[offset:(offset + chunkSize)], {"Content-Type": "application/octet-stream"})
+            if reply is None or reply[0] not in (200, 409):
+                break
+            offset = int(reply[2])
+            retries = 0
+        else:
+            reply = lossyRequest(sim, rng, lossRate, "POST", "/upload/finish", urlencode({"filename": name, "checksum": checksum}), formHeaders)
+            if reply is not None and reply[0] == 200:
+                return True
+        retries += 1
+    return False
+
+# Booted panels served over real HTTP on 127.0.0.1, for host tools such as tools/fleetsync.py.
+# The fakes only follow one simulator at a time, so requests to all of the panels take turns.
+
+class PanelRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def forward(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        headers = {}
+        for name, value in self.headers.items():
+            if name.lower() not in ("host", "content-length", "connection", "accept-encoding"):
+                headers[name] = value
+        with PanelServer.lock:
+            self.server.sim.activate()
+            self.server.requests.append((self.command, self.path))
+            status, replyHeaders, replyBody = self.server.sim.request(self.command, self.path, body, headers)
+        self.send_response(status)
+        for name, value in replyHeaders.items():
+            if name not in ("content-length", "connection"):
+                self.send_header(name, value)
+        self.send_header("Content-Length", str(len(replyBody)))
+        self.end_headers()
+        self.wfile.write(replyBody)
+
+    do_GET = forward
+    do_POST = forward
+    do_PUT = forward
+
+    def log_message(self, format, *args):
+        pass
+
+class PanelServer:
+    lock = threading.Lock()
+
+    def __init__(self, sim):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), PanelRequestHandler)
+        self.server.daemon_threads = True
+        self.server.sim = sim
+        self.server.requests = []
+        self.address = "127.0.0.1:" + str(self.server.server_address[1])
+        self.requests = self.server.requests
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,78 @@
+# SPDX-FileCopyrightText: 2022 boBylliB
+# SPDX-License-Identifier: MIT
+
+import simulator
+
+def showImage(sim, device, colors):
+    sim.writeFile("uploads/photo.bmp", simulator.makeImage([list(range(len(colors)))], colors))
+    zone = device.zones[0]
+    device.displayImagefile(zone, "uploads/photo.bmp")
+    return zone
+
+def test_depth_per_color(device):
+    assert device.colorBitDepth(0xFFFFFF) == 1
+    assert device.colorBitDepth(0xFF0000) == 1
+    assert device.colorBitDepth(0x808080) == 5
+    assert device.colorBitDepth(0x000400) == device.MAX_BIT_DEPTH
+    # The framebuffer is RGB565: red and blue below 8 are black at every depth, and never need 6 bits
+    assert device.colorBitDepth(0x070007) == 1
+    assert max(device.colorBitDepth((value << 16) | value) for value in range(256)) == 5
+    # Every depth up to the maximum is needed by some color
+    depths = set(device.colorBitDepth(value * 0x010101) for value in range(256))
+    assert depths == set(range(device.MIN_BIT_DEPTH, device.MAX_BIT_DEPTH + 1))
+    assert device.paletteBitDepth([0xFFFFFF, 0x000000, 0x808080]) == 5
+
+def test_depth_per_content_type(sim, device):
+    zone = device.zones[0]
+    device.displayText(zone, ["plain"], 10, 5, 30, False, 0xFF0000)
+    assert zone['item']['bitDepth'] == 1
+    device.displayText(zone, ["fade"], 10, 5, 30, False, 0xFF0000, "gradient", 2, 0x0000FF)
+    assert zone['item']['bitDepth'] == device.textBitDepth(zone['item'], 0xFF0000) > 1
+    device.displayText(zone, ["pulse"], 10, 5, 30, False, 0xFF0000, "pulse", 2, 0x000000)
+    assert zone['item']['bitDepth'] == device.paletteBitDepth(zone['item']['effectTable'])
+
+    showImage(sim, device, [0x000000, 0xFFFFFF])
+    assert zone['item']['bitDepth'] == 1
+    showImage(sim, device, [0x000400, 0x405060])
+    assert zone['item']['bitDepth'] == device.MAX_BIT_DEPTH
+
+def test_depth_only_drops_after_the_dwell(sim, device):
+    zone = device.zones[0]
+    showImage(sim, device, [0x000400, 0x405060])
+    device.updateDisplayProfile()
+    assert device.currentBitDepth == device.MAX_BIT_DEPTH
+    built = len(sim.matrices)
+
+    # Alternating with plain text keeps the deeper matrix
+    for _ in range(5):
+        device.displayText(zone, ["plain"], 10, 5, 30, False, 0xFF0000)
+        device.updateDisplayProfile()
+        sim.clock.advance(device.BIT_DEPTH_DWELL / 10)
+        showImage(sim, device, [0x000400, 0x405060])
+        device.updateDisplayProfile()
+    assert device.currentBitDepth == device.MAX_BIT_DEPTH
+    assert len(sim.matrices) == built
+
+    device.displayText(zone, ["plain"], 10, 5, 30, False, 0xFF0000)
+    device.updateDisplayProfile()
+    sim.clock.advance(device.BIT_DEPTH_DWELL)
+    device.updateDisplayProfile()
+    assert device.currentBitDepth == 1
+    assert sim.matrices[-1].bit_depth == 1
+
+def test_out_of_memory_keeps_the_current_matrix(sim, device):
+    zone = device.zones[0]
+    showImage(sim, device, [0x000400, 0x405060])
+    sim.matrixFailures = 1
+    device.updateDisplayProfile()
+    assert device.currentBitDepth == device.DEFAULT_BIT_DEPTH
+    assert device.matrix.bit_depth == device.DEFAULT_BIT_DEPTH
+    assert device.display.framebuffer is device.matrix
+    assert device.display.root_group is device.displayGroup
+
+    # No retry until the dwell has passed
+    device.updateDisplayProfile()
+    assert device.currentBitDepth == device.DEFAULT_BIT_DEPTH
+    sim.clock.advance(device.BIT_DEPTH_DWELL)
+    device.updateDisplayProfile()
+    assert device.currentBitDepth == device.MAX_BIT_DEPTH
@@ -0,0 +1,74 @@
+# SPDX-FileCopyrightText: 2022 boBylliB
+# SPDX-License-Identifier: MIT
+
+import tracemalloc
+
+import pytest
+
+WRAPPED = "aaaa bbbb cccc dddd eeee ffff"
+
+def showText(device, message, wordWrap, effect, color=0xFF0000, effectColor=0x0000FF):
+    zone = device.zones[0]
+    device.displayText(zone, [message], 10, 5, 30, wordWrap, color, effect, 2, effectColor)
+    return zone
+
+def rowColors(device):
+    # The set of lit colors in each band of 10 pixel rows
+    frame = device.display.pixels()
+    bands = []
+    for top in range(0, len(frame), 10):
+        colors = set()
+        for row in frame[top:top + 10]:
+            colors.update(color for color in row if color != 0)
+        bands.append(colors)
+    return bands
+
+def test_gradient_is_static_and_shaded_per_row(sim, device):
+    zone = showText(device, WRAPPED, True, "gradient")
+    bands = rowColors(device)
+    assert bands[0] == {0xFF0000}
+    assert bands[2] == {0x0000FF}
+    assert len(bands[1]) == 1 and bands[1] != bands[0] and bands[1] != bands[2]
+    assert zone['item']['effectTable'] is None
+
+    for _ in range(10):
+        sim.clock.advance(0.1)
+        device.updateDisplayItem(zone)
+        assert rowColors(device) == bands
+
+def test_gradient_without_word_wrap_shades_each_line(device):
+    zone = device.zones[0]
+    device.displayText(zone, ["one", "two", "three"], 10, 5, 30, False, 0xFF0000, "gradient", 2, 0x0000FF)
+    shades = [line[0].pixel_shader[0] for line in zone['item']['lines']]
+    assert shades == [0xFF0000, 0x7F007F, 0x0000FF]
+
+def test_pulse_changes_over_time(sim, device):
+    zone = showText(device, "pulse", False, "pulse", effectColor=0x000000)
+    first = rowColors(device)
+    sim.clock.advance(0.5)
+    device.updateDisplayItem(zone)
+    assert rowColors(device) != first
+
+@pytest.mark.parametrize("effect", ["rainbow", "pulse", "blink"])
+def test_effects_do_not_allocate_per_frame(sim, device, effect):
+    zone = showText(device, WRAPPED, True, effect)
+    device.updateDisplayItem(zone)
+    codeFilter = [tracemalloc.Filter(True, "*code.py")]
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot().filter_traces(codeFilter)
+        peak = 0
+        for _ in range(200):
+            sim.clock.advance(0.01)
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+            device.updateDisplayItem(zone)
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - current)
+        after = tracemalloc.take_snapshot().filter_traces(codeFilter)
+    finally:
+        tracemalloc.stop()
+
+    # Host ints are heap objects, so a frame may briefly hold a few; rebuilding a palette or TileGrid
+    # would show up as kilobytes here and as memory still held by code.py afterwards
+    assert peak < 512
+    assert sum(stat.size_diff for stat in after.compare_to(before, "filename")) <= 0
@@ -0,0 +1,183 @@
+# SPDX-FileCopyrightText: 2022 boBylliB
+# SPDX-License-Identifier: MIT
+
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+FEED = "uploads/news.feed"
+
+class StubHandler(BaseHTTPRequestHandler):
+    # Each path maps to (status, headers, body, delay); a Content-Length header longer than the body
+    # makes the stub hang up early, and an If-None-Match matching the route's ETag gets a 304
+    def do_GET(self):
+        self.server.requests.append((self.path, dict(self.headers)))
+        status, headers, body, delay = self.server.routes[self.path]
+        time.sleep(delay)
+        if "ETag" in headers and self.headers.get("If-None-Match") == headers["ETag"]:
+            status, headers, body = 304, {}, b""
+        try:
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            if "Content-Length" not in headers:
+                self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def stub():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    server.routes = {}
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def writeFeed(sim, stub, path, extract="text"):
+    url = "http://127.0.0.1:" + str(stub.server_address[1]) + path
+    sim.writeFile(FEED, "url=" + url + "\nrefresh=30\nextract=" + extract + "\n")
+
+def fetch(device, maxSteps=200):
+    # Runs updateFeeds until the feed is idle again
+    feed = device.registerFeed(FEED)
+    device.updateFeeds()
+    for _ in range(maxSteps):
+        if feed['state'] == "idle":
+            return feed
+        device.updateFeeds()
+    raise TimeoutError("Feed fetch never finished")
+
+def cachedText(sim):
+    return sim.readFile("feeds/news.cache").decode("utf-8").split('\n', 2)[2]
+
+def test_extract_feed_text(device):
+    body = json.dumps({"weather": {"days": [{"summary": "Sunny"}]}})
+    assert device.extractFeedText("json:weather.days.0.summary", body) == "Sunny"
+    assert device.extractFeedText("between:<b>|</b>", "x<b> Hot </b>y") == "Hot"
+    assert device.extractFeedText("text", "  plain \n") == "plain"
+    with pytest.raises(ValueError):
+        device.extractFeedText("between:<b>|</b>", "no markers")
+
+def test_feed_body_complete(device):
+    feed = {"extract": "between:<b>|</b>", "body": b"x" * 100}
+    assert not device.feedBodyComplete(feed)
+    assert feed['body'] == b"xxx"
+    feed['body'] += b"<b>news</b>"
+    assert device.feedBodyComplete(feed)
+
+    feed = {"extract": "text", "body": b"x" * (device.FEED_MAXSIZE + 10)}
+    assert device.feedBodyComplete(feed)
+    assert len(feed['body']) == device.FEED_MAXSIZE
+    with pytest.raises(ValueError):
+        device.feedBodyComplete({"extract": "json:a", "body": b"x" * (device.FEED_MAXSIZE + 1)})
+
+def test_fetch_caches_text_and_honours_304(sim, device, stub):
+    stub.routes["/news"] = (200, {"ETag": '"v1"'}, b"Big news today", 0)
+    writeFeed(sim, stub, "/news")
+    feed = fetch(device)
+    assert cachedText(sim) == "Big news today\n"
+
+    stub.routes["/news"] = (304, {}, b"", 0)
+    feed['nextFetch'] = device.getTime()
+    fetch(device)
+    assert stub.requests[-1][1]["If-None-Match"] == '"v1"'
+    assert cachedText(sim) == "Big news today\n"
+
+def test_slow_server_times_out_and_backs_off(sim, device, stub):
+    device.FEED_TIMEOUT = 0.2
+    stub.routes["/slow"] = (200, {}, b"too late", 0.5)
+    writeFeed(sim, stub, "/slow")
+    delays = []
+    for _ in range(3):
+        feed = fetch(device)
+        delays.append(feed['nextFetch'] - device.getTime())
+        feed['nextFetch'] = device.getTime()
+    assert [round(delay) for delay in delays] == [30, 60, 120]
+    assert not os.path.exists(sim.path("feeds/news.cache"))
+
+def test_large_body_is_read_in_chunks_and_trimmed(sim, device, stub):
+    stub.routes["/large"] = (200, {}, b"a" * 20000, 0)
+    writeFeed(sim, stub, "/large")
+    feed = device.registerFeed(FEED)
+    steps = 0
+    while steps == 0 or feed['state'] == "reading":
+        device.updateFeeds()
+        steps += 1
+    # One tick to connect, then one FEED_CHUNK_SIZE read per tick until FEED_MAXSIZE is passed
+    assert steps == 1 + device.FEED_MAXSIZE // device.FEED_CHUNK_SIZE + 1
+    assert cachedText(sim) == "a" * device.FEED_MAXSIZE + "\n"
+
+def test_truncated_body_is_not_cached(sim, device, stub):
+    stub.routes["/cut"] = (200, {"Content-Length": "1000"}, b"partial", 0)
+    writeFeed(sim, stub, "/cut")
+    feed = fetch(device)
+    assert feed['failures'] == 1
+    assert not os.path.exists(sim.path("feeds/news.cache"))
+
+def test_software_update_cancels_a_feed_fetch(sim, device, stub):
+    stub.routes["/long"] = (200, {}, b"b" * 1000, 0)
+    writeFeed(sim, stub, "/long")
+    feed = device.registerFeed(FEED)
+    device.updateFeeds()
+    device.updateFeeds()
+    assert feed['state'] == "reading"
+
+    status, headers, body = sim.request("GET", "/softwareUpdate")
+    assert status == 200
+    assert feed['state'] == "idle"
+    assert feed['failures'] == 0
+    assert not os.path.exists(sim.path("feeds/news.cache"))
+
+    fetch(device)
+    assert cachedText(sim) == "b" * 1000 + "\n"
+
+def test_large_text_is_trimmed_on_a_character_boundary(sim, device, stub):
+    stub.routes["/euro"] = (200, {}, "€".encode("utf-8") * 3000, 0)
+    writeFeed(sim, stub, "/euro")
+    feed = fetch(device)
+    assert feed['failures'] == 0
+    assert cachedText(sim) == "€" * (device.FEED_MAXSIZE // 3) + "\n"
+
+def test_etag_is_only_kept_with_the_text_it_belongs_to(sim, device, stub):
+    stub.routes["/news"] = (200, {"ETag": '"v1"'}, b"first", 0)
+    writeFeed(sim, stub, "/news")
+    feed = fetch(device)
+    assert cachedText(sim) == "first\n"
+
+    # A cut off v2 leaves the v1 ETag, so the next request still gets the whole of v2
+    stub.routes["/news"] = (200, {"ETag": '"v2"', "Content-Length": "1000"}, b"sec", 0)
+    feed['nextFetch'] = device.getTime()
+    fetch(device)
+    assert feed['etag'] == '"v1"'
+    stub.routes["/news"] = (200, {"ETag": '"v2"'}, b"second", 0)
+    feed['nextFetch'] = device.getTime()
+    fetch(device)
+    assert stub.requests[-1][1]["If-None-Match"] == '"v1"'
+    assert cachedText(sim) == "second\n"
+
+    # The same for a fetch cancelled by a software update check
+    stub.routes["/news"] = (200, {"ETag": '"v3"'}, b"t" * 1000, 0)
+    feed['nextFetch'] = device.getTime()
+    device.updateFeeds()
+    device.updateFeeds()
+    assert feed['state'] == "reading"
+    sim.request("GET", "/softwareUpdate")
+    assert feed['etag'] == '"v2"'
+    fetch(device)
+    assert stub.requests[-1][1]["If-None-Match"] == '"v2"'
+    assert cachedText(sim) == "t" * 1000 + "\n"
+    assert sim.readFile("feeds/news.cache").decode("utf-8").startswith('etag="v3"\n')
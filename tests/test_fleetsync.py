@@ -0,0 +1,91 @@
+# SPDX-FileCopyrightText: 2022 boBylliB
+# SPDX-License-Identifier: MIT
+
+import json
+import sys
+import zlib
+
+import fleetsync
+import simulator
+
+NEWS = b"height=10\nscrolldelay=0\nscrollspeed=30\nwordwrap=off\ncolor=0x00FF00\nfresh news\n"
+NOTES = b"a few notes\n"
+LOGO = simulator.makeImage([[0, 1] * 4 for _ in range(8)], [0xFF0000, 0x0000FF])
+
+def writeDirectory(directory):
+    directory.mkdir()
+    (directory / "news.msg").write_bytes(NEWS)
+    (directory / "my notes.txt").write_bytes(NOTES)
+    (directory / "logo.bmp").write_bytes(LOGO)
+    (directory / "logo.txt").write_bytes(b"displaytime=8")
+    (directory / "README.md").write_bytes(b"not for the panel")
+    (directory / "order.txt").write_text("my notes.txt\nnews.msg\nmissing.msg\n")
+    return directory
+
+def test_read_desired_state(tmp_path):
+    files, metadata, queue = fleetsync.readDesiredState(str(writeDirectory(tmp_path / "show")))
+    assert sorted(files) == ["logo.bmp", "logo.txt", "my notes.txt", "news.msg"]
+    assert metadata == {"logo.txt"}
+    assert queue == ["my notes.txt", "news.msg", "logo.bmp"]
+
+def test_plan_sync(tmp_path):
+    files, metadata, queue = fleetsync.readDesiredState(str(writeDirectory(tmp_path / "show")))
+    listing = {"queue": ["old.msg", "news.msg", "my notes.txt"], "files": [
+        {"name": "old.msg", "checksum": 1},
+        {"name": "news.msg", "checksum": zlib.adler32(b"stale")},
+        {"name": "my notes.txt", "checksum": zlib.adler32(NOTES)},
+    ]}
+    uploads, deletes, reorder = fleetsync.planSync(listing, files, metadata, queue)
+    # Metadata is sent after the file it describes
+    assert uploads == ["logo.bmp", "news.msg", "logo.txt"]
+    assert deletes == ["old.msg"]
+    assert reorder
+
+    listing = {"queue": queue, "files": [{"name": name, "checksum": zlib.adler32(data)} for name, data in files.items()]}
+    assert fleetsync.planSync(listing, files, metadata, queue) == ([], [], False)
+
+def test_sync_several_panels(tmp_path, monkeypatch):
+    directory = writeDirectory(tmp_path / "show")
+    sims = []
+    servers = []
+    try:
+        for idx, existing in enumerate([{}, {"old.msg": b"old\n", "news.msg": b"stale\n"}, {"old notes.txt": b"old\n"}]):
+            sim = simulator.Simulator(tmp_path / ("panel" + str(idx)))
+            sim.boot()
+            for name, data in existing.items():
+                assert simulator.uploadFile(sim, name, data)
+            sim.step()
+            sim.fullLoop = True
+            sims.append(sim)
+            servers.append(simulator.PanelServer(sim))
+
+        monkeypatch.setattr(fleetsync, "RETRY_DELAY", 0)
+        monkeypatch.setattr(sys, "argv", ["fleetsync.py", str(directory)] + [server.address for server in servers])
+        assert fleetsync.main() == 0
+
+        for sim in sims:
+            with simulator.PanelServer.lock:
+                sim.activate()
+                listing = json.loads(sim.request("GET", "/files")[2])
+            # Includes deleting "old notes.txt", which /edit only finds once the name is decoded
+            assert listing["queue"] == ["my notes.txt", "news.msg", "logo.bmp"]
+            assert sim.readFile("uploads/news.msg") == NEWS
+            assert sim.readFile("uploads/logo.bmp") == LOGO
+            assert sim.readFile("metadata/logo.txt") == b"displaytime=8"
+
+        # Panels with files to delete get the deletes before any upload
+        for server in servers[1:]:
+            paths = [path for method, path in server.requests]
+            assert paths.index("/edit") < paths.index("/upload/start")
+
+        # A second run finds nothing to do
+        for server in servers:
+            server.requests.clear()
+        assert fleetsync.main() == 0
+        for server in servers:
+            assert [path for method, path in server.requests] == ["/files"]
+    finally:
+        for server in servers:
+            server.close()
+        for sim in reversed(sims):
+            sim.close()
@@ -0,0 +1,133 @@
+# SPDX-FileCopyrightText: 2022 boBylliB
+# SPDX-License-Identifier: MIT
+
+import packfont
+
+# A 7 pixel high font (ascent 6, descent 1) with a descender, an empty glyph and one Latin-1 glyph
+BDF = """STARTFONT 2.1
+FONT -test-tiny-medium-r-normal--7-70-75-75-p-40-iso10646-1
+SIZE 7 75 75
+FONTBOUNDINGBOX 4 7 0 -1
+STARTPROPERTIES 2
+FONT_ASCENT 6
+FONT_DESCENT 1
+ENDPROPERTIES
+CHARS 6
+STARTCHAR space
+ENCODING 32
+DWIDTH 3 0
+BBX 0 0 0 0
+BITMAP
+ENDCHAR
+STARTCHAR question
+ENCODING 63
+DWIDTH 4 0
+BBX 3 6 0 0
+BITMAP
+E0
+20
+40
+40
+00
+40
+ENDCHAR
+STARTCHAR A
+ENCODING 65
+DWIDTH 5 0
+BBX 4 6 0 0
+BITMAP
+60
+90
+90
+F0
+90
+90
+ENDCHAR
+STARTCHAR g
+ENCODING 103
+DWIDTH 4 0
+BBX 3 5 0 -1
+BITMAP
+E0
+A0
+E0
+20
+E0
+ENDCHAR
+STARTCHAR i
+ENCODING 105
+DWIDTH 2 0
+BBX 1 6 0 0
+BITMAP
+80
+00
+80
+80
+80
+80
+ENDCHAR
+STARTCHAR eacute
+ENCODING 233
+DWIDTH 4 0
+BBX 3 6 0 0
+BITMAP
+20
+40
+E0
+E0
+80
+E0
+ENDCHAR
+ENDFONT
+"""
+
+def installFont(sim, tmp_path):
+    source = tmp_path / "tiny.bdf"
+    source.write_text(BDF, encoding="latin-1")
+    glyphs, ascent, descent = packfont.readBDF(str(source))
+    packed, glyphCount = packfont.packFont(glyphs, ascent, descent, packfont.CHARSETS["latin1"])
+    sim.writeFile("bitmapfonts/7.pft", packed)
+    return glyphs, ascent, ascent + descent
+
+def glyphCell(bitmap, width):
+    # The panel's glyph bitmaps use index 0 for ink, the packer's cells use 1
+    return [[1 if bitmap[x, y] == 0 else 0 for x in range(width)] for y in range(bitmap.height)]
+
+def test_bdf_round_trip(sim, tmp_path):
+    glyphs, ascent, height = installFont(sim, tmp_path)
+    device = sim.boot()
+    font = device.getPackedFont(7)
+    assert font['height'] == height
+    assert font['glyphCount'] == len(glyphs)
+
+    for codepoint, glyph in glyphs.items():
+        bitmap, width = device.getGlyph(font, chr(codepoint))
+        assert width == glyph['advance']
+        assert glyphCell(bitmap, width) == packfont.renderGlyph(glyph, ascent, height)
+
+    # The descender sits on the bottom row and missing characters fall back to '?'
+    assert glyphCell(*device.getGlyph(font, 'g'))[6] == [1, 1, 1, 0]
+    assert device.getGlyph(font, 'Z') is device.getGlyph(font, '?')
+
+def test_glyph_cache_is_bounded(sim, tmp_path):
+    installFont(sim, tmp_path)
+    device = sim.boot()
+    device.GLYPH_CACHE_SIZE = 2
+    font = device.getPackedFont(7)
+    first = device.getGlyph(font, 'A')
+    device.getGlyph(font, 'i')
+    assert device.getGlyph(font, 'A') is first
+    device.getGlyph(font, 'g')
+    assert list(font['cache']) == [device.findGlyphIndex(font, ord(char)) for char in "Ag"]
+
+def test_packed_text_is_proportional(sim, tmp_path):
+    installFont(sim, tmp_path)
+    device = sim.boot()
+    zone = device.zones[0]
+    device.displayText(zone, ["Aié"], 7, 5, 30, False, 0xFFFFFF)
+    assert zone['item']['lineLengths'] == [5 + 2 + 4]
+
+    frame = device.display.pixels()
+    top = zone['item']['lines'][0].y
+    # Row 1 of "A", then the single column of "i", then "é"
+    assert frame[top + 1][:11] == [0xFFFFFF if bit else 0 for bit in [1, 0, 0, 1, 0, 0, 0, 0, 1, 0, 0]]
@@ -0,0 +1,116 @@
+# SPDX-FileCopyrightText: 2022 boBylliB
+# SPDX-License-Identifier: MIT
+
+import json
+
+import pytest
+
+import simulator
+
+@pytest.fixture
+def mqttSim(tmp_path):
+    simulation = simulator.Simulator(tmp_path / "panel", secrets={"mqtt_broker": "broker.local", "mqtt_name": "lobby"})
+    yield simulation
+    simulation.close()
+
+def test_long_names_get_a_short_client_id(tmp_path):
+    name = "reception-desk-left-of-the-main-door"
+    sim = simulator.Simulator(tmp_path, secrets={"mqtt_broker": "broker.local", "mqtt_name": name})
+    try:
+        device = sim.boot()
+        clientId = device.mqttClient.client_id
+        assert len(clientId.encode("utf-8")) <= device.MQTT_CLIENT_ID_MAX
+        assert clientId.endswith("-bc9a78563412")
+        assert device.mqttState['base'] == "matrixportal/" + name
+        assert device.mqttClientId("lobby") == "lobby"
+    finally:
+        sim.close()
+
+def test_bad_mqtt_settings_do_not_stop_the_panel(tmp_path):
+    sim = simulator.Simulator(tmp_path, secrets={"mqtt_broker": "broker.local", "mqtt_port": "not a port"})
+    try:
+        device = sim.boot()
+        assert device.mqttClient is None
+        sim.step()
+    finally:
+        sim.close()
+
+def test_enqueue_command_reaches_the_queue(mqttSim):
+    device = mqttSim.boot()
+    mqttSim.step()
+    assert device.mqttState['connected']
+    message = {"filename": "news.msg", "text": "height=10\nscrolldelay=0\nscrollspeed=30\nwordwrap=off\ncolor=0x00FF00\nhello\n"}
+    mqttSim.broker.publish("matrixportal/all/cmd/enqueue", json.dumps(message))
+    mqttSim.step(2)
+    assert device.filenames == ["news.msg"]
+    assert mqttSim.broker.retained["matrixportal/lobby/state/queue"] == json.dumps(["news.msg"])
+
+def test_connect_attempts_back_off_while_the_broker_is_down(mqttSim):
+    mqttSim.broker.up = False
+    device = mqttSim.boot()
+    stalls = []
+    starts = []
+    for _ in range(4):
+        device.mqttState['nextConnect'] = device.getTime()
+        before = mqttSim.broker.connects
+        startTime = mqttSim.clock.monotonic()
+        device.updateMqtt()
+        stalls.append(mqttSim.clock.monotonic() - startTime)
+        starts.append(device.mqttState['nextConnect'] - device.getTime())
+        assert mqttSim.broker.connects == before + 1
+    # Each attempt only costs one connect timeout, and the next one is further away every time
+    assert stalls == [mqttSim.broker.connectTime] * 4
+    assert [round(delay) for delay in starts] == [30, 60, 120, 240]
+
+    # Nothing is tried before the backoff runs out
+    device.updateMqtt()
+    assert mqttSim.broker.connects == 4
+
+    mqttSim.broker.up = True
+    mqttSim.clock.advance(240)
+    device.updateMqtt()
+    assert device.mqttState['connected']
+    assert device.mqttState['failures'] == 0
+
+def countLoops(device):
+    loops = []
+    loop = device.mqttClient.loop
+
+    def countedLoop(timeout=0):
+        loops.append(timeout)
+        return loop(timeout=timeout)
+
+    device.mqttClient.loop = countedLoop
+    return loops
+
+def test_idle_connection_does_not_stall_the_loop(mqttSim):
+    device = mqttSim.boot()
+    mqttSim.step()
+    assert device.mqttState['connected']
+    loops = countLoops(device)
+    startTime = mqttSim.clock.monotonic()
+    for _ in range(100):
+        mqttSim.clock.advance(0.01)
+        device.updateMqtt()
+    assert mqttSim.clock.monotonic() - startTime < 1.0 + device.MQTT_SOCKET_TIMEOUT
+    assert len(loops) <= 1
+
+    # A waiting message is read on the next step, and the keepalive still gets its loop
+    mqttSim.broker.publish("matrixportal/lobby/cmd/clear", "")
+    device.updateMqtt()
+    assert device.mqttState['commands'] == 1
+    mqttSim.clock.advance(device.MQTT_PING_INTERVAL)
+    before = len(loops)
+    device.updateMqtt()
+    assert len(loops) == before + 1
+
+def test_sockets_that_cannot_be_asked_are_polled(mqttSim):
+    device = mqttSim.boot()
+    mqttSim.step()
+    loops = countLoops(device)
+    device.mqttClient._sock = object()
+    for _ in range(100):
+        mqttSim.clock.advance(0.01)
+        device.updateMqtt()
+    # The loop() stall counts towards the interval too
+    assert 2 <= len(loops) <= 1.0 / device.MQTT_POLL_INTERVAL + 1
@@ -0,0 +1,98 @@
+# SPDX-FileCopyrightText: 2022 boBylliB
+# SPDX-License-Identifier: MIT
+
+import simulator
+
+def test_keep_alive_reuses_one_socket(sim, device):
+    status, headers, body = sim.request("GET", "/queueUpdate")
+    assert status == 200
+    assert headers["connection"] == "keep-alive"
+    socknum = sim.client.connection.socknum
+    status, headers, body = sim.request("GET", "/scripts/main.js")
+    assert status == 200
+    assert sim.client.connection.socknum == socknum
+    assert len(device.wsgiServer._clients) == 1
+
+def test_tracked_and_new_sockets_served_in_one_poll(sim, device):
+    first = simulator.HostClient(sim)
+    second = simulator.HostClient(sim)
+    sim.request("GET", "/queueUpdate", client=first)
+
+    # The tracked socket has the lower number, so it is what socket_available() reports first
+    first.send("GET", "/queueUpdate")
+    second.send("GET", "/queueUpdate")
+    device.wsgiServer.update_poll()
+    assert first.poll()[0] == 200
+    assert second.poll()[0] == 200
+    assert len(device.wsgiServer._clients) == 2
+
+def test_clients_past_the_limit_are_answered_and_closed(sim, device):
+    clients = [simulator.HostClient(sim) for _ in range(device.MAX_CLIENTS + 2)]
+    for client in clients:
+        client.send("GET", "/queueUpdate")
+    device.wsgiServer.update_poll()
+
+    replies = [client.poll() for client in clients]
+    assert all(reply[0] == 200 for reply in replies)
+    assert [reply[1]["connection"] for reply in replies].count("keep-alive") == device.MAX_CLIENTS
+    assert len(device.wsgiServer._clients) == device.MAX_CLIENTS
+    assert all(client.connection is None for client in clients[device.MAX_CLIENTS:])
+
+def test_poll_stops_at_the_budget(tmp_path):
+    # Every request costs 30 ms of SPI time, so a 50 ms budget leaves the third client for the next poll
+    sim = simulator.Simulator(tmp_path, spiTransactionTime=0.001)
+    try:
+        device = sim.boot()
+        clients = [simulator.HostClient(sim) for _ in range(3)]
+        for client in clients:
+            client.send("GET", "/queueUpdate")
+        sim.network.spiTransactionTime = 0
+        sim.network.spiBytesPerSecond = 200 / 0.03
+        device.wsgiServer.update_poll()
+        assert [client.poll() is not None for client in clients] == [True, True, False]
+        device.wsgiServer.update_poll()
+        assert clients[2].poll()[0] == 200
+    finally:
+        sim.close()
+
+def test_connection_close_is_honoured(sim, device):
+    status, headers, body = sim.request("GET", "/queueUpdate", headers={"Connection": "close"})
+    assert headers["connection"] == "close"
+    assert sim.client.connection is None
+    assert len(device.wsgiServer._clients) == 0
+
+def test_idle_and_disconnected_clients_are_dropped(sim, device):
+    sim.request("GET", "/queueUpdate")
+    other = simulator.HostClient(sim)
+    sim.request("GET", "/queueUpdate", client=other)
+    assert len(device.wsgiServer._clients) == 2
+
+    other.close()
+    device.wsgiServer.update_poll()
+    assert len(device.wsgiServer._clients) == 1
+
+    sim.clock.advance(device.KEEPALIVE_TIMEOUT + 1)
+    device.wsgiServer.update_poll()
+    assert len(device.wsgiServer._clients) == 0
+    assert len(sim.network.sockets) == 1
+
+def test_main_loop_step_serves_requests(sim, device):
+    sim.client.send("GET", "/queueUpdate")
+    sim.step()
+    assert sim.client.poll()[0] == 200
+
+def test_text_body_sent_in_one_write(sim, device):
+    writes = []
+    socketWrite = sim.esp.socket_write
+    sim.esp.socket_write = lambda socknum, data, conn_mode=0: (writes.append(len(data)), socketWrite(socknum, data))
+    status, headers, body = sim.request("GET", "/scripts/main.js")
+    assert status == 200
+    assert len(writes) == 2
+    assert writes[1] == len(body) == int(headers["content-length"])
+
+def test_stats_only_count_registered_routes(sim, device):
+    sim.request("GET", "/queueUpdate")
+    for idx in range(5):
+        assert sim.request("GET", "/made-up/" + str(idx))[0] == 404
+    assert list(device.stats['routes']) == ["/queueUpdate"]
+    assert "/stats" in device.web_app.paths
@@ -0,0 +1,111 @@
+# SPDX-FileCopyrightText: 2022 boBylliB
+# SPDX-License-Identifier: MIT
+
+import os
+import random
+import zlib
+
+import simulator
+
+MESSAGE = b"height=10\nscrolldelay=0\nscrollspeed=30\nwordwrap=off\ncolor=0x00FF00\nhello\n"
+
+def test_valid_upload_names(device):
+    for name in ["news.msg", "logo.bmp", "notes.txt", "weather.feed"]:
+        assert device.validUploadName(name)
+    for name in ["", "README", "news.", ".msg", "news.exe", "a.b.msg", "../news.msg", "dir/news.msg", "news.msg.part"]:
+        assert not device.validUploadName(name)
+
+def test_adler32_matches_zlib(device):
+    data = bytes(range(256)) * 100
+    assert device.adler32(data) == zlib.adler32(data)
+    assert device.adler32(data[5000:], device.adler32(data[:5000])) == zlib.adler32(data)
+
+def test_upload_without_extension_is_refused(sim, device):
+    status, headers, body = sim.post("/upload/start", {"filename": "README", "size": 4})
+    assert status == 400
+    assert "README" not in device.activeUploads
+
+def test_chunks_are_checked_against_the_offset(device):
+    device.startChunkedUpload("news.msg", 10)
+    assert device.writeChunk("news.msg", 0, b"hello")
+    assert not device.writeChunk("news.msg", 0, b"hello")
+    assert device.activeUploads["news.msg"]['offset'] == 5
+    try:
+        device.writeChunk("news.msg", 5, b"too long!!!")
+        assert False, "Chunk past the end was accepted"
+    except ValueError:
+        pass
+    assert device.startChunkedUpload("news.msg", 10) == 5
+
+def test_resume_after_reset_rebuilds_the_checksum(sim, device):
+    device.startChunkedUpload("news.msg", len(MESSAGE))
+    device.writeChunk("news.msg", 0, MESSAGE[:20])
+    # A reset forgets the upload but leaves the partial file on flash
+    device.activeUploads.clear()
+    assert simulator.uploadFile(sim, "news.msg", MESSAGE)
+    assert sim.readFile("uploads/news.msg") == MESSAGE
+
+def test_chunked_upload_is_queued(sim, device):
+    assert simulator.uploadFile(sim, "news.msg", MESSAGE)
+    sim.step()
+    assert device.filenames == ["news.msg"]
+    assert sim.readFile("uploads/news.msg") == MESSAGE
+
+def test_binary_upload_is_written_unchanged(sim, device):
+    image = sim.readFile("bitmapfonts/30.bmp")
+    assert simulator.uploadFile(sim, "font.bmp", image)
+    assert sim.readFile("uploads/font.bmp") == image
+
+def test_checksum_mismatch_discards_the_upload(sim, device):
+    sim.post("/upload/start", {"filename": "news.msg", "size": len(MESSAGE)})
+    sim.request("PUT", "/upload/chunk?filename=news.msg&offset=0", MESSAGE)
+    status, headers, body = sim.post("/upload/finish", {"filename": "news.msg", "checksum": 1})
+    assert status == 422
+    assert "news.msg" not in device.activeUploads
+    assert not os.path.exists(sim.path("uploads/news.msg.part"))
+
+def test_lossy_link(sim, device):
+    rng = random.Random(1)
+    data = bytes(rng.randrange(256) for _ in range(20000))
+    for attempt in range(5):
+        assert simulator.uploadFile(sim, "noise.bmp", data, rng=rng, lossRate=0.2, maxRetries=50)
+        sim.step()
+        assert sim.readFile("uploads/noise.bmp") == data
+        assert device.filenames == ["noise.bmp"]
+        assert device.activeUploads == {}
+
+def test_legacy_upload_handles_several_files(sim, device):
+    for name, text in (("one.msg", MESSAGE), ("two.txt", b"plain text\n")):
+        boundary = "----simulated"
+        body = ("--" + boundary + "\r\nContent-Disposition: form-data; name=\"filename\"; filename=\"" + name + "\"\r\n"
+                "Content-Type: text/plain\r\n\r\n").encode("utf-8") + text + ("\r\n--" + boundary + "--\r\n").encode("utf-8")
+        sim.request("POST", "/upload", body, {"Content-Type": "multipart/form-data; boundary=" + boundary})
+    assert len(device.uploadQueue) == 2
+    sim.step()
+    assert device.uploadQueue == []
+    assert device.filenames == ["one.msg", "two.txt"]
+
+def test_chunk_past_the_end_gets_a_400(sim, device):
+    sim.post("/upload/start", {"filename": "news.msg", "size": 4})
+    status, headers, body = sim.request("PUT", "/upload/chunk?filename=news.msg&offset=0", MESSAGE)
+    assert status == 400
+    assert device.activeUploads["news.msg"]['offset'] == 0
+
+def test_abandoned_partials_are_removed(sim, device):
+    device.startChunkedUpload("news.msg", len(MESSAGE))
+    device.writeChunk("news.msg", 0, MESSAGE[:20])
+    sim.writeFile("uploads/old.bmp.part", b"left over from before a reset")
+
+    sim.clock.advance(device.UPLOAD_TIMEOUT / 2)
+    device.writeChunk("news.msg", 20, MESSAGE[20:30])
+    sim.step()
+    # The reset's partial is only counted from when it was first seen, so both survive this sweep
+    assert os.path.exists(sim.path("uploads/old.bmp.part"))
+    assert os.path.exists(sim.path("uploads/news.msg.part"))
+
+    sim.clock.advance(device.UPLOAD_TIMEOUT)
+    sim.step()
+    assert not os.path.exists(sim.path("uploads/old.bmp.part"))
+    assert not os.path.exists(sim.path("uploads/news.msg.part"))
+    assert device.activeUploads == {}
+    assert device.orphanedPartials == {}
@@ -0,0 +1,133 @@
+# SPDX-FileCopyrightText: 2022 boBylliB
+# SPDX-License-Identifier: MIT
+
+import os
+
+import simulator
+
+RED = 0xFF0000
+BLUE = 0x0000FF
+
+def solidImage(width, height, frames=1):
+    # Frame n is filled with palette index n % 2, so consecutive frames alternate red and blue
+    rows = []
+    for frame in range(frames):
+        rows += [[frame % 2] * width for _ in range(height)]
+    return simulator.makeImage(rows, [RED, BLUE])
+
+def test_malformed_layout_lines_are_skipped(sim, capsys):
+    sim.quiet = False
+    sim.writeFile("layout.txt", "name=ticker,x=0,y=0,height=10,playlist\n"
+                                "this is not a zone\n"
+                                "name=top,x=0,y=0,width=64,height=10,playlist=zones/top.txt\n"
+                                "name=main,x=0,y=10,width=64,height=22\n")
+    device = sim.boot()
+    assert [zone['name'] for zone in device.zones] == ["top", "main"]
+    assert capsys.readouterr().out.count("Skipping zone") == 2
+
+def test_second_queue_zone_is_reported(sim, capsys):
+    sim.quiet = False
+    sim.writeFile("layout.txt", "name=left,x=0,y=0,width=32,height=32\n"
+                                "name=right,x=32,y=0,width=32,height=32\n")
+    device = sim.boot()
+    assert [zone['name'] for zone in device.zones] == ["left"]
+    assert "Skipping zone right" in capsys.readouterr().out
+
+def test_playlist_images_read_their_metadata(sim):
+    sim.writeFile("logo.bmp", solidImage(8, 8))
+    sim.writeFile("zones/icon.bmp", solidImage(8, 8))
+    sim.writeFile("metadata/logo.txt", "displaytime=7")
+    sim.writeFile("metadata/icon.txt", "displaytime=9")
+    sim.writeFile("zones/top.txt", "logo.bmp\nzones/icon.bmp\n")
+    sim.writeFile("layout.txt", "name=top,x=0,y=0,width=64,height=10,playlist=zones/top.txt\n")
+    device = sim.boot()
+    zone = device.zones[0]
+
+    device.updateDisplayItem(zone)
+    assert zone['item']['type'] == "image"
+    assert zone['item']['displayTime'] == 7
+    sim.clock.advance(8)
+    device.updateDisplayItem(zone)
+    device.updateDisplayItem(zone)
+    assert zone['item']['displayTime'] == 9
+
+def test_animation_frames_are_zone_sized(sim):
+    sim.writeFile("zones/ANIM10.bmp", solidImage(64, 10, frames=3))
+    sim.writeFile("zones/top.txt", "zones/ANIM10.bmp\n")
+    sim.writeFile("layout.txt", "name=top,x=0,y=0,width=64,height=10,playlist=zones/top.txt\n"
+                                "name=main,x=0,y=10,width=64,height=22\n")
+    device = sim.boot()
+    zone = device.zones[0]
+
+    device.updateDisplayItem(zone)
+    assert zone['item']['numFrames'] == 3
+    below = device.display.pixels()[10:]
+    shown = []
+    for _ in range(3):
+        frame = device.display.pixels()
+        shown.append((frame[0][0], frame[9][63]))
+        # Only the zone's own 10 rows change, the queue zone below is left alone
+        assert frame[10:] == below
+        sim.clock.advance(0.11)
+        device.updateDisplayItem(zone)
+    assert shown == [(RED, RED), (BLUE, BLUE), (RED, RED)]
+    assert zone['item']['type'] == "blank"
+
+def test_zones_never_draw_outside_their_rect(sim):
+    # A logo larger than its zone next to a ticker that scrolls in from the right, above the queue zone
+    sim.writeFile("zones/logo.bmp", solidImage(48, 20))
+    sim.writeFile("metadata/logo.txt", "displaytime=1000")
+    sim.writeFile("zones/ticker.msg", "height=10\nscrolldelay=0\nscrollspeed=30\nwordwrap=off\ncolor=0x00FF00\nBreaking news from the lobby\n")
+    sim.writeFile("zones/left.txt", "zones/logo.bmp\n")
+    sim.writeFile("zones/right.txt", "zones/ticker.msg\n")
+    sim.writeFile("layout.txt", "name=left,x=0,y=0,width=32,height=16,playlist=zones/left.txt\n"
+                                "name=right,x=32,y=0,width=32,height=16,playlist=zones/right.txt\n"
+                                "name=main,x=0,y=16,width=64,height=16\n")
+    device = sim.boot()
+    tickerShown = False
+    for _ in range(200):
+        sim.clock.advance(0.2)
+        sim.step()
+        frame = device.display.pixels()
+        assert all(row[:32] == [RED] * 32 for row in frame[:16])
+        assert all(RED not in row[32:] for row in frame[:16])
+        assert all(RED not in row and 0x00FF00 not in row for row in frame[16:])
+        tickerShown = tickerShown or any(0x00FF00 in row for row in frame[:16])
+    assert tickerShown
+
+def test_bad_playlist_entries_are_skipped(sim, capsys):
+    sim.quiet = False
+    sim.writeFile("zones/good.msg", "height=10\nscrolldelay=5\nscrollspeed=30\nwordwrap=off\ncolor=0x00FF00\nok\n")
+    sim.writeFile("zones/gone.msg", "height=10\nscrolldelay=5\nscrollspeed=30\nwordwrap=off\ncolor=0x00FF00\ngone\n")
+    sim.writeFile("zones/broken.msg", "height=10\n")
+    sim.writeFile("zones/top.txt", "zones/typo.msg\nzones/good.msg\nzones/notes\nzones/gone.msg\nzones/broken.msg\n")
+    sim.writeFile("layout.txt", "name=top,x=0,y=0,width=64,height=10,playlist=zones/top.txt\n"
+                                "name=main,x=0,y=10,width=64,height=22\n")
+    device = sim.boot()
+    zone = device.zones[0]
+    assert zone['playlist'] == ["zones/good.msg", "zones/gone.msg", "zones/broken.msg"]
+    assert "Skipping zones/typo.msg" in capsys.readouterr().out
+
+    # Files that go missing or can't be read later are skipped and the zone moves on
+    os.remove(sim.path("zones/gone.msg"))
+    shown = []
+    for _ in range(6):
+        sim.step()
+        if zone['item']['type'] == "text":
+            shown.append(zone['playlist'][-1])
+            zone['item']['type'] = "blank"
+            zone['group'].pop()
+    assert shown == ["zones/good.msg", "zones/good.msg"]
+    assert "Skipping zones/broken.msg in zone top" in capsys.readouterr().out
+
+def test_zone_narrower_than_the_font_is_skipped(sim):
+    sim.writeFile("zones/wrap.msg", "height=10\nscrolldelay=5\nscrollspeed=30\nwordwrap=on\ncolor=0x00FF00\nhello\n")
+    sim.writeFile("zones/side.txt", "zones/wrap.msg\n")
+    sim.writeFile("layout.txt", "name=side,x=0,y=0,width=2,height=32,playlist=zones/side.txt\n"
+                                "name=main,x=2,y=0,width=62,height=32\n"
+                                "name=empty,x=0,y=0,width=0,height=10,playlist=zones/side.txt\n")
+    device = sim.boot()
+    assert [zone['name'] for zone in device.zones] == ["side", "main"]
+    sim.step(3)
+    assert device.zones[0]['item']['type'] == "blank"
+    assert len(device.zones[0]['group']) == 0
@@ -0,0 +1,180 @@
+# SPDX-FileCopyrightText: 2022 boBylliB
+# SPDX-License-Identifier: MIT
+
+# Host-side tool that makes a group of Matrix Portal panels match a directory on this computer.
+#
+# Usage: python3 tools/fleetsync.py <directory> <panel address> [<panel address> ...]
+#
+# The directory holds the .txt/.msg/.feed/.bmp files to show, plus an optional order.txt with one
+# filename per line giving the queue order (otherwise files are queued alphabetically). A .txt file
+# sharing its name with another file is uploaded as that file's metadata, the same as on the panel.
+#
+# For every panel the queue and file checksums are read from /files, files that are no longer wanted
+# are deleted, only missing or changed files are sent (through the resumable /upload/start,
+# /upload/chunk and /upload/finish routes), and the queue is put in order with a single reorder edit.
+# Panels are synced in parallel, each over one keep-alive connection.
+
+import argparse
+import http.client
+import json
+import os
+import sys
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, urlencode
+
+DISPLAY_EXTENSIONS = [".txt", ".msg", ".feed", ".bmp"]
+ORDER_FILE = "order.txt"
+CHUNK_SIZE = 4096
+TIMEOUT = 10
+RETRIES = 5
+RETRY_DELAY = 1
+
+def readDesiredState(directory):
+    files = {}
+    for name in sorted(os.listdir(directory)):
+        if name == ORDER_FILE or os.path.splitext(name)[1] not in DISPLAY_EXTENSIONS:
+            continue
+        with open(os.path.join(directory, name), 'rb') as file:
+            files[name] = file.read()
+
+    stems = {}
+    for name in files:
+        stems.setdefault(os.path.splitext(name)[0], []).append(name)
+    metadata = set()
+    for names in stems.values():
+        if len(names) > 1:
+            metadata.update(name for name in names if name.endswith(".txt"))
+
+    queue = [name for name in files if name not in metadata]
+    orderPath = os.path.join(directory, ORDER_FILE)
+    if os.path.exists(orderPath):
+        with open(orderPath, 'r') as file:
+            order = [line.strip() for line in file if line.strip() in queue]
+        queue = order + [name for name in queue if name not in order]
+    return files, metadata, queue
+
+class Panel:
+    def __init__(self, address):
+        host, _, port = address.partition(':')
+        self.address = address
+        self.host = host
+        self.port = int(port) if port else 80
+        self.connection = None
+
+    def request(self, method, path, body=None, headers=None):
+        # Reuses one keep-alive connection, reconnecting and retrying when the panel drops it
+        for attempt in range(RETRIES):
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.host, self.port, timeout=TIMEOUT)
+            try:
+                self.connection.request(method, path, body=body, headers=headers or {})
+                response = self.connection.getresponse()
+                data = response.read()
+                if response.getheader("Connection", "").lower() == "close":
+                    self.close()
+                return response.status, data
+            except (OSError, http.client.HTTPException) as e:
+                print(self.address + ":", method, path, "failed:", e, file=sys.stderr)
+                self.close()
+                time.sleep(RETRY_DELAY)
+        raise ConnectionError("Giving up on " + self.address + " after " + str(RETRIES) + " attempts")
+
+    def post(self, path, fields):
+        headers = {"Content-Type": "application/x-www-form-urlencoded"}
+        return self.request("POST", path, urlencode(fields), headers)
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+        self.connection = None
+
+    def listing(self):
+        status, data = self.request("GET", "/files")
+        if status != 200:
+            raise ConnectionError(self.address + " returned " + str(status) + " for /files")
+        return json.loads(data)
+
+    def upload(self, name, data):
+        checksum = zlib.adler32(data)
+        for attempt in range(RETRIES):
+            status, reply = self.post("/upload/start", {"filename": name, "size": len(data)})
+            if status != 200:
+                raise ConnectionError(self.address + " refused upload of " + name + ": " + reply.decode())
+            offset = int(reply)
+            while offset < len(data):
+                path = "/upload/chunk?filename=" + quote(name) + "&offset=" + str(offset)
+                headers = {"Content-Type": "application/octet-stream"}
+                status, reply = self.request("PUT", path, data[offset:(offset + CHUNK_SIZE)], headers)
+                if status not in (200, 409):
+                    raise ConnectionError(self.address + " rejected a chunk of " + name + ": " + reply.decode())
+                offset = int(reply)
+            status, reply = self.post("/upload/finish", {"filename": name, "checksum": checksum})
+            if status == 200:
+                return
+            print(self.address + ": upload of", name, "failed with", status, ", retrying", file=sys.stderr)
+        raise ConnectionError("Could not upload " + name + " to " + self.address)
+
+    def edit(self, fields):
+        status, reply = self.post("/edit", fields)
+        if status not in (200, 303):
+            raise ConnectionError(self.address + " rejected edit " + str(fields) + ": " + str(status))
+
+def planSync(listing, files, metadata, queue):
+    current = {}
+    for entry in listing["files"]:
+        current[entry["name"]] = entry["checksum"]
+    uploads = [name for name in files if current.get(name) != zlib.adler32(files[name])]
+    # Metadata goes after the file it belongs to so the panel files it correctly
+    uploads.sort(key=lambda name: name in metadata)
+    deletes = [name for name in listing["queue"] if name not in files]
+    expected = [name for name in listing["queue"] if name not in deletes and name not in uploads]
+    expected += [name for name in uploads if name not in metadata]
+    reorder = expected != queue
+    return uploads, deletes, reorder
+
+def syncPanel(address, files, metadata, queue, dryRun):
+    panel = Panel(address)
+    try:
+        uploads, deletes, reorder = planSync(panel.listing(), files, metadata, queue)
+        print(address + ":", len(uploads), "to upload,", len(deletes), "to delete,", "reorder" if reorder else "order unchanged")
+        if dryRun:
+            return address, True
+        # Deleting first frees flash on the panel before anything new is written
+        for name in deletes:
+            print(address + ": deleting", name)
+            panel.edit({"action": "Delete", "filename": name})
+        for name in uploads:
+            print(address + ": uploading", name)
+            panel.upload(name, files[name])
+        if reorder:
+            panel.edit({"action": "Reorder", "order": ",".join(queue)})
+        return address, True
+    except (ConnectionError, ValueError) as e:
+        print(address + ": sync failed:", e, file=sys.stderr)
+        return address, False
+    finally:
+        panel.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync a directory of display files to one or more Matrix Portal panels.")
+    parser.add_argument("directory", help="directory holding the desired files (and optionally order.txt)")
+    parser.add_argument("panels", nargs="+", help="panel addresses, as host or host:port")
+    parser.add_argument("--workers", type=int, default=8, help="panels to sync at the same time (default: 8)")
+    parser.add_argument("--dry-run", action="store_true", help="only print what would change")
+    args = parser.parse_args()
+
+    files, metadata, queue = readDesiredState(args.directory)
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        results = list(pool.map(lambda address: syncPanel(address, files, metadata, queue, args.dry_run), args.panels))
+
+    failed = [address for address, success in results if not success]
+    if failed:
+        print("Failed to sync:", ", ".join(failed), file=sys.stderr)
+        return 1
+    print("Synced", len(results), "panel(s)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
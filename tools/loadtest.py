@@ -0,0 +1,220 @@
+# SPDX-FileCopyrightText: 2022 boBylliB
+# SPDX-License-Identifier: MIT
+
+# Host-side load test for a panel's web control plane.
+#
+# Usage: python3 tools/loadtest.py <panel address> [--clients 1,4,8] [--duration 30]
+#                                   [--mix /=2,/queueUpdate=10,/scripts/main.js=2,/edit=1,/upload=1]
+#                                   [--output results.json]
+#
+# Every client keeps one keep-alive connection and sends requests back to back, picking routes at
+# random by the weights in --mix. Latency and throughput are measured here; frame gaps, peak heap
+# and time spent servicing each route are read back from the panel's /stats after each run.
+# Results are written as JSON so runs against different versions can be compared.
+#
+# /edit sends a Move Up for a file that is not queued, which the panel ignores. /upload sends a small
+# message through the chunked upload routes as loadtest<client>.msg; these are deleted afterwards.
+
+import argparse
+import http.client
+import json
+import os
+import random
+import sys
+import threading
+import time
+import zlib
+from urllib.parse import urlencode
+
+DEFAULT_MIX = "/=2,/queueUpdate=10,/scripts/main.js=2,/edit=1,/upload=1"
+TIMEOUT = 10
+UPLOAD_TEXT = b"height=10\nscrolldelay=0\nscrollspeed=30\nwordwrap=off\ncolor=0x00FF00\nload test\n"
+VERSION_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "version.txt")
+
+def parseMix(text):
+    routes = []
+    weights = []
+    for entry in text.split(','):
+        route, _, weight = entry.partition('=')
+        routes.append(route.strip())
+        weights.append(float(weight) if weight else 1.0)
+    return routes, weights
+
+def percentile(values, fraction):
+    if len(values) < 1:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+class Client:
+    def __init__(self, host, port, clientIdx):
+        self.host = host
+        self.port = port
+        self.uploadName = "loadtest" + str(clientIdx) + ".msg"
+        self.connection = None
+
+    def request(self, method, path, body=None, headers=None):
+        if self.connection is None:
+            self.connection = http.client.HTTPConnection(self.host, self.port, timeout=TIMEOUT)
+        try:
+            self.connection.request(method, path, body=body, headers=headers or {})
+            response = self.connection.getresponse()
+            data = response.read()
+            if response.getheader("Connection", "").lower() == "close":
+                self.close()
+            return response.status, data
+        except (OSError, http.client.HTTPException):
+            self.close()
+            raise
+
+    def post(self, path, fields):
+        return self.request("POST", path, urlencode(fields), {"Content-Type": "application/x-www-form-urlencoded"})
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+        self.connection = None
+
+    def run(self, route):
+        if route == "/edit":
+            return self.post("/edit", {"action": "Move+Up", "filename": "loadtest-missing.msg"})[0]
+        elif route == "/upload":
+            status, reply = self.post("/upload/start", {"filename": self.uploadName, "size": len(UPLOAD_TEXT)})
+            if status != 200:
+                return status
+            offset = int(reply)
+            if offset < len(UPLOAD_TEXT):
+                path = "/upload/chunk?filename=" + self.uploadName + "&offset=" + str(offset)
+                status, reply = self.request("PUT", path, UPLOAD_TEXT[offset:], {"Content-Type": "application/octet-stream"})
+                if status != 200:
+                    return status
+            return self.post("/upload/finish", {"filename": self.uploadName, "checksum": zlib.adler32(UPLOAD_TEXT)})[0]
+        return self.request("GET", route)[0]
+
+def clientLoop(client, routes, weights, deadline, results, lock):
+    latencies = {}
+    errors = {}
+    while time.monotonic() < deadline:
+        route = random.choices(routes, weights)[0]
+        start = time.monotonic()
+        try:
+            status = client.run(route)
+            if status >= 400:
+                errors[route] = errors.get(route, 0) + 1
+                continue
+        except (OSError, http.client.HTTPException, ValueError):
+            errors[route] = errors.get(route, 0) + 1
+            continue
+        latencies.setdefault(route, []).append((time.monotonic() - start) * 1000)
+    with lock:
+        for route, values in latencies.items():
+            results["latencies"].setdefault(route, []).extend(values)
+        for route, count in errors.items():
+            results["errors"][route] = results["errors"].get(route, 0) + count
+
+def fetchStats(host, port, reset):
+    client = Client(host, port, 0)
+    try:
+        status, data = client.request("GET", "/stats?reset=1" if reset else "/stats")
+    finally:
+        client.close()
+    if status != 200:
+        raise ConnectionError("Panel returned " + str(status) + " for /stats")
+    return json.loads(data)
+
+def runLoad(host, port, clientCount, duration, routes, weights):
+    fetchStats(host, port, True)
+    results = {"latencies": {}, "errors": {}}
+    lock = threading.Lock()
+    clients = [Client(host, port, idx) for idx in range(clientCount)]
+    deadline = time.monotonic() + duration
+    startTime = time.monotonic()
+    threads = [threading.Thread(target=clientLoop, args=(client, routes, weights, deadline, results, lock)) for client in clients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - startTime
+    for client in clients:
+        client.close()
+    device = fetchStats(host, port, False)
+
+    run = {}
+    run["clients"] = clientCount
+    run["duration"] = elapsed
+    run["requests"] = sum(len(values) for values in results["latencies"].values())
+    run["errors"] = sum(results["errors"].values())
+    run["throughput"] = run["requests"] / elapsed
+    run["routes"] = {}
+    for route in routes:
+        values = results["latencies"].get(route, [])
+        run["routes"][route] = {
+            "count": len(values),
+            "errors": results["errors"].get(route, 0),
+            "p50Ms": percentile(values, 0.50),
+            "p99Ms": percentile(values, 0.99),
+            "maxMs": max(values) if values else None,
+        }
+    run["device"] = device
+    return run
+
+def cleanup(host, port, clientCounts):
+    client = Client(host, port, 0)
+    try:
+        for idx in range(max(clientCounts)):
+            client.post("/edit", {"action": "Delete", "filename": "loadtest" + str(idx) + ".msg"})
+    except (OSError, http.client.HTTPException) as e:
+        print("Failed to remove load test uploads:", e, file=sys.stderr)
+    finally:
+        client.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test a Matrix Portal panel's web control plane.")
+    parser.add_argument("panel", help="panel address, as host or host:port")
+    parser.add_argument("--clients", default="1,4,8", help="comma separated concurrent client counts to run (default: 1,4,8)")
+    parser.add_argument("--duration", type=float, default=30, help="seconds per run (default: 30)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="route=weight list (default: " + DEFAULT_MIX + ")")
+    parser.add_argument("--output", default="loadtest.json", help="JSON file to write (default: loadtest.json)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for the request mix (default: 0)")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    host, _, port = args.panel.partition(':')
+    port = int(port) if port else 80
+    routes, weights = parseMix(args.mix)
+    clientCounts = [int(count) for count in args.clients.split(',')]
+
+    report = {}
+    report["panel"] = args.panel
+    report["timestamp"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    try:
+        with open(VERSION_FILE, 'r') as file:
+            report["version"] = file.read().strip()
+    except OSError:
+        report["version"] = ""
+    report["mix"] = dict(zip(routes, weights))
+    report["runs"] = []
+    try:
+        for clientCount in clientCounts:
+            print("Running", clientCount, "client(s) for", args.duration, "seconds...")
+            run = runLoad(host, port, clientCount, args.duration, routes, weights)
+            report["runs"].append(run)
+            print("  %.1f req/s, %d errors, max frame gap %d ms, peak heap %d bytes" % (
+                run["throughput"], run["errors"], run["device"]["maxFrameGap"], run["device"]["peakHeap"]))
+            for route, result in run["routes"].items():
+                if result["count"] > 0:
+                    print("  %-20s p50 %7.1f ms  p99 %7.1f ms  (%d)" % (route, result["p50Ms"], result["p99Ms"], result["count"]))
+    except (OSError, http.client.HTTPException, ValueError) as e:
+        print("Load test failed:", e, file=sys.stderr)
+        return 1
+    finally:
+        if "/upload" in routes:
+            cleanup(host, port, clientCounts)
+
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print("Wrote", args.output)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,268 @@
+# SPDX-FileCopyrightText: 2022 boBylliB
+# SPDX-License-Identifier: MIT
+
+# Host-side converter from BDF/PCF bitmap fonts to the packed font format read by code.py.
+#
+# Usage: python3 tools/packfont.py <font.bdf|font.pcf> bitmapfonts/<height>.pft [--charset ascii|latin1|all]
+#
+# Packed font layout (little endian):
+#   header: magic "MPF1", height (u8), ascent (u8), default glyph index (u16), glyph count (u16)
+#   glyph table, sorted by codepoint: codepoint (u16), width (u8), padding (u8), data offset (u32)
+#   glyph data: for each glyph, height rows of ceil(width / 8) bytes, most significant bit first
+#
+# Glyphs are laid out without kerning: each glyph occupies exactly its advance width.
+
+import argparse
+import struct
+import sys
+
+PACKED_FONT_MAGIC = b"MPF1"
+PACKED_HEADER = "<4sBBHH"
+PACKED_GLYPH = "<HBxI"
+
+CHARSETS = {
+    "ascii": list(range(0x20, 0x7F)),
+    "latin1": list(range(0x20, 0x7F)) + list(range(0xA0, 0x100)),
+    "all": None,
+}
+
+PCF_MAGIC = b"\x01fcp"
+PCF_ACCELERATORS = 1 << 1
+PCF_METRICS = 1 << 2
+PCF_BITMAPS = 1 << 3
+PCF_BDF_ENCODINGS = 1 << 5
+PCF_BDF_ACCELERATORS = 1 << 8
+PCF_GLYPH_PAD_MASK = 3
+PCF_BYTE_MASK = 1 << 2
+PCF_BIT_MASK = 1 << 3
+PCF_SCAN_UNIT_MASK = 3 << 4
+PCF_COMPRESSED_METRICS = 0x100
+
+# Every glyph is kept as a dict with the advance width, bounding box (width, height, xoff, yoff)
+# and its rows as lists of 0/1 pixels, so both readers feed the same packer.
+
+def makeGlyph(advance, width, height, xoff, yoff, rows):
+    glyph = {}
+    glyph['advance'] = advance
+    glyph['width'] = width
+    glyph['height'] = height
+    glyph['xoff'] = xoff
+    glyph['yoff'] = yoff
+    glyph['rows'] = rows
+    return glyph
+
+def readBDF(filename):
+    glyphs = {}
+    ascent = None
+    descent = None
+    boundingBox = None
+    with open(filename, 'r', encoding="latin-1") as file:
+        lines = iter(file.read().splitlines())
+
+    for line in lines:
+        parts = line.split()
+        if len(parts) < 1:
+            continue
+        if parts[0] == "FONTBOUNDINGBOX":
+            boundingBox = [int(value) for value in parts[1:5]]
+        elif parts[0] == "FONT_ASCENT":
+            ascent = int(parts[1])
+        elif parts[0] == "FONT_DESCENT":
+            descent = int(parts[1])
+        elif parts[0] == "STARTCHAR":
+            codepoint = -1
+            advance = 0
+            bbx = [0, 0, 0, 0]
+            rows = []
+            for line in lines:
+                parts = line.split()
+                if len(parts) < 1:
+                    continue
+                if parts[0] == "ENCODING":
+                    codepoint = int(parts[-1])
+                elif parts[0] == "DWIDTH":
+                    advance = int(parts[1])
+                elif parts[0] == "BBX":
+                    bbx = [int(value) for value in parts[1:5]]
+                elif parts[0] == "BITMAP":
+                    for line in lines:
+                        if line.strip() == "ENDCHAR":
+                            break
+                        value = int(line.strip(), 16)
+                        bits = len(line.strip()) * 4
+                        rows.append([(value >> (bits - 1 - x)) & 1 for x in range(bbx[0])])
+                    break
+            if codepoint >= 0:
+                glyphs[codepoint] = makeGlyph(advance, bbx[0], bbx[1], bbx[2], bbx[3], rows)
+
+    if ascent is None or descent is None:
+        if boundingBox is None:
+            raise ValueError(filename + " has no FONT_ASCENT/FONT_DESCENT or FONTBOUNDINGBOX")
+        ascent = boundingBox[1] + boundingBox[3]
+        descent = -boundingBox[3]
+    return glyphs, ascent, descent
+
+def pcfFormat(data, offset):
+    tableFormat = struct.unpack_from("<I", data, offset)[0]
+    if tableFormat & PCF_BYTE_MASK:
+        return tableFormat, ">"
+    return tableFormat, "<"
+
+def readPCF(filename):
+    with open(filename, 'rb') as file:
+        data = file.read()
+    if data[:4] != PCF_MAGIC:
+        raise ValueError(filename + " is not a PCF font")
+
+    tables = {}
+    tableCount = struct.unpack_from("<I", data, 4)[0]
+    for idx in range(tableCount):
+        tableType, tableFormat, size, offset = struct.unpack_from("<IIII", data, 8 + idx * 16)
+        tables[tableType] = offset
+
+    # Font ascent and descent
+    accelerators = tables.get(PCF_BDF_ACCELERATORS, tables.get(PCF_ACCELERATORS))
+    if accelerators is None:
+        raise ValueError(filename + " has no accelerator table")
+    tableFormat, order = pcfFormat(data, accelerators)
+    ascent, descent = struct.unpack_from(order + "ii", data, accelerators + 4 + 8)
+
+    # Glyph metrics
+    offset = tables[PCF_METRICS]
+    tableFormat, order = pcfFormat(data, offset)
+    metrics = []
+    if tableFormat & PCF_COMPRESSED_METRICS:
+        count = struct.unpack_from(order + "H", data, offset + 4)[0]
+        for idx in range(count):
+            values = struct.unpack_from("5B", data, offset + 6 + idx * 5)
+            metrics.append([value - 0x80 for value in values])
+    else:
+        count = struct.unpack_from(order + "I", data, offset + 4)[0]
+        for idx in range(count):
+            metrics.append(list(struct.unpack_from(order + "5h", data, offset + 8 + idx * 12)))
+
+    # Glyph bitmaps
+    offset = tables[PCF_BITMAPS]
+    tableFormat, order = pcfFormat(data, offset)
+    count = struct.unpack_from(order + "I", data, offset + 4)[0]
+    bitmapOffsets = struct.unpack_from(order + str(count) + "I", data, offset + 8)
+    padIdx = tableFormat & PCF_GLYPH_PAD_MASK
+    bitmapSize = struct.unpack_from(order + "4I", data, offset + 8 + count * 4)[padIdx]
+    bitmapStart = offset + 8 + count * 4 + 16
+    bitmapData = bytearray(data[bitmapStart:(bitmapStart + bitmapSize)])
+    glyphPad = 1 << padIdx
+    scanUnit = 1 << ((tableFormat & PCF_SCAN_UNIT_MASK) >> 4)
+    msbBitFirst = bool(tableFormat & PCF_BIT_MASK)
+    msbByteFirst = bool(tableFormat & PCF_BYTE_MASK)
+    if not msbBitFirst:
+        for idx in range(len(bitmapData)):
+            bitmapData[idx] = int('{:08b}'.format(bitmapData[idx])[::-1], 2)
+    if msbBitFirst != msbByteFirst and scanUnit > 1:
+        for idx in range(0, len(bitmapData) - scanUnit + 1, scanUnit):
+            bitmapData[idx:(idx + scanUnit)] = bitmapData[idx:(idx + scanUnit)][::-1]
+
+    # Codepoint to glyph index
+    offset = tables[PCF_BDF_ENCODINGS]
+    tableFormat, order = pcfFormat(data, offset)
+    minByte2, maxByte2, minByte1, maxByte1, defaultChar = struct.unpack_from(order + "5h", data, offset + 4)
+    columns = maxByte2 - minByte2 + 1
+    encodingCount = columns * (maxByte1 - minByte1 + 1)
+    indices = struct.unpack_from(order + str(encodingCount) + "H", data, offset + 14)
+
+    glyphs = {}
+    for encodingIdx in range(encodingCount):
+        glyphIdx = indices[encodingIdx]
+        if glyphIdx == 0xFFFF or glyphIdx >= len(metrics):
+            continue
+        codepoint = ((minByte1 + encodingIdx // columns) << 8) | (minByte2 + encodingIdx % columns)
+        leftBearing, rightBearing, advance, glyphAscent, glyphDescent = metrics[glyphIdx]
+        width = rightBearing - leftBearing
+        height = glyphAscent + glyphDescent
+        rowBytes = ((width + 7) // 8 + glyphPad - 1) // glyphPad * glyphPad
+        start = bitmapOffsets[glyphIdx]
+        rows = []
+        for y in range(height):
+            row = bitmapData[(start + y * rowBytes):(start + (y + 1) * rowBytes)]
+            rows.append([(row[x // 8] >> (7 - x % 8)) & 1 for x in range(width)])
+        glyphs[codepoint] = makeGlyph(advance, width, height, leftBearing, -glyphDescent, rows)
+    return glyphs, ascent, descent
+
+def renderGlyph(glyph, ascent, height):
+    # Place the bounding box inside a cell that is exactly the advance width wide
+    width = glyph['advance']
+    cell = [[0] * width for _ in range(height)]
+    top = ascent - (glyph['yoff'] + glyph['height'])
+    for y in range(len(glyph['rows'])):
+        cellY = top + y
+        if cellY < 0 or cellY >= height:
+            continue
+        row = glyph['rows'][y]
+        for x in range(len(row)):
+            cellX = glyph['xoff'] + x
+            if row[x] and 0 <= cellX < width:
+                cell[cellY][cellX] = 1
+    return cell
+
+def packRows(cell, width):
+    rowBytes = (width + 7) // 8
+    packed = bytearray()
+    for row in cell:
+        rowData = bytearray(rowBytes)
+        for x in range(width):
+            if row[x]:
+                rowData[x // 8] |= 0x80 >> (x % 8)
+        packed += rowData
+    return bytes(packed)
+
+def packFont(glyphs, ascent, descent, charset):
+    height = ascent + descent
+    if height < 1 or height > 255:
+        raise ValueError("Font height " + str(height) + " does not fit the packed format")
+
+    if charset is None:
+        codepoints = sorted(codepoint for codepoint in glyphs if codepoint <= 0xFFFF)
+    else:
+        codepoints = [codepoint for codepoint in charset if codepoint in glyphs]
+    if len(codepoints) < 1:
+        raise ValueError("None of the requested characters are in the font")
+
+    table = bytearray()
+    glyphData = bytearray()
+    for codepoint in codepoints:
+        glyph = glyphs[codepoint]
+        width = min(max(glyph['advance'], 0), 255)
+        glyph['advance'] = width
+        table += struct.pack(PACKED_GLYPH, codepoint, width, len(glyphData))
+        glyphData += packRows(renderGlyph(glyph, ascent, height), width)
+
+    defaultIndex = 0
+    for fallback in (ord('?'), ord(' ')):
+        if fallback in codepoints:
+            defaultIndex = codepoints.index(fallback)
+            break
+
+    header = struct.pack(PACKED_HEADER, PACKED_FONT_MAGIC, height, min(max(ascent, 0), 255), defaultIndex, len(codepoints))
+    return header + bytes(table) + bytes(glyphData), len(codepoints)
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a BDF or PCF font to the Matrix Portal packed font format.")
+    parser.add_argument("source", help="BDF or PCF font to convert")
+    parser.add_argument("output", help="packed font to write, e.g. bitmapfonts/12.pft")
+    parser.add_argument("--charset", choices=sorted(CHARSETS), default="latin1", help="characters to include (default: latin1)")
+    args = parser.parse_args()
+
+    with open(args.source, 'rb') as file:
+        isPCF = file.read(4) == PCF_MAGIC
+    if isPCF:
+        glyphs, ascent, descent = readPCF(args.source)
+    else:
+        glyphs, ascent, descent = readBDF(args.source)
+
+    packed, glyphCount = packFont(glyphs, ascent, descent, CHARSETS[args.charset])
+    with open(args.output, 'wb') as file:
+        file.write(packed)
+    print("Wrote", glyphCount, "glyphs,", ascent + descent, "pixels high,", len(packed), "bytes to", args.output)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -16,36 +16,114 @@ function editQueue(action) {
   formData["filename"] = $('input[name=filename]:checked', '#queue').val();
   $.post(url, formData);
 }
+const CHUNK_SIZE = 4096;
+const MAX_RETRIES = 10;
+const RETRY_DELAY = 1000;
+
+function adler32(bytes, checksum) {
+  var a = checksum & 0xFFFF;
+  var b = (checksum >>> 16) & 0xFFFF;
+  for (var start = 0; start < bytes.length; start += 5552) {
+    var end = Math.min(start + 5552, bytes.length);
+    for (var idx = start; idx < end; idx++) {
+      a += bytes[idx];
+      b += a;
+    }
+    a %= 65521;
+    b %= 65521;
+  }
+  return ((b << 16) | a) >>> 0;
+}
+function setUploadProgress(confirmed, total) {
+  $('#uploadProgress').attr({
+    value: confirmed,
+    max: total,
+  });
+}
 function uploadFile(form) {
+  var file = $('#fileUpload input[type=file]')[0].files[0];
+  if (!file) {
+    return false;
+  }
+  var reader = new FileReader();
+  reader.onload = function () {
+    var bytes = new Uint8Array(reader.result);
+    var checksum = 1;
+    for (var start = 0; start < bytes.length; start += CHUNK_SIZE) {
+      checksum = adler32(bytes.subarray(start, start + CHUNK_SIZE), checksum);
+    }
+    startUpload(file, bytes, checksum, 0);
+  };
+  reader.readAsArrayBuffer(file);
+  return false;
+}
+function retryUpload(file, bytes, checksum, retries) {
+  if (retries >= MAX_RETRIES) {
+    console.log("Giving up on upload of " + file.name);
+    return;
+  }
+  setTimeout(() => {
+    startUpload(file, bytes, checksum, retries + 1);
+  }, RETRY_DELAY);
+}
+function startUpload(file, bytes, checksum, retries) {
+  // Asking the server where to start lets an interrupted upload resume from the last acknowledged byte
   $.ajax({
-    // Your server script to process the upload
-    url: '/upload',
+    url: '/upload/start',
     type: 'POST',
-
-    // Form data
-    data: new FormData($('#fileUpload')[0]),
-
-    // Tell jQuery not to process data or worry about content-type
-    // You *must* include these options!
+    data: { filename: file.name, size: bytes.length },
+    success: function (offset) {
+      sendChunk(file, bytes, checksum, parseInt(offset), retries);
+    },
+    error: function () {
+      retryUpload(file, bytes, checksum, retries);
+    }
+  });
+}
+function sendChunk(file, bytes, checksum, offset, retries) {
+  setUploadProgress(offset, bytes.length);
+  if (offset >= bytes.length) {
+    finishUpload(file, bytes, checksum, retries);
+    return;
+  }
+  $.ajax({
+    url: '/upload/chunk?filename=' + encodeURIComponent(file.name) + '&offset=' + offset,
+    type: 'PUT',
+    data: bytes.slice(offset, offset + CHUNK_SIZE),
     cache: false,
-    contentType: false,
+    contentType: 'application/octet-stream',
     processData: false,
-
-    // Custom XMLHttpRequest
-    xhr: function () {
-      var myXhr = $.ajaxSettings.xhr();
-      if (myXhr.upload) {
-        // For handling the progress of the upload
-        myXhr.upload.addEventListener('progress', function (e) {
-          if (e.lengthComputable) {
-            $('#uploadProgress').attr({
-              value: e.loaded,
-              max: e.total,
-            });
-          }
-        }, false);
+    success: function (confirmed) {
+      sendChunk(file, bytes, checksum, parseInt(confirmed), 0);
+    },
+    error: function (xhr) {
+      if (xhr.status == 409) {
+        sendChunk(file, bytes, checksum, parseInt(xhr.responseText), retries);
+      }
+      else if (xhr.status == 400) {
+        // Resending the same chunk can't help, the file no longer matches the size given at the start
+        console.log("Upload of " + file.name + " rejected: " + xhr.responseText);
+      }
+      else {
+        retryUpload(file, bytes, checksum, retries);
+      }
+    }
+  });
+}
+function finishUpload(file, bytes, checksum, retries) {
+  $.ajax({
+    url: '/upload/finish',
+    type: 'POST',
+    data: { filename: file.name, checksum: checksum },
+    success: function () {
+      setUploadProgress(bytes.length, bytes.length);
+      updateQueue();
+    },
+    error: function (xhr) {
+      if (xhr.status == 422) {
+        console.log("Checksum mismatch, restarting upload of " + file.name);
       }
-      return myXhr;
+      retryUpload(file, bytes, checksum, retries);
     }
   });
 }